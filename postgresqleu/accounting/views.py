@@ -10,6 +10,7 @@ from datetime import datetime, date
 
 from postgresqleu.util.request import get_int_or_error
 from postgresqleu.util.auth import authenticate_backend_group
+from postgresqleu.util.db import exec_to_dict_iterator
 from postgresqleu.util.time import today_global
 
 from .models import JournalEntry, JournalItem, JournalUrl, Year, Object
@@ -445,24 +446,26 @@ def report(request, year, reporttype):
             sql += " AND a.num=%(account)s"
             params['account'] = get_int_or_error(request.GET, 'acc')
         sql += " WINDOW w1 AS (PARTITION BY a.num) ORDER BY a.num, e.date, e.seq"
-        curs = connection.cursor()
-        curs.execute(sql, params)
 
         # Django templates are also too stupid to be able to produce
         # a section-summary value, so we need to build them up as
         # a two stage array.
         items = []
         lastaccount = 0
-        for row in curs.fetchall():
-            if row[0] != lastaccount:
-                items.append({'accountnum': row[0],
-                              'accountname': row[1],
-                              'totaldebit': row[2],
-                              'totalcredit': row[3],
+        for row in exec_to_dict_iterator(sql, params):
+            accountnum = row.pop('accountnum')
+            accountname = row.pop('accountname')
+            totaldebit = row.pop('totaldebit')
+            totalcredit = row.pop('totalcredit')
+            if accountnum != lastaccount:
+                items.append({'accountnum': accountnum,
+                              'accountname': accountname,
+                              'totaldebit': totaldebit,
+                              'totalcredit': totalcredit,
                               'entries': []
                               })
-                lastaccount = row[0]
-            items[-1]['entries'].append(dict(list(zip([col[0] for col in curs.description[4:]], row[4:]))))
+                lastaccount = accountnum
+            items[-1]['entries'].append(row)
 
         return render(request, 'accounting/ledgerreport.html', {
             'year': year,
@@ -32,6 +32,7 @@ class Command(BaseCommand):
     help = 'Download and/or process reports from Adyen'
 
     class ScheduledJob:
+        exclusive_group = 'adyen'
         scheduled_interval = timedelta(minutes=30)
 
         @classmethod
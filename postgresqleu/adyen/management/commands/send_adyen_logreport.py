@@ -21,6 +21,7 @@ class Command(BaseCommand):
     help = 'Send log information about Adyen events'
 
     class ScheduledJob:
+        exclusive_group = 'adyen'
         scheduled_times = [time(22, 30), ]
         internal = True
 
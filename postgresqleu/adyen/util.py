@@ -5,7 +5,6 @@ from django.utils import timezone
 
 from decimal import Decimal
 
-import requests
 from requests.auth import HTTPBasicAuth
 
 from postgresqleu.mailqueue.util import send_simple_mail
@@ -13,6 +12,7 @@ from postgresqleu.invoices.util import InvoiceManager
 from postgresqleu.invoices.models import Invoice, InvoicePaymentMethod
 from postgresqleu.accounting.util import create_accounting_entry
 from postgresqleu.util.currency import format_currency
+from postgresqleu.util.http import get_http_session
 
 from .models import TransactionStatus, Report, AdyenLog, Notification, Refund
 
@@ -465,9 +465,9 @@ class AdyenAPI(object):
                 e))
 
     def _api_call(self, apiurl, apiparam, okresponse):
-        resp = requests.post("{0}{1}".format(self.pm.config('apibaseurl'), apiurl),
-                             auth=HTTPBasicAuth(self.pm.config('ws_user'), self.pm.config('ws_password')),
-                             json=apiparam,
+        resp = get_http_session('adyen').post("{0}{1}".format(self.pm.config('apibaseurl'), apiurl),
+                                              auth=HTTPBasicAuth(self.pm.config('ws_user'), self.pm.config('ws_password')),
+                                              json=apiparam,
         )
         if resp.status_code != 200:
             raise Exception("http response code {0}".format(resp.status_code))
@@ -11,10 +11,9 @@ import requests
 from postgresqleu.util.auth import authenticate_backend_group
 from postgresqleu.util.decorators import global_login_exempt
 from postgresqleu.invoices.models import Invoice, InvoicePaymentMethod
-from postgresqleu.invoices.util import InvoiceManager
+from postgresqleu.invoices.util import InvoiceManager, queue_payment_notification
 
 from .models import RawNotification, AdyenLog, ReturnAuthorizationStatus
-from .util import process_raw_adyen_notification
 
 
 @global_login_exempt
@@ -49,10 +48,24 @@ def adyen_notify_handler(request, methodid):
     raw = RawNotification(contents=request.body.decode(), paymentmethod=method)
     raw.save()
 
-    if process_raw_adyen_notification(raw, request.POST):
-        return HttpResponse('[accepted]', content_type='text/plain')
-    else:
-        return HttpResponse('[internal error]', content_type='text/plain')
+    # Queue it up for processing and acknowledge it right away. Adyen
+    # identifies a notification by pspReference, eventCode and merchant
+    # account, and may send the same one again with a different value
+    # for success, so include that in the key as well.
+    queue_payment_notification(
+        method,
+        '{}:{}:{}:{}'.format(
+            request.POST.get('pspReference', ''),
+            request.POST.get('eventCode', ''),
+            request.POST.get('merchantAccountCode', ''),
+            request.POST.get('success', ''),
+        ),
+        {
+            'raw': raw.id,
+            'post': request.POST.dict(),
+        },
+    )
+    return HttpResponse('[accepted]', content_type='text/plain')
 
 
 # Handle an Adyen payment (both credit card primary step and iban secondary step)
@@ -19,6 +19,7 @@ class Command(BaseCommand):
     help = 'Send log information about Braintree events'
 
     class ScheduledJob:
+        exclusive_group = 'braintree'
         scheduled_times = [time(23, 32), ]
         internal = True
 
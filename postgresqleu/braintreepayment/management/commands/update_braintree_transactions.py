@@ -33,6 +33,7 @@ class Command(BaseCommand):
     help = 'Update Braintree transactions'
 
     class ScheduledJob:
+        exclusive_group = 'braintree'
         scheduled_interval = timedelta(hours=6)
 
         @classmethod
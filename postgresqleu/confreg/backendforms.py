@@ -432,6 +432,7 @@ class BackendRegistrationTypeForm(BackendForm):
     }
     defaultsort = [['sortkey', 'asc']]
     auto_cascade_delete_to = ['registrationtype_days', 'registrationtype_requires_option']
+    bulk_assignable_columns = ['regclass', ]
 
     class Meta:
         model = RegistrationType
@@ -823,6 +824,11 @@ class BackendConferenceSessionForm(BackendForm):
         'q_status_string': 'Status',
         'cross_schedule': 'Cross sched',
     }
+    list_server_side = True
+    list_column_expressions = {
+        'track': 'track__trackname',
+        'room': 'room__roomname',
+    }
     queryset_extra_fields = {
         'q_status_string': "(SELECT statustext FROM confreg_status_strings css WHERE css.id=status)",
         'q_speaker_list': "(SELECT string_agg(spk.fullname, ', ') FROM confreg_speaker spk INNER JOIN confreg_conferencesession_speaker cs ON cs.speaker_id=spk.id WHERE cs.conferencesession_id=confreg_conferencesession.id)",
@@ -839,6 +845,7 @@ class BackendConferenceSessionForm(BackendForm):
     copy_transform_form = BackendTransformConferenceDateTimeForm
     auto_cascade_delete_to = ['conferencesession_speaker', 'conferencesessionvote']
     allow_email = True
+    bulk_assignable_columns = ['track', 'room', 'cross_schedule', ]
 
     class Meta:
         model = ConferenceSession
@@ -1613,6 +1620,11 @@ class BackendTweetQueueForm(BackendForm):
     defaultsort = [['sent', 'asc'], ['datetime', 'desc']]
     exclude_fields_from_validation = ['image', ]
     queryset_select_related = ['author', 'approvedby', ]
+    list_server_side = True
+    list_column_expressions = {
+        'author': 'author__username',
+        'approvedby': 'approvedby__username',
+    }
     queryset_extra_fields = {
         'hasimage': "image is not null and image != ''",
     }
@@ -430,7 +430,7 @@ def view_multi_registration_badge(request, urlname):
 
     resp = HttpResponse(content_type='application/pdf')
     try:
-        render_jinja_badges(conference, settings.REGISTER_FONTS, [r.safe_export() for r in regs], resp, False, False)
+        render_jinja_badges(conference, settings.REGISTER_FONTS, [r.safe_export() for r in regs], resp, False, False, jobs=settings.BADGE_RENDER_JOBS)
     except Exception as e:
         return HttpResponse("Exception rendering badges: {}".format(e.__repr__()), content_type='text/plain')
     return resp
@@ -442,9 +442,9 @@ def pendinginvoices(request, urlname):
     return render(request, 'confreg/admin_pending_invoices.html', {
         'conference': conference,
         'invoices': OrderedDict((
-            ('Attendee invoices', Invoice.objects.filter(paidat__isnull=True, conferenceregistration__conference=conference)),
-            ('Multi-registration invoices', Invoice.objects.filter(paidat__isnull=True, bulkpayment__conference=conference)),
-            ('Sponsor invoices', Invoice.objects.filter(paidat__isnull=True, sponsor__conference=conference)),
+            ('Attendee invoices', Invoice.objects.defer('pdf_invoice', 'pdf_receipt').filter(paidat__isnull=True, conferenceregistration__conference=conference)),
+            ('Multi-registration invoices', Invoice.objects.defer('pdf_invoice', 'pdf_receipt').filter(paidat__isnull=True, bulkpayment__conference=conference)),
+            ('Sponsor invoices', Invoice.objects.defer('pdf_invoice', 'pdf_receipt').filter(paidat__isnull=True, sponsor__conference=conference)),
         )),
     })
 
@@ -492,7 +492,7 @@ def multiregs(request, urlname):
 
     return render(request, 'confreg/admin_multireg_list.html', {
         'conference': conference,
-        'bulkpays': BulkPayment.objects.select_related('user', 'invoice__paidusing').prefetch_related('conferenceregistration_set').filter(conference=conference).order_by('-paidat', '-createdat'),
+        'bulkpays': BulkPayment.objects.select_related('user', 'invoice__paidusing').defer('invoice__pdf_invoice', 'invoice__pdf_receipt').prefetch_related('conferenceregistration_set').filter(conference=conference).order_by('-paidat', '-createdat'),
         'highlight': get_int_or_error(request.GET, 'b', -1),
         'helplink': 'registrations',
     })
@@ -551,7 +551,7 @@ def addoptorders(request, urlname):
 
     return render(request, 'confreg/admin_addoptorder_list.html', {
         'conference': conference,
-        'orders': PendingAdditionalOrder.objects.select_related('reg', 'invoice__paidusing').filter(reg__conference=conference).order_by('-payconfirmedat', '-createtime'),
+        'orders': PendingAdditionalOrder.objects.select_related('reg', 'invoice__paidusing').defer('invoice__pdf_invoice', 'invoice__pdf_receipt').filter(reg__conference=conference).order_by('-payconfirmedat', '-createtime'),
         'helplink': 'registrations#options',
     })
 
@@ -651,7 +651,7 @@ def prepaidorders(request, urlname):
 
     return render(request, 'confreg/admin_prepaidorders_list.html', {
         'conference': conference,
-        'orders': PurchasedVoucher.objects.select_related('sponsor', 'user', 'invoice', 'batch').filter(conference=conference).annotate(num_used=Count('batch__prepaidvoucher__user')).order_by('-invoice__paidat', '-invoice__id'),
+        'orders': PurchasedVoucher.objects.select_related('sponsor', 'user', 'invoice', 'batch').defer('invoice__pdf_invoice', 'invoice__pdf_receipt').filter(conference=conference).annotate(num_used=Count('batch__prepaidvoucher__user')).order_by('-invoice__paidat', '-invoice__id'),
         'helplink': 'vouchers',
     })
 
@@ -11,9 +11,11 @@ from django.utils import timezone
 from django.conf import settings
 
 from collections import OrderedDict
+from datetime import timedelta
+import dateutil.parser
 import re
 
-from postgresqleu.util.db import exec_to_list
+from postgresqleu.util.db import exec_to_list, exec_to_dict
 from postgresqleu.util.db import ensure_conference_timezone
 from postgresqleu.util.qr import generate_base64_qr
 from postgresqleu.util.decorators import global_login_exempt
@@ -243,6 +245,149 @@ def _get_statistics(conference):
     ]
 
 
+# Registrations that can be checked in, with everything needed by _get_reg_json()
+# fetched up front. Going through the related manager on the conference means
+# the conference object is shared rather than loaded once per registration.
+def _get_checkin_regs(conference, includecanceled=False):
+    regs = conference.conferenceregistration_set.select_related(
+        'regtype', 'shirtsize', 'checkedinby',
+    ).prefetch_related(
+        'additionaloptions',
+    ).filter(payconfirmedat__isnull=False)
+    if not includecanceled:
+        regs = regs.filter(canceledat__isnull=True)
+    return regs
+
+
+# Overlap between delta fetches of the attendee list. The modification time is
+# set before the transaction commits, so without an overlap a change committed
+# just after a fetch could be missed by the next one.
+DELTA_OVERLAP = timedelta(minutes=1)
+
+# Maximum number of check-ins accepted in a single sync
+MAX_SYNC_CHECKINS = 1000
+
+
+def _get_attendee_list(request, conference):
+    since = request.GET.get('since', None)
+    cursor = timezone.now()
+    if since:
+        try:
+            since = dateutil.parser.isoparse(since)
+        except ValueError:
+            return HttpResponse("Invalid cursor", status=400)
+
+        # In delta mode, also return canceled registrations so the client
+        # knows to remove them from its local list.
+        regs = _get_checkin_regs(conference, True).filter(lastmodified__gte=since - DELTA_OVERLAP)
+    else:
+        regs = _get_checkin_regs(conference)
+
+    attendees = []
+    removed = []
+    for r in regs:
+        if r.canceledat:
+            removed.append(r.id)
+        else:
+            attendees.append(_get_reg_json(r))
+
+    return _json_response({
+        'regs': attendees,
+        'removed': removed,
+        'cursor': cursor,
+        'delta': bool(since),
+    })
+
+
+# Store a batch of check-ins made while the station was offline. If the
+# attendee has already been checked in, the earliest check-in wins, so all
+# stations end up agreeing on who checked the attendee in regardless of the
+# order in which they sync.
+def _sync_checkins(request, conference, user):
+    try:
+        checkins = json.loads(request.body.decode('utf8'))['checkins']
+        if not isinstance(checkins, list):
+            raise ValueError()
+    except (ValueError, KeyError, TypeError):
+        return HttpResponse("Invalid format", status=400)
+
+    if len(checkins) > MAX_SYNC_CHECKINS:
+        return HttpResponse("Too many check-ins, at most {} can be synced at once".format(MAX_SYNC_CHECKINS), status=400)
+
+    now = timezone.now()
+    tosync = []
+    for c in checkins:
+        if not isinstance(c, dict) or not isinstance(c.get('token', None), str):
+            return HttpResponse("Invalid format", status=400)
+
+        # Accept both full URL version of token and just the key part
+        m = _tokenmatcher.match(c['token'])
+        token = m.group(1) if m else c['token']
+
+        if c.get('checkedinat', None):
+            try:
+                checkedinat = dateutil.parser.isoparse(c['checkedinat'])
+            except (ValueError, TypeError):
+                return HttpResponse("Invalid check-in time", status=400)
+            if not checkedinat.tzinfo:
+                return HttpResponse("Check-in time must include timezone", status=400)
+            # Don't trust a station clock that is ahead
+            checkedinat = min(checkedinat, now)
+        else:
+            checkedinat = now
+
+        tosync.append({
+            'token': token,
+            'checkedinat': checkedinat.isoformat(),
+        })
+
+    # The final query sees the registrations as they were before the update,
+    # which tells us if each one was a new check-in, replaced a later one, or
+    # lost to an earlier one.
+    result = exec_to_dict("""WITH checkins AS (
+  SELECT DISTINCT ON (token) token, checkedinat
+  FROM jsonb_to_recordset(%(checkins)s::jsonb) AS c(token text, checkedinat timestamptz)
+  ORDER BY token, checkedinat
+), updated AS (
+  UPDATE confreg_conferenceregistration r SET checkedinat=checkins.checkedinat, checkedinby_id=%(userid)s, lastmodified=CURRENT_TIMESTAMP
+  FROM checkins
+  WHERE r.conference_id=%(confid)s AND r.idtoken=checkins.token AND r.payconfirmedat IS NOT NULL AND r.canceledat IS NULL
+    AND (r.checkedinat IS NULL OR r.checkedinat > checkins.checkedinat)
+  RETURNING r.id
+)
+SELECT checkins.token, r.id AS regid, r.checkedinat IS NOT NULL AS wascheckedin, updated.id IS NOT NULL AS updated
+FROM checkins
+LEFT JOIN confreg_conferenceregistration r ON r.conference_id=%(confid)s AND r.idtoken=checkins.token AND r.payconfirmedat IS NOT NULL AND r.canceledat IS NULL
+LEFT JOIN updated ON updated.id=r.id""", {
+        'checkins': json.dumps(tosync),
+        'userid': user.id,
+        'confid': conference.id,
+    })
+
+    bytoken = {r['token']: r for r in result}
+    regs = {r.id: r for r in _get_checkin_regs(conference).filter(id__in=[r['regid'] for r in result if r['regid']])}
+    response = []
+    for token in dict.fromkeys(c['token'] for c in tosync):
+        r = bytoken[token]
+        if r['regid'] is None:
+            response.append({'token': token, 'status': 'notfound'})
+            continue
+
+        if not r['updated']:
+            status = 'already'
+        elif r['wascheckedin']:
+            status = 'replaced'
+        else:
+            status = 'checkedin'
+        response.append({
+            'token': token,
+            'status': status,
+            'reg': _get_reg_json(regs[r['regid']]),
+        })
+
+    return _json_response({'checkins': response})
+
+
 def _get_reg_json(r, fieldscan=False):
     d = {
         'id': r.id,
@@ -303,16 +448,17 @@ def api(request, urlname, regtoken, what):
             token = m.group(1)
         else:
             raise Http404()
-        r = get_object_or_404(ConferenceRegistration, conference=conference, payconfirmedat__isnull=False, canceledat__isnull=True, idtoken=token)
+        r = get_object_or_404(_get_checkin_regs(conference), idtoken=token)
         return _json_response({'reg': _get_reg_json(r)})
     elif what == 'search':
         s = request.GET.get('search').strip()
         return _json_response({
-            'regs': [_get_reg_json(r) for r in ConferenceRegistration.objects.filter(
+            'regs': [_get_reg_json(r) for r in _get_checkin_regs(conference).filter(
                 Q(firstname__icontains=s) | Q(lastname__icontains=s),
-                conference=conference, payconfirmedat__isnull=False, canceledat__isnull=True,
             )],
         })
+    elif what == 'attendees':
+        return _get_attendee_list(request, conference)
     elif is_admin and what == 'stats':
         with ensure_conference_timezone(conference):
             return _json_response(_get_statistics(conference))
@@ -326,7 +472,7 @@ def api(request, urlname, regtoken, what):
             token = m.group(1)
         else:
             token = request.POST['token']
-        reg = get_object_or_404(ConferenceRegistration, conference=conference, payconfirmedat__isnull=False, canceledat__isnull=True, idtoken=token)
+        reg = get_object_or_404(_get_checkin_regs(conference), idtoken=token)
         if reg.checkedinat:
             return HttpResponse("Already checked in.", status=412)
         reg.checkedinat = timezone.now()
@@ -337,6 +483,8 @@ def api(request, urlname, regtoken, what):
             'message': 'Attendee {} checked in successfully.'.format(reg.fullname),
             'showfields': True,
         })
+    elif request.method == 'POST' and what == 'sync':
+        return _sync_checkins(request, conference, user)
     else:
         raise Http404()
 
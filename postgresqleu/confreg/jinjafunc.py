@@ -10,6 +10,8 @@ from django.conf import settings
 
 import os.path
 import random
+import threading
+from collections import OrderedDict
 from itertools import groupby
 from datetime import datetime, date, time
 import dateutil.parser
@@ -28,7 +30,7 @@ import jinja2.sandbox
 import markdown
 
 
-from .contextutil import load_all_context
+from .contextutil import load_all_context, find_git_revision
 
 # We use a separate root directory for jinja2 templates, so find that
 # directory by searching relative to ourselves.
@@ -65,10 +67,32 @@ class ConfTemplateLoader(jinja2.FileSystemLoader):
         # FileSystemLoader does, but we also need the ability to
         # override it in get_source() so we do it as well.
         self.pathlist = [os.fspath(p) for p in pathlist]
-        self.cutlevel = 0
+
+        # The loader is shared between threads when the environment is
+        # cached, so the current cutlevel has to be tracked per thread.
+        self._local = threading.local()
 
         super(ConfTemplateLoader, self).__init__(self.pathlist)
 
+    @property
+    def cutlevel(self):
+        return getattr(self._local, 'cutlevel', 0)
+
+    @cutlevel.setter
+    def cutlevel(self, level):
+        self._local.cutlevel = level
+
+    # Override the searchpath to drop one or more levels when cutlevel is set,
+    # to handle inheritance of "the same template"
+    @property
+    def searchpath(self):
+        return self.pathlist[self.cutlevel:]
+
+    @searchpath.setter
+    def searchpath(self, path):
+        # Set by the base class constructor, but we always use pathlist
+        pass
+
     def get_source(self, environment, template):
         # Only allow loading of the root template from confreg. Everything else we allow
         # only from the conference specific directory. This is so we don't end up
@@ -81,12 +105,6 @@ class ConfTemplateLoader(jinja2.FileSystemLoader):
                 # whitelisted as something we want to load.
                 if template not in self.WHITELISTED_TEMPLATES:
                     raise jinja2.TemplateNotFound(template, "Rejecting attempt to load from incorrect location")
-        if self.cutlevel:
-            # Override the searchpath to drop one or more levels, to
-            # handle inheritance of "the same template"
-            self.searchpath = self.pathlist[self.cutlevel:]
-        else:
-            self.searchpath = self.pathlist
         return super(ConfTemplateLoader, self).get_source(environment, template)
 
 
@@ -111,20 +129,28 @@ class ConfTemplateLoader(jinja2.FileSystemLoader):
 #
 class ConfSandbox(jinja2.sandbox.SandboxedEnvironment):
     def __init__(self, *args, **kwargs):
-        # We have to disable the cache for our extend-from-parent support, since the cache key
-        # for confreg/foo.html would become the same regardless of if the template is from the
-        # base, from the skin or from the conference. Given that we currently recreate the
-        # environment once for each request, the caching doesn't really make any difference
-        # anyway. Should we in the future want to use the caching, we have to take this into
-        # account though.
+        # We have to disable the jinja cache for our extend-from-parent support, since the cache
+        # key for confreg/foo.html would become the same regardless of if the template is from the
+        # base, from the skin or from the conference. Instead we keep our own cache of templates
+        # in get_template(), which also includes the cutlevel in the key.
         super().__init__(*args, cache_size=0, **kwargs)
+        self.template_cache = {}
 
     def get_template(self, name, parent=None, globals=None):
         if name == parent:
             self.loader.cutlevel += 1
         else:
             self.loader.cutlevel = 0
-        return super().get_template(name, parent, globals)
+
+        if globals or not isinstance(self.loader, ConfTemplateLoader):
+            return super().get_template(name, parent, globals)
+
+        key = (name, self.loader.cutlevel)
+        t = self.template_cache.get(key, None)
+        if t is None or not t.is_up_to_date:
+            t = super().get_template(name, parent, globals)
+            self.template_cache[key] = t
+        return t
 
     def is_safe_attribute(self, obj, attr, value):
         modname = obj.__class__.__module__
@@ -302,18 +328,71 @@ def _resolve_asset(assettype, assetname):
     return do_render_asset(assettype, assetname)
 
 
-def render_jinja_conference_template(conference, templatename, dictionary, disableconferencetemplates=False):
-    # It all starts from the base template for this conference. If it
-    # does not exist, just throw a 404 early.
-    if conference and conference.jinjaenabled and conference.jinjadir and not os.path.exists(os.path.join(conference.jinjadir, 'templates/base.html')):
-        raise Http404()
+# Environments are cached per conference and root template, since what the loader allows
+# to be loaded depends on both. Each cached environment in turn caches its compiled templates,
+# checking the modification time of the template files on each use.
+_environment_cache = OrderedDict()
+_environment_cache_lock = threading.Lock()
+ENVIRONMENT_CACHE_SIZE = 500
+
+
+def _get_environment_version(conference, disableconferencetemplates):
+    # A deployment of the conference templates changes the githash, and adding or removing
+    # templates changes the mtime of the directory, and in both cases we start over with a
+    # fresh environment.
+    if conference and conference.jinjaenabled and conference.jinjadir and not disableconferencetemplates:
+        try:
+            mtime = os.stat(os.path.join(conference.jinjadir, 'templates')).st_mtime
+        except OSError:
+            mtime = None
+        return (conference.jinjadir, find_git_revision(conference.jinjadir), mtime)
+    return None
+
+
+def _create_environment(conference, templatename, disableconferencetemplates):
+    bytecode_cache = None
+    if settings.JINJA_BYTECODE_CACHE_DIR:
+        os.makedirs(settings.JINJA_BYTECODE_CACHE_DIR, exist_ok=True)
+        bytecode_cache = jinja2.FileSystemBytecodeCache(settings.JINJA_BYTECODE_CACHE_DIR)
 
     env = ConfSandbox(
         loader=ConfTemplateLoader(conference, templatename, disableconferencetemplates=disableconferencetemplates),
         extensions=['jinja2.ext.with_'],
+        bytecode_cache=bytecode_cache,
     )
     env.filters.update(extra_filters)
     env.globals.update(extra_globals)
+    return env
+
+
+def get_conference_environment(conference, templatename, disableconferencetemplates=False):
+    key = (conference and conference.pk or None, templatename, disableconferencetemplates)
+    version = _get_environment_version(conference, disableconferencetemplates)
+
+    with _environment_cache_lock:
+        if key in _environment_cache:
+            cachedversion, env = _environment_cache[key]
+            if cachedversion == version:
+                _environment_cache.move_to_end(key)
+                return env
+
+    env = _create_environment(conference, templatename, disableconferencetemplates)
+
+    with _environment_cache_lock:
+        _environment_cache[key] = (version, env)
+        _environment_cache.move_to_end(key)
+        while len(_environment_cache) > ENVIRONMENT_CACHE_SIZE:
+            _environment_cache.popitem(last=False)
+    return env
+
+
+def render_jinja_conference_template(conference, templatename, dictionary, disableconferencetemplates=False):
+    # It all starts from the base template for this conference. If it
+    # does not exist, just throw a 404 early.
+    if conference and conference.jinjaenabled and conference.jinjadir and not os.path.exists(os.path.join(conference.jinjadir, 'templates/base.html')):
+        raise Http404()
+
+    env = get_conference_environment(conference, templatename, disableconferencetemplates)
 
     t = env.get_template(templatename)
 
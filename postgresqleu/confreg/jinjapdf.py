@@ -5,7 +5,9 @@ import os.path
 import argparse
 import sys
 import re
+import io
 import operator
+import multiprocessing
 
 from reportlab.lib.units import mm
 from reportlab.lib.pagesizes import A4, LETTER, landscape
@@ -16,8 +18,6 @@ from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.platypus import SimpleDocTemplate, Paragraph, PageBreak
 from reportlab.platypus.flowables import Flowable
 from reportlab.lib.styles import ParagraphStyle
-from reportlab.lib.utils import ImageReader
-from PIL import Image
 
 import jinja2
 import jinja2.sandbox
@@ -48,9 +48,13 @@ def getmm(struct, key):
 
 
 class JinjaFlowable(Flowable):
-    def __init__(self, js, imgpath):
+    def __init__(self, js, imgpath, imagecache=None):
         self.js = js
         self.imgpath = imgpath
+        # Resolved image paths, shared between all flowables in the same run.
+        # The images themselves are only loaded once per document by reportlab,
+        # as long as they are referenced by the same filename.
+        self.imagecache = imagecache if imagecache is not None else {}
         self.width = getmm(js, 'width')
         self.height = getmm(js, 'height')
         self.fontname = self.js.get('fontname', 'DejaVu Serif')
@@ -136,7 +140,9 @@ class JinjaFlowable(Flowable):
         raise Exception("File not found: %s" % src)
 
     def draw_image(self, o):
-        p = self.resolve_image_path(o['src'])
+        p = self.imagecache.get(o['src'], None)
+        if p is None:
+            p = self.imagecache[o['src']] = self.resolve_image_path(o['src'])
         self.canv.drawImage(p,
                             getmm(o, 'x'),
                             self.calc_y(o),
@@ -176,18 +182,36 @@ class JinjaFlowable(Flowable):
             return
 
         (ver, size, qrimage) = qrencode.encode(s, version=ver, level=qrencode.QR_ECLEVEL_M)
-        if size < 500:
-            size = (500 // size) * size
-            qrimage = qrimage.resize((size, size), Image.NEAREST)
 
-        self.canv.drawImage(ImageReader(qrimage),
-                            getmm(o, 'x'),
-                            self.calc_y(o),
-                            getmm(o, 'width'),
-                            getmm(o, 'height'),
-                            o.get('mask', 'auto'),
-                            preserveAspectRatio=True,
-        )
+        # Draw the QR code as vectors, one rectangle for each horizontal run of
+        # dark modules, centered in the box the same way as an image with
+        # preserved aspect ratio would be.
+        side = min(getmm(o, 'width'), getmm(o, 'height'))
+        x = getmm(o, 'x') + (getmm(o, 'width') - side) / 2
+        y = self.calc_y(o) + (getmm(o, 'height') - side) / 2
+        modsize = side / size
+        modules = qrimage.convert('L').tobytes()
+
+        self.canv.saveState()
+        if o.get('mask', 'auto') == 'auto':
+            # Without an explicit mask, the light modules are drawn as well
+            self.canv.setFillColorRGB(1, 1, 1)
+            self.canv.rect(x, y, side, side, stroke=0, fill=1)
+        self.canv.setFillColorRGB(0, 0, 0)
+        path = self.canv.beginPath()
+        for row in range(size):
+            rowmodules = modules[row * size:(row + 1) * size]
+            col = 0
+            while col < size:
+                if rowmodules[col] < 128:
+                    start = col
+                    while col < size and rowmodules[col] < 128:
+                        col += 1
+                    path.rect(x + start * modsize, y + side - (row + 1) * modsize, (col - start) * modsize, modsize)
+                else:
+                    col += 1
+        self.canv.drawPath(path, stroke=0, fill=1)
+        self.canv.restoreState()
 
     def draw_paragraph(self, o):
         # Attempt to draw a paragraph that can dynamically change the font size
@@ -207,11 +231,18 @@ class JinjaFlowable(Flowable):
             maxfontsize = min(maxsize, maxfont_height)
         else:
             maxfontsize = maxfont_height
-        for fontsize in range(4, maxfontsize):
-            maxwidth = max([self.canv.stringWidth(line, fontname, fontsize) for line in lines])
-            if maxwidth > getmm(o, 'width'):
-                fontsize -= 1
-                break
+        # Find the largest font size where all lines fit in the width. The
+        # width grows with the font size, so do a binary search for the first
+        # size that does not fit.
+        lo = 4
+        hi = maxfontsize
+        while lo < hi:
+            fontsize = (lo + hi) // 2
+            if max([self.canv.stringWidth(line, fontname, fontsize) for line in lines]) > getmm(o, 'width'):
+                hi = fontsize
+            else:
+                lo = fontsize + 1
+        fontsize = lo - 1
 
         if o.get('verticalcenter', False):
             yoffset = (getmm(o, 'height') - (len(lines) * fontsize)) // 2
@@ -293,6 +324,7 @@ class JinjaRenderer(object):
             self.staticdir = None
 
         self.story = []
+        self.imagecache = {}
 
     def add_to_story(self, ctx):
         ctx.update(self.context)
@@ -312,16 +344,98 @@ class JinjaRenderer(object):
 
         if 'border' not in js:
             js['border'] = self.border
-        self.story.append(JinjaFlowable(js, self.staticdir))
+        self.story.append(JinjaFlowable(js, self.staticdir, self.imagecache))
 
         if 'forcebreaks' not in js:
             js['forcebreaks'] = self.pagebreaks
         if js.get('forcebreaks', False):
             self.story.append(PageBreak())
 
-    def render(self, output):
-        doc = SimpleDocTemplate(output, pagesize=self.pagesize, leftMargin=10 * mm, topMargin=5 * mm, rightMargin=10 * mm, bottomMargin=5 * mm)
-        doc.build(self.story)
+    def _get_doc(self, output):
+        return SimpleDocTemplate(output, pagesize=self.pagesize, leftMargin=10 * mm, topMargin=5 * mm, rightMargin=10 * mm, bottomMargin=5 * mm)
+
+    def _get_page_starts(self):
+        # Find the positions in the story where new pages start, by doing the
+        # same vertical layout as the frame of the document will. Returns None
+        # if something won't fit on a page, and has to be left to reportlab.
+        doc = self._get_doc(None)
+        frameheight = doc.height - 12  # Frames have 6pt padding
+        starts = [0, ]
+        remaining = frameheight
+        for i, f in enumerate(self.story):
+            if isinstance(f, PageBreak):
+                if i + 1 < len(self.story):
+                    starts.append(i + 1)
+                remaining = frameheight
+                continue
+            h = f.height
+            if h > frameheight:
+                return None
+            if remaining <= 0 or h > remaining + 1e-6:
+                starts.append(i)
+                remaining = frameheight
+            remaining -= h
+        return starts
+
+    def render(self, output, jobs=1):
+        if jobs > 1 and len(self.story) >= jobs * MIN_STORY_PER_JOB:
+            pdf = self._render_parallel(jobs)
+            if pdf:
+                output.write(pdf)
+                return
+
+        self._get_doc(output).build(self.story)
+
+    def _render_parallel(self, jobs):
+        # Split the story into chunks of whole pages, render them in separate
+        # processes, and concatenate the resulting PDFs. Requires fitz to
+        # join the PDFs, and the fork start method so the workers get this
+        # renderer without having to pickle it. Returns None if that's not
+        # possible, in which case the caller renders the story itself.
+        try:
+            import fitz
+        except ImportError:
+            return None
+        if 'fork' not in multiprocessing.get_all_start_methods():
+            return None
+
+        starts = self._get_page_starts()
+        if not starts or len(starts) < 2:
+            return None
+        jobs = min(jobs, len(starts))
+        chunkstarts = [starts[(len(starts) * n) // jobs] for n in range(jobs)]
+        chunks = list(zip(chunkstarts, chunkstarts[1:] + [len(self.story)]))
+
+        with multiprocessing.get_context('fork').Pool(jobs, initializer=_init_render_worker, initargs=(self, )) as pool:
+            pdfs = pool.map(_render_story_chunk, chunks, chunksize=1)
+
+        merged = fitz.open()
+        for p in pdfs:
+            with fitz.open('pdf', p) as chunkpdf:
+                merged.insert_pdf(chunkpdf)
+        return merged.tobytes(garbage=3, deflate=True)
+
+
+# Minimum number of flowables in the story for each process when rendering
+# in parallel, since each process has to load fonts and images and the
+# result has to be merged.
+MIN_STORY_PER_JOB = 50
+
+# The renderer used by a worker process in a parallel render. It's only set
+# in the worker processes, where it's handed over when they are forked, so
+# concurrent renders in the parent can't interfere with each other.
+_parallel_renderer = None
+
+
+def _init_render_worker(renderer):
+    global _parallel_renderer
+    _parallel_renderer = renderer
+
+
+def _render_story_chunk(chunk):
+    output = io.BytesIO()
+    _parallel_renderer._get_doc(output).build(_parallel_renderer.story[chunk[0]:chunk[1]])
+    return output.getvalue()
 
 
 class JinjaBadgeRenderer(JinjaRenderer):
@@ -351,13 +465,14 @@ class JinjaTicketRenderer(JinjaRenderer):
 
 # Render badges from within the website scope, meaning we have access to the
 # django objects here.
-def render_jinja_badges(conference, fonts, registrations, output, border, pagebreaks, orientation='portrait', pagesize='A4'):
+def render_jinja_badges(conference, fonts, registrations, output, border, pagebreaks, orientation='portrait', pagesize='A4', jobs=1):
     renderer = JinjaBadgeRenderer(conference.jinjadir, fonts, border=border, pagebreaks=pagebreaks, orientation=orientation, pagesize=pagesize)
 
+    confexport = conference.safe_export()
     for reg in registrations:
-        renderer.add_badge(reg, conference.safe_export())
+        renderer.add_badge(reg, confexport)
 
-    renderer.render(output)
+    renderer.render(output, jobs)
 
 
 def render_jinja_ticket(registration, output, systemroot, fonts):
@@ -377,6 +492,7 @@ if __name__ == "__main__":
     parser.add_argument('--pagebreaks', action='store_true', help='Enable pagebreaks on written file')
     parser.add_argument('--fontroot', type=str, help='fontroot for dejavu fonts')
     parser.add_argument('--font', type=str, nargs='+', help='<font name>:<font path>')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of processes to render badges in')
 
     args = parser.parse_args()
 
@@ -407,4 +523,4 @@ if __name__ == "__main__":
         renderer.add_reg(a[0], conference)
 
     with open(args.outputfile, 'wb') as output:
-        renderer.render(output)
+        renderer.render(output, args.jobs if args.what == 'badge' else 1)
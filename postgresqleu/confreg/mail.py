@@ -54,20 +54,17 @@ def attendee_email_form(request, conference, query=None, breadcrumbs=[], templat
                     'subject': form.cleaned_data['subject'],
                     'message': form.cleaned_data['message'],
                 })
-                for r in recipients:
-                    if r['regid']:
-                        # Existing registration, so attach directly to attendee
-                        exec_no_result("INSERT INTO confreg_attendeemail_registrations (attendeemail_id, conferenceregistration_id) VALUES (%(mailid)s, %(reg)s)", {
-                            'mailid': mailid,
-                            'reg': r['regid'],
-                        })
-                    else:
-                        # No existing registration, so queue it up in case the attendee
-                        # might register later. We have the userid...
-                        exec_no_result("INSERT INTO confreg_attendeemail_pending_regs (attendeemail_id, user_id) VALUES (%(mailid)s, %(userid)s)", {
-                            'mailid': mailid,
-                            'userid': r['user_id'],
-                        })
+                # Existing registrations are attached directly to the attendee. For
+                # the others, queue it up in case the attendee might register later.
+                # We have the userid...
+                exec_no_result("INSERT INTO confreg_attendeemail_registrations (attendeemail_id, conferenceregistration_id) SELECT %(mailid)s, unnest(%(regs)s::integer[])", {
+                    'mailid': mailid,
+                    'regs': [r['regid'] for r in recipients if r['regid']],
+                })
+                exec_no_result("INSERT INTO confreg_attendeemail_pending_regs (attendeemail_id, user_id) SELECT %(mailid)s, unnest(%(users)s::integer[])", {
+                    'mailid': mailid,
+                    'users': [r['user_id'] for r in recipients if not r['regid']],
+                })
                 if form.cleaned_data['sendat'] > timezone.now():
                     messages.info(request, "Email scheduled for later sending to attendees")
                 else:
@@ -0,0 +1,34 @@
+#
+# Verify the registration counters that are maintained by triggers against
+# a full count of all registrations, and correct any that have drifted.
+#
+# Copyright (C) 2026, PostgreSQL Europe
+#
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from datetime import time
+
+from postgresqleu.util.db import exec_no_result
+from postgresqleu.confreg.models import Conference
+from postgresqleu.confreg.util import reconcile_registration_counters
+
+
+class Command(BaseCommand):
+    help = 'Reconcile registration counters'
+
+    class ScheduledJob:
+        scheduled_times = [time(3, 15), ]
+        internal = True
+
+    def handle(self, *args, **options):
+        for conference in Conference.objects.only('id', 'conferencename').order_by('id'):
+            # Each conference in its own transaction, to keep the time the
+            # counters are locked short.
+            with transaction.atomic():
+                n = reconcile_registration_counters(conference)
+            if n:
+                self.stdout.write("Corrected {} registration counters for {}".format(n, conference.conferencename))
+
+        # Remove counters for conferences that have been deleted
+        exec_no_result("DELETE FROM confreg_registrationcounter c WHERE NOT EXISTS (SELECT 1 FROM confreg_conference WHERE id=c.conference_id)")
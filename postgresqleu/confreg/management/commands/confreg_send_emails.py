@@ -4,13 +4,46 @@
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from django.db import transaction
-from django.db.models import Q
 from django.conf import settings
 
 from datetime import timedelta
 
-from postgresqleu.confreg.models import AttendeeMail, ConferenceRegistration
-from postgresqleu.confreg.util import send_conference_mail
+from postgresqleu.confreg.models import AttendeeMail
+from postgresqleu.confreg.util import send_conference_bulk_mail
+from postgresqleu.util.db import exec_to_list
+
+
+# All recipients of an attendee email, as (email, name). Registrations can be
+# matched through more than one rule, but should only get the email once.
+# Pending registrations don't have a ConferenceRegistration object, so they
+# are taken from the user instead.
+RECIPIENT_QUERY = """WITH regs AS (
+  -- By registration type
+  SELECT r.id FROM confreg_conferenceregistration r
+  INNER JOIN confreg_registrationtype rt ON rt.id=r.regtype_id
+  INNER JOIN confreg_attendeemail_regclasses amc ON amc.registrationclass_id=rt.regclass_id
+  WHERE amc.attendeemail_id=%(mailid)s AND r.conference_id=%(confid)s AND r.payconfirmedat IS NOT NULL AND r.canceledat IS NULL
+ UNION
+  -- By additional options
+  SELECT r.id FROM confreg_conferenceregistration r
+  INNER JOIN confreg_conferenceregistration_additionaloptions rao ON rao.conferenceregistration_id=r.id
+  INNER JOIN confreg_attendeemail_addopts amo ON amo.conferenceadditionaloption_id=rao.conferenceadditionaloption_id
+  WHERE amo.attendeemail_id=%(mailid)s AND r.conference_id=%(confid)s AND r.payconfirmedat IS NOT NULL AND r.canceledat IS NULL
+ UNION
+  -- To direct attendees
+  SELECT conferenceregistration_id FROM confreg_attendeemail_registrations WHERE attendeemail_id=%(mailid)s
+ UNION
+  -- To volunteers
+  SELECT conferenceregistration_id FROM confreg_conference_volunteers WHERE conference_id=%(confid)s AND %(tovolunteers)s
+ UNION
+  -- To checkin processors
+  SELECT conferenceregistration_id FROM confreg_conference_checkinprocessors WHERE conference_id=%(confid)s AND %(tocheckin)s
+)
+SELECT r.email, r.firstname || ' ' || r.lastname FROM confreg_conferenceregistration r INNER JOIN regs ON regs.id=r.id
+UNION ALL
+SELECT u.email, u.first_name || ' ' || u.last_name FROM auth_user u
+INNER JOIN confreg_attendeemail_pending_regs p ON p.user_id=u.id
+WHERE p.attendeemail_id=%(mailid)s"""
 
 
 class Command(BaseCommand):
@@ -24,36 +57,32 @@ class Command(BaseCommand):
         def should_run(self):
             return AttendeeMail.objects.filter(sentat__lte=timezone.now(), sent=False).exists()
 
-    @transaction.atomic
     def handle(self, *args, **options):
         for msg in AttendeeMail.objects.filter(sentat__lte=timezone.now(), sent=False):
-            # By registration type
-            attendees = set(ConferenceRegistration.objects.filter(conference=msg.conference, payconfirmedat__isnull=False, canceledat__isnull=True, regtype__regclass__attendeemail=msg))
-            # By additional options
-            attendees.update(ConferenceRegistration.objects.filter(conference=msg.conference, payconfirmedat__isnull=False, canceledat__isnull=True, additionaloptions__attendeemail=msg))
-            # To direct attendees
-            attendees.update(msg.registrations.all())
-            # To volunteers
-            if msg.tovolunteers:
-                attendees.update(msg.conference.volunteers.all())
-            # To checkin processors
-            if msg.tocheckin:
-                attendees.update(msg.conference.checkinprocessors.all())
-
-            # Pending registrations don't have a ConferenceRegistration object, so we need to extract just the parts we need.
-            recipients = [(a.fullname, a.email) for a in attendees]
-            recipients.extend([('{} {}'.format(u.first_name, u.last_name), u.email) for u in msg.pending_regs.all()])
-
-            for fullname, email in recipients:
-                send_conference_mail(msg.conference,
-                                     email,
-                                     msg.subject,
-                                     'confreg/mail/attendee_mail.txt',
-                                     {
-                                         'body': msg.message,
-                                         'linkback': True,
-                                     },
-                                     receivername=fullname,
+            # Each message is queued in its own transaction, so it's
+            # committed as soon as it's done instead of holding a single
+            # transaction open for all of them.
+            with transaction.atomic():
+                # Lock the message, so it can't be sent twice by concurrent runs
+                if not AttendeeMail.objects.select_for_update().filter(pk=msg.pk, sent=False).exists():
+                    continue
+
+                # The same body is sent to all recipients, so it's only
+                # rendered and stored once, with just the recipient on each
+                # queued mail.
+                send_conference_bulk_mail(msg.conference,
+                                          exec_to_list(RECIPIENT_QUERY, {
+                                              'mailid': msg.id,
+                                              'confid': msg.conference_id,
+                                              'tovolunteers': msg.tovolunteers,
+                                              'tocheckin': msg.tocheckin,
+                                          }),
+                                          msg.subject,
+                                          'confreg/mail/attendee_mail.txt',
+                                          {
+                                              'body': msg.message,
+                                              'linkback': True,
+                                          },
                 )
-            msg.sent = True
-            msg.save(update_fields=['sent'])
+                msg.sent = True
+                msg.save(update_fields=['sent'])
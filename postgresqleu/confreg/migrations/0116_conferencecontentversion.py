@@ -0,0 +1,172 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Columns of a session that are included anywhere in the published schedule
+SCHEDULE_SESSION_COLUMNS = ['conference_id', 'title', 'starttime', 'endtime', 'track_id', 'room_id', 'cross_schedule',
+                            'can_feedback', 'abstract', 'htmlicon', 'status', 'recordingconsent', 'videolinks']
+
+# Columns of a speaker that are included in the published schedule
+SCHEDULE_SPEAKER_COLUMNS = ['fullname', 'company', 'attributes', 'photo_hashval', 'photo512_hashval']
+
+
+def _distinct_row(columns):
+    return "({}) IS DISTINCT FROM ({})".format(
+        ", ".join("OLD.{}".format(c) for c in columns),
+        ", ".join("NEW.{}".format(c) for c in columns),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('confreg', '0115_speaker_photo_hashvals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConferenceContentVersion',
+            fields=[
+                ('conference', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='confreg.conference')),
+                ('schedule', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunSQL(
+            """
+CREATE FUNCTION confreg_bump_schedule_version(confid integer) RETURNS void AS $$
+INSERT INTO confreg_conferencecontentversion (conference_id, schedule) VALUES (confid, 1)
+ON CONFLICT (conference_id) DO UPDATE SET schedule=confreg_conferencecontentversion.schedule+1
+$$ LANGUAGE sql
+            """,
+            "DROP FUNCTION confreg_bump_schedule_version(integer)",
+        ),
+        # Trigger for tables that reference the conference directly
+        migrations.RunSQL(
+            """
+CREATE FUNCTION confreg_schedule_changed() RETURNS trigger AS $$
+BEGIN
+        IF TG_OP != 'INSERT' THEN
+                PERFORM confreg_bump_schedule_version(OLD.conference_id);
+        END IF;
+        IF TG_OP = 'INSERT' THEN
+                PERFORM confreg_bump_schedule_version(NEW.conference_id);
+        ELSIF TG_OP = 'UPDATE' THEN
+                IF NEW.conference_id != OLD.conference_id THEN
+                        PERFORM confreg_bump_schedule_version(NEW.conference_id);
+                END IF;
+        END IF;
+        RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+            """,
+            "DROP FUNCTION confreg_schedule_changed()",
+        ),
+        # Trigger for tables that reference the conference through another
+        # table. Arguments are the name of that table and the name of the
+        # column referencing it.
+        migrations.RunSQL(
+            """
+CREATE FUNCTION confreg_schedule_related_changed() RETURNS trigger AS $$
+BEGIN
+        IF TG_OP != 'INSERT' THEN
+                EXECUTE format('SELECT confreg_bump_schedule_version(conference_id) FROM %I WHERE id=$1', TG_ARGV[0])
+                USING (to_jsonb(OLD)->>TG_ARGV[1])::integer;
+        END IF;
+        IF TG_OP != 'DELETE' THEN
+                EXECUTE format('SELECT confreg_bump_schedule_version(conference_id) FROM %I WHERE id=$1', TG_ARGV[0])
+                USING (to_jsonb(NEW)->>TG_ARGV[1])::integer;
+        END IF;
+        RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+            """,
+            "DROP FUNCTION confreg_schedule_related_changed()",
+        ),
+        # Speakers are shared between conferences, so bump every conference
+        # the speaker has a session in.
+        migrations.RunSQL(
+            """
+CREATE FUNCTION confreg_schedule_speaker_changed() RETURNS trigger AS $$
+BEGIN
+        PERFORM confreg_bump_schedule_version(conference_id) FROM (
+                SELECT DISTINCT s.conference_id FROM confreg_conferencesession s
+                INNER JOIN confreg_conferencesession_speaker css ON css.conferencesession_id=s.id
+                WHERE css.speaker_id=NEW.id
+        ) c;
+        RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+            """,
+            "DROP FUNCTION confreg_schedule_speaker_changed()",
+        ),
+        migrations.RunSQL(
+            """
+CREATE TRIGGER confreg_conferencesession_schedule_trigger
+AFTER INSERT OR DELETE ON confreg_conferencesession
+FOR EACH ROW EXECUTE FUNCTION confreg_schedule_changed();
+
+CREATE TRIGGER confreg_conferencesession_schedule_update_trigger
+AFTER UPDATE ON confreg_conferencesession
+FOR EACH ROW WHEN ({})
+EXECUTE FUNCTION confreg_schedule_changed();
+
+CREATE TRIGGER confreg_track_schedule_trigger
+AFTER INSERT OR DELETE ON confreg_track
+FOR EACH ROW EXECUTE FUNCTION confreg_schedule_changed();
+
+CREATE TRIGGER confreg_track_schedule_update_trigger
+AFTER UPDATE ON confreg_track
+FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+EXECUTE FUNCTION confreg_schedule_changed();
+
+CREATE TRIGGER confreg_room_schedule_trigger
+AFTER INSERT OR DELETE ON confreg_room
+FOR EACH ROW EXECUTE FUNCTION confreg_schedule_changed();
+
+CREATE TRIGGER confreg_room_schedule_update_trigger
+AFTER UPDATE ON confreg_room
+FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+EXECUTE FUNCTION confreg_schedule_changed();
+
+CREATE TRIGGER confreg_registrationday_schedule_trigger
+AFTER UPDATE ON confreg_registrationday
+FOR EACH ROW WHEN (OLD.day IS DISTINCT FROM NEW.day)
+EXECUTE FUNCTION confreg_schedule_changed();
+
+CREATE TRIGGER confreg_conferencesession_speaker_schedule_trigger
+AFTER INSERT OR UPDATE OR DELETE ON confreg_conferencesession_speaker
+FOR EACH ROW EXECUTE FUNCTION confreg_schedule_related_changed('confreg_conferencesession', 'conferencesession_id');
+
+CREATE TRIGGER confreg_conferencesessionslides_schedule_trigger
+AFTER INSERT OR DELETE OR UPDATE OF session_id ON confreg_conferencesessionslides
+FOR EACH ROW EXECUTE FUNCTION confreg_schedule_related_changed('confreg_conferencesession', 'session_id');
+
+CREATE TRIGGER confreg_room_availabledays_schedule_trigger
+AFTER INSERT OR UPDATE OR DELETE ON confreg_room_availabledays
+FOR EACH ROW EXECUTE FUNCTION confreg_schedule_related_changed('confreg_room', 'room_id');
+
+CREATE TRIGGER confreg_speaker_schedule_trigger
+AFTER UPDATE ON confreg_speaker
+FOR EACH ROW WHEN ({})
+EXECUTE FUNCTION confreg_schedule_speaker_changed();
+            """.format(
+                _distinct_row(SCHEDULE_SESSION_COLUMNS),
+                _distinct_row(SCHEDULE_SPEAKER_COLUMNS),
+            ),
+            """
+DROP TRIGGER confreg_conferencesession_schedule_trigger ON confreg_conferencesession;
+DROP TRIGGER confreg_conferencesession_schedule_update_trigger ON confreg_conferencesession;
+DROP TRIGGER confreg_track_schedule_trigger ON confreg_track;
+DROP TRIGGER confreg_track_schedule_update_trigger ON confreg_track;
+DROP TRIGGER confreg_room_schedule_trigger ON confreg_room;
+DROP TRIGGER confreg_room_schedule_update_trigger ON confreg_room;
+DROP TRIGGER confreg_registrationday_schedule_trigger ON confreg_registrationday;
+DROP TRIGGER confreg_conferencesession_speaker_schedule_trigger ON confreg_conferencesession_speaker;
+DROP TRIGGER confreg_conferencesessionslides_schedule_trigger ON confreg_conferencesessionslides;
+DROP TRIGGER confreg_room_availabledays_schedule_trigger ON confreg_room_availabledays;
+DROP TRIGGER confreg_speaker_schedule_trigger ON confreg_speaker;
+            """,
+        ),
+    ]
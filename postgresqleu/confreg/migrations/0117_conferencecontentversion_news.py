@@ -0,0 +1,143 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:42
+
+from django.db import migrations, models
+
+
+# Columns of news and posts that are included in the published news feeds
+NEWS_COLUMNS = ['conference_id', 'datetime', 'title', 'summary', 'author_id', 'inrss']
+POST_COLUMNS = ['conference_id', 'datetime', 'contents', 'approved', 'sent', 'postids']
+
+
+def _distinct_row(columns):
+    return "({}) IS DISTINCT FROM ({})".format(
+        ", ".join("OLD.{}".format(c) for c in columns),
+        ", ".join("NEW.{}".format(c) for c in columns),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('confreg', '0116_conferencecontentversion'),
+        ('newsevents', '0004_tweet_news'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conferencecontentversion',
+            name='news',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conferencecontentversion',
+            name='news_modified',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='conferencecontentversion',
+            name='schedule_modified',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunSQL(
+            """
+CREATE FUNCTION confreg_bump_content_version(confid integer, content text) RETURNS void AS $$
+BEGIN
+        IF confid IS NULL THEN
+                RETURN;
+        END IF;
+        INSERT INTO confreg_conferencecontentversion (conference_id, schedule, news) VALUES (confid, 0, 0)
+        ON CONFLICT (conference_id) DO NOTHING;
+        EXECUTE format('UPDATE confreg_conferencecontentversion SET %1$I=%1$I+1, %2$I=CURRENT_TIMESTAMP WHERE conference_id=$1', content, content || '_modified')
+        USING confid;
+END;
+$$ LANGUAGE plpgsql
+            """,
+            "DROP FUNCTION confreg_bump_content_version(integer, text)",
+        ),
+        migrations.RunSQL(
+            """
+CREATE OR REPLACE FUNCTION confreg_bump_schedule_version(confid integer) RETURNS void AS $$
+SELECT confreg_bump_content_version(confid, 'schedule')
+$$ LANGUAGE sql
+            """,
+            """
+CREATE OR REPLACE FUNCTION confreg_bump_schedule_version(confid integer) RETURNS void AS $$
+INSERT INTO confreg_conferencecontentversion (conference_id, schedule) VALUES (confid, 1)
+ON CONFLICT (conference_id) DO UPDATE SET schedule=confreg_conferencecontentversion.schedule+1
+$$ LANGUAGE sql
+            """,
+        ),
+        # Trigger for news and posts, both of which reference the conference
+        # directly (though posts don't always have a conference).
+        migrations.RunSQL(
+            """
+CREATE FUNCTION confreg_news_changed() RETURNS trigger AS $$
+BEGIN
+        IF TG_OP != 'INSERT' THEN
+                PERFORM confreg_bump_content_version(OLD.conference_id, 'news');
+        END IF;
+        IF TG_OP = 'INSERT' THEN
+                PERFORM confreg_bump_content_version(NEW.conference_id, 'news');
+        ELSIF TG_OP = 'UPDATE' THEN
+                IF NEW.conference_id IS DISTINCT FROM OLD.conference_id THEN
+                        PERFORM confreg_bump_content_version(NEW.conference_id, 'news');
+                END IF;
+        END IF;
+        RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+            """,
+            "DROP FUNCTION confreg_news_changed()",
+        ),
+        # News posters are shared between conferences, so bump every
+        # conference the poster has news in.
+        migrations.RunSQL(
+            """
+CREATE FUNCTION confreg_news_author_changed() RETURNS trigger AS $$
+BEGIN
+        PERFORM confreg_bump_content_version(conference_id, 'news') FROM (
+                SELECT DISTINCT conference_id FROM confreg_conferencenews WHERE author_id=NEW.author_id
+        ) c;
+        RETURN NULL;
+END;
+$$ LANGUAGE plpgsql
+            """,
+            "DROP FUNCTION confreg_news_author_changed()",
+        ),
+        migrations.RunSQL(
+            """
+CREATE TRIGGER confreg_conferencenews_news_trigger
+AFTER INSERT OR DELETE ON confreg_conferencenews
+FOR EACH ROW EXECUTE FUNCTION confreg_news_changed();
+
+CREATE TRIGGER confreg_conferencenews_news_update_trigger
+AFTER UPDATE ON confreg_conferencenews
+FOR EACH ROW WHEN ({})
+EXECUTE FUNCTION confreg_news_changed();
+
+CREATE TRIGGER confreg_conferencetweetqueue_news_trigger
+AFTER INSERT OR DELETE ON confreg_conferencetweetqueue
+FOR EACH ROW EXECUTE FUNCTION confreg_news_changed();
+
+CREATE TRIGGER confreg_conferencetweetqueue_news_update_trigger
+AFTER UPDATE ON confreg_conferencetweetqueue
+FOR EACH ROW WHEN ({} OR (OLD.image IS NULL OR OLD.image = '') != (NEW.image IS NULL OR NEW.image = ''))
+EXECUTE FUNCTION confreg_news_changed();
+
+CREATE TRIGGER newsevents_newsposterprofile_news_trigger
+AFTER UPDATE ON newsevents_newsposterprofile
+FOR EACH ROW WHEN (OLD.fullname IS DISTINCT FROM NEW.fullname)
+EXECUTE FUNCTION confreg_news_author_changed();
+            """.format(
+                _distinct_row(NEWS_COLUMNS),
+                _distinct_row(POST_COLUMNS),
+            ),
+            """
+DROP TRIGGER confreg_conferencenews_news_trigger ON confreg_conferencenews;
+DROP TRIGGER confreg_conferencenews_news_update_trigger ON confreg_conferencenews;
+DROP TRIGGER confreg_conferencetweetqueue_news_trigger ON confreg_conferencetweetqueue;
+DROP TRIGGER confreg_conferencetweetqueue_news_update_trigger ON confreg_conferencetweetqueue;
+DROP TRIGGER newsevents_newsposterprofile_news_trigger ON newsevents_newsposterprofile;
+            """,
+        ),
+    ]
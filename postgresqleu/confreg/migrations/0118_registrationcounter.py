@@ -0,0 +1,356 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:14
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+COUNTER_COLUMNS = ['total', 'confirmed', 'canceled', 'invoiced', 'unconfirmed', 'nopolicy', 'pendinginvoiced', 'pendingunconfirmed', 'used']
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('confreg', '0117_conferencecontentversion_news'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrationCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('countertype', models.CharField(choices=[('r', 'Registration type'), ('a', 'Additional option'), ('d', 'Discount code'), ('b', 'Prepaid batch')], max_length=1)),
+                ('objectid', models.IntegerField()),
+                ('total', models.IntegerField(default=0)),
+                ('confirmed', models.IntegerField(default=0)),
+                ('canceled', models.IntegerField(default=0)),
+                ('invoiced', models.IntegerField(default=0)),
+                ('unconfirmed', models.IntegerField(default=0)),
+                ('nopolicy', models.IntegerField(default=0)),
+                ('pendinginvoiced', models.IntegerField(default=0)),
+                ('pendingunconfirmed', models.IntegerField(default=0)),
+                ('used', models.IntegerField(default=0)),
+                ('conference', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='confreg.conference')),
+            ],
+            options={
+                'unique_together': {('countertype', 'objectid')},
+            },
+        ),
+        # Full count of all registration counters of a conference. Used to
+        # populate and reconcile the counters that are maintained by triggers.
+        migrations.RunSQL(
+            """
+CREATE FUNCTION confreg_registrationcounters(confid integer)
+RETURNS TABLE (countertype varchar(1), objectid integer, {0}) AS $$
+SELECT countertype, objectid, {1} FROM (
+ SELECT 'r' AS countertype, r.regtype_id AS objectid,
+        count(*) AS total,
+        count(r.payconfirmedat) AS confirmed,
+        count(r.canceledat) AS canceled,
+        count(*) FILTER (WHERE r.payconfirmedat IS NULL AND (r.invoice_id IS NOT NULL OR bp.invoice_id IS NOT NULL)) AS invoiced,
+        count(*) FILTER (WHERE r.payconfirmedat IS NULL AND r.invoice_id IS NULL AND bp.invoice_id IS NULL) AS unconfirmed,
+        count(*) FILTER (WHERE r.payconfirmedat IS NOT NULL AND r.canceledat IS NULL AND r.policyconfirmedat IS NULL) AS nopolicy,
+        0 AS pendinginvoiced, 0 AS pendingunconfirmed, 0 AS used
+ FROM confreg_conferenceregistration r
+ LEFT JOIN confreg_bulkpayment bp ON bp.id=r.bulkpayment_id
+ WHERE r.conference_id=confid AND r.regtype_id IS NOT NULL
+ GROUP BY r.regtype_id
+UNION ALL
+ SELECT 'a', rao.conferenceadditionaloption_id,
+        count(*),
+        count(r.payconfirmedat),
+        0,
+        count(*) FILTER (WHERE r.payconfirmedat IS NULL AND (r.invoice_id IS NOT NULL OR bp.invoice_id IS NOT NULL)),
+        count(*) FILTER (WHERE r.payconfirmedat IS NULL AND r.invoice_id IS NULL AND bp.invoice_id IS NULL),
+        0, 0, 0, 0
+ FROM confreg_conferenceregistration r
+ INNER JOIN confreg_conferenceregistration_additionaloptions rao ON rao.conferenceregistration_id=r.id
+ LEFT JOIN confreg_bulkpayment bp ON bp.id=r.bulkpayment_id
+ WHERE r.conference_id=confid
+ GROUP BY rao.conferenceadditionaloption_id
+UNION ALL
+ SELECT 'a', paoo.conferenceadditionaloption_id,
+        0, 0, 0, 0, 0, 0,
+        count(*) FILTER (WHERE pao.invoice_id IS NOT NULL),
+        count(*) FILTER (WHERE pao.invoice_id IS NULL),
+        0
+ FROM confreg_pendingadditionalorder_options paoo
+ INNER JOIN confreg_pendingadditionalorder pao ON pao.id=paoo.pendingadditionalorder_id
+ INNER JOIN confreg_conferenceadditionaloption ao ON ao.id=paoo.conferenceadditionaloption_id
+ WHERE ao.conference_id=confid AND pao.payconfirmedat IS NULL
+ GROUP BY paoo.conferenceadditionaloption_id
+UNION ALL
+ SELECT 'd', dc.id,
+        count(*),
+        count(r.payconfirmedat),
+        0,
+        count(*) FILTER (WHERE r.payconfirmedat IS NULL AND (r.invoice_id IS NOT NULL OR bp.invoice_id IS NOT NULL)),
+        count(*) FILTER (WHERE r.payconfirmedat IS NULL AND r.invoice_id IS NULL AND bp.invoice_id IS NULL),
+        0, 0, 0, 0
+ FROM confreg_conferenceregistration r
+ INNER JOIN confreg_discountcode dc ON dc.conference_id=r.conference_id AND dc.code=r.vouchercode
+ LEFT JOIN confreg_bulkpayment bp ON bp.id=r.bulkpayment_id
+ WHERE r.conference_id=confid
+ GROUP BY dc.id
+UNION ALL
+ SELECT 'b', v.batch_id,
+        count(*), 0, 0, 0, 0, 0, 0, 0,
+        count(v.user_id)
+ FROM confreg_prepaidvoucher v
+ WHERE v.conference_id=confid
+ GROUP BY v.batch_id
+) c
+GROUP BY countertype, objectid
+$$ LANGUAGE sql STABLE
+            """.format(
+                ", ".join("{} bigint".format(c) for c in COUNTER_COLUMNS),
+                ", ".join("sum({0})".format(c) for c in COUNTER_COLUMNS),
+            ),
+            "DROP FUNCTION confreg_registrationcounters(integer)",
+        ),
+        migrations.RunSQL(
+            """
+CREATE FUNCTION confreg_registrationcounter_bump(confid integer, ctype varchar(1), oid integer, {0}) RETURNS void AS $$
+INSERT INTO confreg_registrationcounter (conference_id, countertype, objectid, {1}) VALUES (confid, ctype, oid, {2})
+ON CONFLICT (countertype, objectid) DO UPDATE SET {3}
+$$ LANGUAGE sql
+            """.format(
+                ", ".join("_{} integer".format(c) for c in COUNTER_COLUMNS),
+                ", ".join(COUNTER_COLUMNS),
+                ", ".join("_{}".format(c) for c in COUNTER_COLUMNS),
+                ", ".join("{0}=confreg_registrationcounter.{0}+excluded.{0}".format(c) for c in COUNTER_COLUMNS),
+            ),
+            "DROP FUNCTION confreg_registrationcounter_bump(integer, varchar, integer, {})".format(", ".join("integer" for c in COUNTER_COLUMNS)),
+        ),
+        # Add (sign=1) or remove (sign=-1) a registration from the counters it
+        # is included in. If optionid is set, only the counter for that
+        # additional option is changed. If bulkinvoiced is NULL, it's looked up
+        # from the bulk payment of the registration.
+        migrations.RunSQL(
+            """
+CREATE FUNCTION confreg_registrationcounter_reg(r confreg_conferenceregistration, bulkinvoiced boolean, sign integer, optionid integer) RETURNS void AS $$
+DECLARE
+        confirmed integer;
+        canceled integer;
+        invoiced integer;
+        unconfirmed integer;
+        nopolicy integer;
+BEGIN
+        IF bulkinvoiced IS NULL THEN
+                bulkinvoiced := EXISTS (SELECT 1 FROM confreg_bulkpayment WHERE id=r.bulkpayment_id AND invoice_id IS NOT NULL);
+        END IF;
+        confirmed := (r.payconfirmedat IS NOT NULL)::integer * sign;
+        canceled := (r.canceledat IS NOT NULL)::integer * sign;
+        invoiced := (r.payconfirmedat IS NULL AND (r.invoice_id IS NOT NULL OR bulkinvoiced))::integer * sign;
+        unconfirmed := (r.payconfirmedat IS NULL AND NOT (r.invoice_id IS NOT NULL OR bulkinvoiced))::integer * sign;
+        nopolicy := (r.payconfirmedat IS NOT NULL AND r.canceledat IS NULL AND r.policyconfirmedat IS NULL)::integer * sign;
+
+        IF optionid IS NOT NULL THEN
+                PERFORM confreg_registrationcounter_bump(r.conference_id, 'a', optionid, sign, confirmed, 0, invoiced, unconfirmed, 0, 0, 0, 0);
+                RETURN;
+        END IF;
+
+        IF r.regtype_id IS NOT NULL THEN
+                PERFORM confreg_registrationcounter_bump(r.conference_id, 'r', r.regtype_id, sign, confirmed, canceled, invoiced, unconfirmed, nopolicy, 0, 0, 0);
+        END IF;
+        PERFORM confreg_registrationcounter_bump(r.conference_id, 'a', rao.conferenceadditionaloption_id, sign, confirmed, 0, invoiced, unconfirmed, 0, 0, 0, 0)
+        FROM confreg_conferenceregistration_additionaloptions rao
+        WHERE rao.conferenceregistration_id=r.id
+        ORDER BY rao.conferenceadditionaloption_id;
+        IF r.vouchercode != '' THEN
+                PERFORM confreg_registrationcounter_bump(r.conference_id, 'd', dc.id, sign, confirmed, 0, invoiced, unconfirmed, 0, 0, 0, 0)
+                FROM confreg_discountcode dc
+                WHERE dc.conference_id=r.conference_id AND dc.code=r.vouchercode;
+        END IF;
+END;
+$$ LANGUAGE plpgsql
+            """,
+            "DROP FUNCTION confreg_registrationcounter_reg(confreg_conferenceregistration, boolean, integer, integer)",
+        ),
+        # Add or remove an additional option on an additional order from its
+        # counter. Only orders that are not paid yet are counted, since once
+        # they are paid the option is added to the registration itself.
+        migrations.RunSQL(
+            """
+CREATE FUNCTION confreg_registrationcounter_pending(p confreg_pendingadditionalorder, sign integer, optionid integer) RETURNS void AS $$
+BEGIN
+        IF p.payconfirmedat IS NULL THEN
+                PERFORM confreg_registrationcounter_bump(ao.conference_id, 'a', ao.id, 0, 0, 0, 0, 0, 0,
+                                                         (p.invoice_id IS NOT NULL)::integer * sign,
+                                                         (p.invoice_id IS NULL)::integer * sign,
+                                                         0)
+                FROM confreg_conferenceadditionaloption ao WHERE ao.id=optionid;
+        END IF;
+END;
+$$ LANGUAGE plpgsql
+            """,
+            "DROP FUNCTION confreg_registrationcounter_pending(confreg_pendingadditionalorder, integer, integer)",
+        ),
+        migrations.RunSQL(
+            """
+CREATE FUNCTION confreg_registrationcounter_reg_changed() RETURNS trigger AS $$
+BEGIN
+        IF TG_OP != 'INSERT' THEN
+                PERFORM confreg_registrationcounter_reg(OLD, NULL, -1, NULL);
+        END IF;
+        IF TG_OP != 'DELETE' THEN
+                PERFORM confreg_registrationcounter_reg(NEW, NULL, 1, NULL);
+        END IF;
+        RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION confreg_registrationcounter_regoption_changed() RETURNS trigger AS $$
+BEGIN
+        IF TG_OP != 'INSERT' THEN
+                PERFORM confreg_registrationcounter_reg(r, NULL, -1, OLD.conferenceadditionaloption_id)
+                FROM confreg_conferenceregistration r WHERE r.id=OLD.conferenceregistration_id;
+        END IF;
+        IF TG_OP != 'DELETE' THEN
+                PERFORM confreg_registrationcounter_reg(r, NULL, 1, NEW.conferenceadditionaloption_id)
+                FROM confreg_conferenceregistration r WHERE r.id=NEW.conferenceregistration_id;
+        END IF;
+        RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION confreg_registrationcounter_bulkpayment_changed() RETURNS trigger AS $$
+BEGIN
+        PERFORM confreg_registrationcounter_reg(r, OLD.invoice_id IS NOT NULL, -1, NULL),
+                confreg_registrationcounter_reg(r, NEW.invoice_id IS NOT NULL, 1, NULL)
+        FROM confreg_conferenceregistration r WHERE r.bulkpayment_id=NEW.id;
+        RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION confreg_registrationcounter_pending_changed() RETURNS trigger AS $$
+BEGIN
+        PERFORM confreg_registrationcounter_pending(OLD, -1, paoo.conferenceadditionaloption_id),
+                confreg_registrationcounter_pending(NEW, 1, paoo.conferenceadditionaloption_id)
+        FROM confreg_pendingadditionalorder_options paoo WHERE paoo.pendingadditionalorder_id=NEW.id;
+        RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION confreg_registrationcounter_pendingoption_changed() RETURNS trigger AS $$
+BEGIN
+        IF TG_OP != 'INSERT' THEN
+                PERFORM confreg_registrationcounter_pending(p, -1, OLD.conferenceadditionaloption_id)
+                FROM confreg_pendingadditionalorder p WHERE p.id=OLD.pendingadditionalorder_id;
+        END IF;
+        IF TG_OP != 'DELETE' THEN
+                PERFORM confreg_registrationcounter_pending(p, 1, NEW.conferenceadditionaloption_id)
+                FROM confreg_pendingadditionalorder p WHERE p.id=NEW.pendingadditionalorder_id;
+        END IF;
+        RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE FUNCTION confreg_registrationcounter_voucher_changed() RETURNS trigger AS $$
+BEGIN
+        IF TG_OP != 'INSERT' THEN
+                PERFORM confreg_registrationcounter_bump(OLD.conference_id, 'b', OLD.batch_id, -1, 0, 0, 0, 0, 0, 0, 0, -(OLD.user_id IS NOT NULL)::integer);
+        END IF;
+        IF TG_OP != 'DELETE' THEN
+                PERFORM confreg_registrationcounter_bump(NEW.conference_id, 'b', NEW.batch_id, 1, 0, 0, 0, 0, 0, 0, 0, (NEW.user_id IS NOT NULL)::integer);
+        END IF;
+        RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Registrations are matched to discount codes by the code, so when a code
+-- is added or changed, count it from scratch.
+CREATE FUNCTION confreg_registrationcounter_discountcode_changed() RETURNS trigger AS $$
+BEGIN
+        IF TG_OP != 'INSERT' THEN
+                DELETE FROM confreg_registrationcounter WHERE countertype='d' AND objectid=OLD.id;
+        END IF;
+        IF TG_OP != 'DELETE' THEN
+                INSERT INTO confreg_registrationcounter (conference_id, countertype, objectid, {0})
+                SELECT NEW.conference_id, countertype, objectid, {0}
+                FROM confreg_registrationcounters(NEW.conference_id)
+                WHERE countertype='d' AND objectid=NEW.id;
+        END IF;
+        RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+            """.format(", ".join(COUNTER_COLUMNS)),
+            """
+DROP FUNCTION confreg_registrationcounter_reg_changed();
+DROP FUNCTION confreg_registrationcounter_regoption_changed();
+DROP FUNCTION confreg_registrationcounter_bulkpayment_changed();
+DROP FUNCTION confreg_registrationcounter_pending_changed();
+DROP FUNCTION confreg_registrationcounter_pendingoption_changed();
+DROP FUNCTION confreg_registrationcounter_voucher_changed();
+DROP FUNCTION confreg_registrationcounter_discountcode_changed();
+            """,
+        ),
+        migrations.RunSQL(
+            """
+CREATE TRIGGER confreg_conferenceregistration_counter_trigger
+AFTER INSERT OR DELETE ON confreg_conferenceregistration
+FOR EACH ROW EXECUTE FUNCTION confreg_registrationcounter_reg_changed();
+
+CREATE TRIGGER confreg_conferenceregistration_counter_update_trigger
+AFTER UPDATE ON confreg_conferenceregistration
+FOR EACH ROW WHEN ((OLD.conference_id, OLD.regtype_id, OLD.payconfirmedat, OLD.canceledat, OLD.policyconfirmedat, OLD.invoice_id, OLD.bulkpayment_id, OLD.vouchercode)
+                   IS DISTINCT FROM (NEW.conference_id, NEW.regtype_id, NEW.payconfirmedat, NEW.canceledat, NEW.policyconfirmedat, NEW.invoice_id, NEW.bulkpayment_id, NEW.vouchercode))
+EXECUTE FUNCTION confreg_registrationcounter_reg_changed();
+
+CREATE TRIGGER confreg_conferenceregistration_additionaloptions_counter_trigger
+AFTER INSERT OR UPDATE OR DELETE ON confreg_conferenceregistration_additionaloptions
+FOR EACH ROW EXECUTE FUNCTION confreg_registrationcounter_regoption_changed();
+
+CREATE TRIGGER confreg_bulkpayment_counter_trigger
+AFTER UPDATE ON confreg_bulkpayment
+FOR EACH ROW WHEN ((OLD.invoice_id IS NULL) IS DISTINCT FROM (NEW.invoice_id IS NULL))
+EXECUTE FUNCTION confreg_registrationcounter_bulkpayment_changed();
+
+CREATE TRIGGER confreg_pendingadditionalorder_counter_trigger
+AFTER UPDATE ON confreg_pendingadditionalorder
+FOR EACH ROW WHEN ((OLD.payconfirmedat IS NULL, OLD.invoice_id IS NULL) IS DISTINCT FROM (NEW.payconfirmedat IS NULL, NEW.invoice_id IS NULL))
+EXECUTE FUNCTION confreg_registrationcounter_pending_changed();
+
+CREATE TRIGGER confreg_pendingadditionalorder_options_counter_trigger
+AFTER INSERT OR UPDATE OR DELETE ON confreg_pendingadditionalorder_options
+FOR EACH ROW EXECUTE FUNCTION confreg_registrationcounter_pendingoption_changed();
+
+CREATE TRIGGER confreg_prepaidvoucher_counter_trigger
+AFTER INSERT OR DELETE ON confreg_prepaidvoucher
+FOR EACH ROW EXECUTE FUNCTION confreg_registrationcounter_voucher_changed();
+
+CREATE TRIGGER confreg_prepaidvoucher_counter_update_trigger
+AFTER UPDATE ON confreg_prepaidvoucher
+FOR EACH ROW WHEN ((OLD.conference_id, OLD.batch_id, OLD.user_id IS NULL) IS DISTINCT FROM (NEW.conference_id, NEW.batch_id, NEW.user_id IS NULL))
+EXECUTE FUNCTION confreg_registrationcounter_voucher_changed();
+
+CREATE TRIGGER confreg_discountcode_counter_trigger
+AFTER INSERT OR DELETE ON confreg_discountcode
+FOR EACH ROW EXECUTE FUNCTION confreg_registrationcounter_discountcode_changed();
+
+CREATE TRIGGER confreg_discountcode_counter_update_trigger
+AFTER UPDATE ON confreg_discountcode
+FOR EACH ROW WHEN ((OLD.conference_id, OLD.code) IS DISTINCT FROM (NEW.conference_id, NEW.code))
+EXECUTE FUNCTION confreg_registrationcounter_discountcode_changed();
+            """,
+            """
+DROP TRIGGER confreg_conferenceregistration_counter_trigger ON confreg_conferenceregistration;
+DROP TRIGGER confreg_conferenceregistration_counter_update_trigger ON confreg_conferenceregistration;
+DROP TRIGGER confreg_conferenceregistration_additionaloptions_counter_trigger ON confreg_conferenceregistration_additionaloptions;
+DROP TRIGGER confreg_bulkpayment_counter_trigger ON confreg_bulkpayment;
+DROP TRIGGER confreg_pendingadditionalorder_counter_trigger ON confreg_pendingadditionalorder;
+DROP TRIGGER confreg_pendingadditionalorder_options_counter_trigger ON confreg_pendingadditionalorder_options;
+DROP TRIGGER confreg_prepaidvoucher_counter_trigger ON confreg_prepaidvoucher;
+DROP TRIGGER confreg_prepaidvoucher_counter_update_trigger ON confreg_prepaidvoucher;
+DROP TRIGGER confreg_discountcode_counter_trigger ON confreg_discountcode;
+DROP TRIGGER confreg_discountcode_counter_update_trigger ON confreg_discountcode;
+            """,
+        ),
+        migrations.RunSQL(
+            """
+INSERT INTO confreg_registrationcounter (conference_id, countertype, objectid, {0})
+SELECT c.id, rc.countertype, rc.objectid, {0}
+FROM confreg_conference c, LATERAL confreg_registrationcounters(c.id) rc
+            """.format(", ".join(COUNTER_COLUMNS)),
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:34
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+import django.db.models.functions.text
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('confreg', '0118_registrationcounter'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='conferenceregistration',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('firstname'), name='gin_trgm_ops'), name='confreg_reg_firstname_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='conferenceregistration',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('lastname'), name='gin_trgm_ops'), name='confreg_reg_lastname_trgm'),
+        ),
+    ]
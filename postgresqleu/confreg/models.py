@@ -3,6 +3,7 @@
 from django.db import models
 from django.db.models import Q
 from django.db.models.expressions import F
+from django.db.models.functions import Upper
 from django.db.models.signals import pre_save
 from django.contrib.auth.models import User
 from django.conf import settings
@@ -13,7 +14,7 @@ from django.utils.functional import cached_property
 from django.utils import timezone
 from django.template.defaultfilters import slugify
 from django.contrib.postgres.fields import DateTimeRangeField, ArrayField
-from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.core.serializers.json import DjangoJSONEncoder
 from django.dispatch import receiver
 
@@ -533,12 +534,18 @@ class ConferenceAdditionalOption(models.Model):
         if self.maxcount == -1:
             return "%s%s (currently not available)" % (self.name, coststr)
         if self.maxcount > 0:
-            usedcount = self.conferenceregistration_set.count() + self.pendingadditionalorder_set.filter(payconfirmedat__isnull=True).count()
             return "%s%s (%s of %s available)" % (self.name, coststr,
-                                                  self.maxcount - usedcount,
+                                                  self.maxcount - self.used_count,
                                                   self.maxcount)
         return "%s%s" % (self.name, coststr)
 
+    @property
+    def used_count(self):
+        # Number of registrations and unpaid additional orders that have this
+        # option, as maintained in the registration counters.
+        c = RegistrationCounter.objects.filter(countertype='a', objectid=self.id).values_list('total', 'pendinginvoiced', 'pendingunconfirmed').first()
+        return sum(c) if c else 0
+
 
 class BulkPayment(models.Model):
     # User that owns this bulk payment
@@ -653,6 +660,11 @@ class ConferenceRegistration(models.Model):
             ('attendee_id', 'conference_id'),
             ('email', 'conference_id'),
         )
+        indexes = [
+            # Trigram indexes matching the icontains lookups used when searching for attendees by name
+            GinIndex(OpClass(Upper('firstname'), name='gin_trgm_ops'), name='confreg_reg_firstname_trgm'),
+            GinIndex(OpClass(Upper('lastname'), name='gin_trgm_ops'), name='confreg_reg_lastname_trgm'),
+        ]
 
     @property
     def fullname(self):
@@ -921,6 +933,62 @@ class RegistrationTransferPending(models.Model):
         ordering = ('conference', 'created', )
 
 
+class ConferenceContentVersion(models.Model):
+    # Versions of the published content of a conference, and when they were
+    # last modified, maintained by database triggers whenever something
+    # that's included in the content changes. Kept out
+    # of the Conference table so a save of the conference can never
+    # overwrite a bump made by a concurrent transaction. There is no foreign
+    # key in the database, since the triggers can fire for sessions deleted
+    # in the same transaction as the conference itself.
+    conference = models.OneToOneField(Conference, null=False, blank=False, primary_key=True, on_delete=models.CASCADE, db_constraint=False)
+    schedule = models.BigIntegerField(null=False, blank=False, default=0)
+    schedule_modified = models.DateTimeField(null=True, blank=True)
+    news = models.BigIntegerField(null=False, blank=False, default=0)
+    news_modified = models.DateTimeField(null=True, blank=True)
+
+
+REGISTRATION_COUNTER_TYPES = (
+    ('r', 'Registration type'),
+    ('a', 'Additional option'),
+    ('d', 'Discount code'),
+    ('b', 'Prepaid batch'),
+)
+
+
+class RegistrationCounter(models.Model):
+    # Number of registrations in each state per registration type,
+    # additional option, discount code and prepaid voucher batch, maintained
+    # by database triggers whenever something they count changes, so they
+    # don't have to be counted on every use. The counts are the same ones as
+    # the registration dashboard shows, and are verified and corrected by the
+    # confreg_reconcile_counters job. No foreign key in the database for the
+    # same reason as ConferenceContentVersion.
+    conference = models.ForeignKey(Conference, null=False, blank=False, on_delete=models.CASCADE, db_constraint=False)
+    countertype = models.CharField(max_length=1, null=False, blank=False, choices=REGISTRATION_COUNTER_TYPES)
+    objectid = models.IntegerField(null=False, blank=False)
+    # Registrations, or vouchers for a prepaid batch
+    total = models.IntegerField(null=False, blank=False, default=0)
+    # Registrations with confirmed payment, including canceled ones
+    confirmed = models.IntegerField(null=False, blank=False, default=0)
+    canceled = models.IntegerField(null=False, blank=False, default=0)
+    # Unconfirmed registrations with or without an invoice
+    invoiced = models.IntegerField(null=False, blank=False, default=0)
+    unconfirmed = models.IntegerField(null=False, blank=False, default=0)
+    # Confirmed registrations that have not confirmed the policy
+    nopolicy = models.IntegerField(null=False, blank=False, default=0)
+    # Unpaid additional orders for an additional option
+    pendinginvoiced = models.IntegerField(null=False, blank=False, default=0)
+    pendingunconfirmed = models.IntegerField(null=False, blank=False, default=0)
+    # Vouchers of a prepaid batch that have been used
+    used = models.IntegerField(null=False, blank=False, default=0)
+
+    class Meta:
+        unique_together = (
+            ('countertype', 'objectid'),
+        )
+
+
 class Track(models.Model):
     conference = models.ForeignKey(Conference, null=False, blank=False, on_delete=models.CASCADE)
     trackname = models.CharField(max_length=100, null=False, blank=False, verbose_name="Track name")
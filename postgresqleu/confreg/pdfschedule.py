@@ -16,11 +16,9 @@ from reportlab.lib import colors
 from reportlab.platypus import Table, TableStyle, Paragraph
 from reportlab.lib.styles import ParagraphStyle
 from reportlab.lib.pagesizes import A3, A4, LETTER, landscape
-from reportlab.pdfbase.pdfmetrics import registerFont
-from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.lib.styles import getSampleStyleSheet
 
-from postgresqleu.util.reporttools import cm, mm
+from postgresqleu.util.reporttools import cm, mm, register_fonts
 
 from postgresqleu.confreg.models import Room, Track, RegistrationDay, ConferenceSession
 from postgresqleu.confreg.util import get_authenticated_conference
@@ -46,8 +44,7 @@ def _get_pagesize(size, orient):
 def _setup_canvas(pagesize, orientation):
     resp = HttpResponse(content_type='application/pdf')
 
-    for font, fontfile in settings.REGISTER_FONTS:
-        registerFont(TTFont(font, fontfile))
+    register_fonts(settings.REGISTER_FONTS)
 
     ps = _get_pagesize(pagesize, orientation)
     (width, height) = ps
@@ -1,4 +1,4 @@
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.conf import settings
 from django.contrib import messages
@@ -13,10 +13,11 @@ from reportlab.lib.styles import getSampleStyleSheet
 import csv
 from datetime import datetime
 import json
+import textwrap
 
 from .jinjapdf import render_jinja_badges
 
-from postgresqleu.util.db import exec_to_dict, exec_to_single_list
+from postgresqleu.util.db import exec_to_dict, exec_to_dict_iterator, exec_to_single_list
 from postgresqleu.util.db import ensure_conference_timezone
 from postgresqleu.countries.models import Country
 from .models import ConferenceRegistration, RegistrationType, ConferenceAdditionalOption, ShirtSize
@@ -313,6 +314,11 @@ class ReportSpeakerFilter(object):
 
 
 class ReportWriterBase(object):
+    # Streaming writers get an iterator of rows, that are written out
+    # as they are fetched from the database. All other writers get all
+    # the rows collected in a list before rendering.
+    streaming = False
+
     def __init__(self, request, conference, title, borders):
         self.request = request
         self.conference = conference
@@ -323,8 +329,11 @@ class ReportWriterBase(object):
     def set_headers(self, headers):
         self.headers = headers
 
-    def add_row(self, row):
-        self.rows.append(row)
+    def set_rows(self, rows):
+        if self.streaming:
+            self.rows = rows
+        else:
+            self.rows = list(rows)
 
 
 class ReportWriterHtml(ReportWriterBase):
@@ -340,14 +349,30 @@ class ReportWriterHtml(ReportWriterBase):
         })
 
 
+class _EchoBuffer(object):
+    # File-like object for csv.writer that just hands back whatever is
+    # written to it, so it can be passed on to a streaming response.
+    def write(self, value):
+        return value
+
+
 class ReportWriterCsv(ReportWriterBase):
+    streaming = True
+
     def render(self):
-        resp = HttpResponse(content_type='text/plain; charset=utf-8')
-        c = csv.writer(resp, delimiter=';')
-        for r in self.rows:
-            c.writerow(r)
+        c = csv.writer(_EchoBuffer(), delimiter=';')
+        return StreamingHttpResponse((c.writerow(r) for r in self.rows), content_type='text/plain; charset=utf-8')
 
-        return resp
+
+def _stream_json_list(rows):
+    # Generate the same output as json.dump() with indent=2 would for the
+    # list of all rows, without ever having the full list.
+    first = True
+    yield '['
+    for r in rows:
+        yield ('\n' if first else ',\n') + textwrap.indent(json.dumps(r, indent=2), '  ')
+        first = False
+    yield ']' if first else '\n]'
 
 
 class ReportWriterPdf(ReportWriterBase):
@@ -605,8 +630,12 @@ WHERE r.conference_id=%(conference_id)s {}
 GROUP BY r.id, conference.id, rt.id, rc.id, country.iso, s.id
 ORDER BY {}""".format(settings.SITEBASE, settings.SITEBASE, where, ", ".join([_get_table_aliased_field(o.get_orderby_field()) for o in ofields]))
 
-        with ensure_conference_timezone(self.conference):
-            result = exec_to_dict(query, params)
+        if format in ('csv', 'json'):
+            # These formats are streamed straight from the database
+            result = self._stream_report_query(query, params)
+        else:
+            with ensure_conference_timezone(self.conference):
+                result = exec_to_dict(query, params)
 
         if format == 'html':
             writer = ReportWriterHtml(request, self.conference, title, borders)
@@ -616,13 +645,11 @@ ORDER BY {}""".format(settings.SITEBASE, settings.SITEBASE, where, ", ".join([_g
         elif format == 'csv':
             writer = ReportWriterCsv(request, self.conference, title, borders)
         elif format == 'json':
-            resp = HttpResponse(content_type='application/json')
-            json.dump(result, resp, indent=2)
-            return resp
+            return StreamingHttpResponse(_stream_json_list(result), content_type='application/json')
         elif format == 'badge':
             try:
                 resp = HttpResponse(content_type='application/pdf')
-                render_jinja_badges(self.conference, settings.REGISTER_FONTS, result, resp, borders, pagebreaks, orientation, pagesize)
+                render_jinja_badges(self.conference, settings.REGISTER_FONTS, result, resp, borders, pagebreaks, orientation, pagesize, jobs=settings.BADGE_RENDER_JOBS)
                 return resp
             except Exception as e:
                 return HttpResponse("Exception occured: %s" % e, content_type='text/plain')
@@ -634,13 +661,22 @@ ORDER BY {}""".format(settings.SITEBASE, settings.SITEBASE, where, ", ".join([_g
             allheaders.extend(extracols)
         writer.set_headers(allheaders)
 
-        for r in result:
-            row = [self.fieldmap[f].get_value(r[f]) for f in fields]
-            row.extend([[]] * len(extracols))
-            writer.add_row(row)
+        def _rows():
+            for r in result:
+                row = [self.fieldmap[f].get_value(r[f]) for f in fields]
+                row.extend([[]] * len(extracols))
+                yield row
 
+        writer.set_rows(_rows())
         return writer.render()
 
+    def _stream_report_query(self, query, params):
+        # Streamed rows are fetched while the response is being sent, after
+        # the view has returned, so the timezone has to be set for as long
+        # as the iteration runs.
+        with ensure_conference_timezone(self.conference):
+            yield from exec_to_dict_iterator(query, params)
+
 
 #
 # Simple conference reports - basically, just queries and sometimes mapped with a form
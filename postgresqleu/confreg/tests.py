@@ -0,0 +1,98 @@
+from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.utils import timezone
+
+import datetime
+
+from postgresqleu.confreg.models import Conference, ConferenceSeries
+from postgresqleu.confreg.models import MessagingProvider, ConferenceMessaging
+from postgresqleu.confreg.models import ConferenceTweetQueue
+from postgresqleu.confreg.models import RegistrationClass, RegistrationType, ConferenceRegistration
+from postgresqleu.confreg.models import AttendeeMail
+from postgresqleu.mailqueue.models import QueuedMail, QueuedMailBody
+
+
+class TweetQueueBulkAssignTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        series = ConferenceSeries.objects.create(name='Test series')
+        cls.conference = Conference.objects.create(
+            conferencename='Test conference',
+            urlname='testconf',
+            series=series,
+            startdate=datetime.date(2030, 1, 1),
+            enddate=datetime.date(2030, 1, 2),
+        )
+        cls.provider = MessagingProvider.objects.create(
+            internalname='test',
+            publicname='Test',
+            classname='postgresqleu.util.messaging.mastodon.Mastodon',
+            active=True,
+        )
+        ConferenceMessaging.objects.create(conference=cls.conference, provider=cls.provider, broadcast=True)
+
+    def test_bulk_approve_sets_remaining(self):
+        post = ConferenceTweetQueue(conference=self.conference, author=self.admin, contents='Test post')
+        post.save()
+        self.assertFalse(post.remainingtosend.exists())
+
+        self.client.force_login(self.admin)
+        r = self.client.post('/events/admin/testconf/tweet/queue/', {
+            'operation': 'assign',
+            'what': 'approved',
+            'assignid': '1',
+            'idlist': str(post.id),
+        })
+        self.assertLess(r.status_code, 400)
+
+        post.refresh_from_db()
+        self.assertTrue(post.approved)
+        self.assertEqual(list(post.remainingtosend.all()), [self.provider])
+
+
+class AttendeeMailTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        series = ConferenceSeries.objects.create(name='Test series')
+        cls.conference = Conference.objects.create(
+            conferencename='Test conference',
+            urlname='testconf',
+            series=series,
+            startdate=datetime.date(2030, 1, 1),
+            enddate=datetime.date(2030, 1, 2),
+            contactaddr='contact@example.com',
+        )
+        cls.regclass = RegistrationClass.objects.create(conference=cls.conference, regclass='Attendee')
+        regtype = RegistrationType.objects.create(conference=cls.conference, regtype='Attendee', regclass=cls.regclass)
+        registrator = User.objects.create_user('registrator', 'registrator@example.com', 'registrator')
+        ConferenceRegistration.objects.bulk_create([
+            ConferenceRegistration(
+                conference=cls.conference,
+                regtype=regtype,
+                registrator=registrator,
+                firstname='Attendee',
+                lastname=str(i),
+                email='attendee{}@example.com'.format(i),
+                created=timezone.now(),
+                regtoken='{:064}'.format(i),
+                idtoken='{:064}'.format(i),
+                publictoken='{:064}'.format(i),
+                payconfirmedat=timezone.now(),
+            )
+            for i in range(50)
+        ])
+
+    def test_attendee_mail_shares_body(self):
+        mail = AttendeeMail.objects.create(conference=self.conference, subject='Test', message='Hello attendees')
+        mail.regclasses.add(self.regclass)
+
+        call_command('confreg_send_emails')
+
+        mail.refresh_from_db()
+        self.assertTrue(mail.sent)
+        self.assertEqual(QueuedMail.objects.count(), 50)
+        self.assertEqual(QueuedMailBody.objects.count(), 1)
+        m = QueuedMail.objects.get(receiver='attendee7@example.com')
+        self.assertIn('To: Attendee 7 <attendee7@example.com>\n', m.fullmsg)
@@ -14,9 +14,10 @@ import urllib.parse
 from io import BytesIO
 import re
 
-from postgresqleu.mailqueue.util import send_simple_mail
+from postgresqleu.mailqueue.util import send_simple_mail, send_bulk_mail
 from postgresqleu.util.middleware import RedirectException
 from postgresqleu.util.time import today_conference
+from postgresqleu.util.db import exec_to_list, exec_no_result, exec_to_scalar
 from postgresqleu.util.messaging.util import send_org_notification
 from postgresqleu.confreg.jinjafunc import JINJA_TEMPLATE_ROOT, render_jinja_conference_template, render_jinja_conference_response
 from postgresqleu.confreg.jinjapdf import render_jinja_ticket
@@ -59,6 +60,25 @@ def send_conference_mail(conference, receiver, subject, templatename, templateat
                      )
 
 
+#
+# Send the same email using a conference template to many receivers, given
+# in the same format as for send_bulk_mail(). The template is only rendered
+# once, so it cannot contain anything specific to the receiver.
+#
+def send_conference_bulk_mail(conference, receivers, subject, templatename, templateattr={}, attachments=None, sender=None, sendername=None, sendat=None):
+    if not ((conference and conference.jinjaenabled and conference.jinjadir) or os.path.exists(os.path.join(JINJA_TEMPLATE_ROOT, templatename))):
+        raise Exception("Mail template not found")
+
+    return send_bulk_mail(sender or conference.contactaddr,
+                          receivers,
+                          "[{0}] {1}".format(conference.conferencename, subject),
+                          render_jinja_conference_template(conference, templatename, templateattr),
+                          attachments,
+                          sendername or conference.conferencename,
+                          sendat=sendat,
+                          )
+
+
 def send_conference_simple_mail(conference, receiver, subject, message, attachments=None, bcc=None, receivername=None, sender=None, sendername=None, sendat=None):
     send_simple_mail(sender or conference.contactaddr,
                      receiver,
@@ -72,6 +92,17 @@ def send_conference_simple_mail(conference, receiver, subject, message, attachme
                      )
 
 
+def send_conference_simple_bulk_mail(conference, receivers, subject, message, attachments=None, sender=None, sendername=None, sendat=None):
+    return send_bulk_mail(sender or conference.contactaddr,
+                          receivers,
+                          "[{0}] {1}".format(conference.conferencename, subject),
+                          message,
+                          attachments,
+                          sendername or conference.conferencename,
+                          sendat=sendat,
+                          )
+
+
 class InvoicerowsException(Exception):
     pass
 
@@ -505,6 +536,65 @@ def activate_conference_timezone(conference):
     timezone.activate(conference.tzname)
 
 
+def get_conference_content_version(conference, content):
+    # Get the current version of some published content of the conference,
+    # and the time it was last modified, as maintained by triggers in the
+    # database. The last modified time is never earlier than the last change
+    # to the conference itself, since that can also affect the content.
+    r = exec_to_list("SELECT {0}, {0}_modified FROM confreg_conferencecontentversion WHERE conference_id=%(confid)s".format(content), {
+        'confid': conference.id,
+    })
+    if r:
+        return (r[0][0], max(r[0][1] or conference.lastmodified, conference.lastmodified))
+    return (0, conference.lastmodified)
+
+
+# Columns of the registration counters, in the order the
+# confreg_registrationcounters() database function returns them.
+REGISTRATION_COUNTER_COLUMNS = ['total', 'confirmed', 'canceled', 'invoiced', 'unconfirmed', 'nopolicy', 'pendinginvoiced', 'pendingunconfirmed', 'used']
+
+
+def reconcile_registration_counters(conference):
+    # Compare the registration counters of a conference, as maintained by
+    # triggers, with a full count, and correct any that differ. Returns the
+    # number of counters that had to be corrected, which should always be
+    # zero. Must be called in a transaction.
+    #
+    # Lock out changes to the counters while we run, so an update made by a
+    # concurrent transaction can't be overwritten by an older count.
+    exec_no_result("LOCK TABLE confreg_registrationcounter IN SHARE ROW EXCLUSIVE MODE")
+    return exec_to_scalar("""WITH expected AS (
+ SELECT * FROM confreg_registrationcounters(%(confid)s)
+),
+deleted AS (
+ DELETE FROM confreg_registrationcounter c
+ WHERE c.conference_id=%(confid)s AND NOT EXISTS (
+  SELECT 1 FROM expected e WHERE e.countertype=c.countertype AND e.objectid=c.objectid
+ )
+ RETURNING ({columns}) != ({zeros}) AS changed
+),
+updated AS (
+ INSERT INTO confreg_registrationcounter (conference_id, countertype, objectid, {columns})
+ SELECT %(confid)s, e.countertype, e.objectid, {ecolumns}
+ FROM expected e
+ WHERE NOT EXISTS (
+  SELECT 1 FROM confreg_registrationcounter c
+  WHERE c.countertype=e.countertype AND c.objectid=e.objectid AND ({ccolumns}) = ({ecolumns})
+ )
+ ON CONFLICT (countertype, objectid) DO UPDATE SET {excluded}
+ RETURNING 1
+)
+SELECT (SELECT count(*) FROM deleted WHERE changed) + (SELECT count(*) FROM updated)""".format(
+        columns=", ".join(REGISTRATION_COUNTER_COLUMNS),
+        zeros=", ".join('0' for c in REGISTRATION_COUNTER_COLUMNS),
+        ecolumns=", ".join("e.{}".format(c) for c in REGISTRATION_COUNTER_COLUMNS),
+        ccolumns=", ".join("c.{}".format(c) for c in REGISTRATION_COUNTER_COLUMNS),
+        excluded=", ".join("{0}=excluded.{0}".format(c) for c in REGISTRATION_COUNTER_COLUMNS),
+    ), {
+        'confid': conference.id,
+    })
+
+
 def send_conference_notification(conference, subject, message):
     if conference.notifyaddr:
         send_simple_mail(conference.notifyaddr,
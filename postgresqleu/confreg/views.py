@@ -10,7 +10,8 @@ from django.contrib.auth.models import User
 from django.contrib import messages
 from django.conf import settings
 from django.db import transaction, connection
-from django.db.models import Q, Count, Avg, Prefetch
+from django.db.models import Q, Avg, Prefetch, Subquery, OuterRef
+from django.db.models.functions import Coalesce
 from django.db.models.expressions import F
 from django.forms import ValidationError
 from django.utils import timezone
@@ -26,7 +27,7 @@ from .models import ConferenceFeedbackQuestion, ConferenceFeedbackAnswer
 from .models import RegistrationType, PrepaidVoucher, PrepaidBatch, RefundPattern
 from .models import BulkPayment, Room, Track, ConferenceSessionScheduleSlot
 from .models import AttendeeMail, ConferenceAdditionalOption
-from .models import PendingAdditionalOrder
+from .models import PendingAdditionalOrder, RegistrationCounter
 from .models import RegistrationWaitlistEntry, RegistrationWaitlistHistory
 from .models import RegistrationTransferPending
 from .models import STATUS_CHOICES
@@ -58,11 +59,12 @@ from .jinjafunc import render_jinja_conference_template
 from .jinjafunc import render_jinja_conference_svg
 from .jinjapdf import render_jinja_ticket
 from .util import get_authenticated_conference, get_conference_or_404
+from .util import get_conference_content_version
 from .backendforms import CancelRegistrationForm, ConfirmRegistrationForm
 from .backendforms import ResendWelcomeMailForm, ResendAttachMailForm
 from .twitter import create_twitterpost_thumbnail
 
-from postgresqleu.util.request import get_int_or_error
+from postgresqleu.util.request import get_int_or_error, conditional_response
 from postgresqleu.util.random import generate_random_token
 from postgresqleu.util.time import today_conference
 from postgresqleu.util.messaging import get_messaging, ProviderCache
@@ -73,9 +75,9 @@ from postgresqleu.confsponsor.models import Sponsor, ScannedAttendee, PurchasedV
 from postgresqleu.confsponsor.invoicehandler import create_voucher_invoice, get_sponsor_invoice_address
 from postgresqleu.invoices.util import InvoiceManager, InvoicePresentationWrapper
 from postgresqleu.invoices.models import InvoiceProcessor
-from postgresqleu.mailqueue.util import send_simple_mail
+from postgresqleu.mailqueue.util import send_bulk_mail
 from postgresqleu.util.jsonutil import JsonSerializer
-from postgresqleu.util.db import exec_to_dict, exec_to_grouped_dict, exec_to_keyed_dict
+from postgresqleu.util.db import exec_to_dict, exec_to_grouped_dict, exec_to_grouped_dict_iterator, exec_to_keyed_dict
 from postgresqleu.util.db import exec_no_result, exec_to_list, exec_to_scalar, conditional_exec_to_scalar
 from postgresqleu.util.db import ensure_conference_timezone
 from postgresqleu.util.qr import generate_base64_qr
@@ -86,11 +88,13 @@ from operator import itemgetter
 from datetime import datetime, timedelta, date
 from collections import OrderedDict
 import base64
+import copy
 import re
 import os
 from Cryptodome.Hash import SHA256
 from io import StringIO
 import xml.etree.ElementTree as ET
+import threading
 
 import json
 import markdown
@@ -152,7 +156,8 @@ def _registration_dashboard(request, conference, reg, has_other_multiregs, redir
     # Also exclude any option that has a maxcount, and already has too
     # many registrations.
     optionsQ = Q(conference=conference, upsellable=True, public=True) & (Q(maxcount=0) | Q(num_regs__lt=F('maxcount'))) & ~Q(conferenceregistration=reg) & ~Q(mutually_exclusive__conferenceregistration=reg)
-    availableoptions = list(ConferenceAdditionalOption.objects.select_related('conference').annotate(num_regs=Count('conferenceregistration')).filter(optionsQ).order_by('sortkey', 'name'))
+    numregs = RegistrationCounter.objects.filter(countertype='a', objectid=OuterRef('pk')).values('total')
+    availableoptions = list(ConferenceAdditionalOption.objects.select_related('conference').annotate(num_regs=Coalesce(Subquery(numregs), 0)).filter(optionsQ).order_by('sortkey', 'name'))
     try:
         pendingadditional = PendingAdditionalOrder.objects.get(reg=reg, payconfirmedat__isnull=True)
         pendingadditionalinvoice = InvoicePresentationWrapper(pendingadditional.invoice, '.')
@@ -248,58 +253,76 @@ def news_json(request, confname):
     elif count > 20:
         count = 20
 
-    ret = {}
-    if 'news' in parts:
-        news = ConferenceNews.objects.select_related('author').filter(
-            conference=conference,
-            datetime__lt=timezone.now(),
-        )[:count]
-        ret['news'] = [{
-            'id': n.id,
-            'title': n.title,
-            'titleslug': slugify(n.title),
-            'datetime': timezone.localtime(n.datetime),
-            'authorname': n.author.fullname,
-            'summary': markdown.markdown(n.summary),
-            'inrss': n.inrss,
-            'url': '{}/events/{}/news/{}-{}/'.format(settings.SITEBASE, conference.urlname, slugify(n.title), n.id),
-        } for n in news]
-
-    if 'posts' in parts:
-        providers = ProviderCache()
-
-        # Only include posts that are sent to all associated accounts, otherwise we can end up generating invalid links.
-        posts = ConferenceTweetQueue.objects.defer('image', 'imagethumb').filter(
-            conference=conference,
-            approved=True,
-            sent=True,
-            datetime__lt=timezone.now(),
-        ).exclude(postids={}).extra(
-            select={'hasimage': "image is not null and image != ''"}
-        ).order_by('-datetime')[:count]
-
-        ret['posts'] = [{
-            'id': p.id,
-            'datetime': timezone.localtime(p.datetime),
-            'hasimage': p.hasimage,
-            'posts': [{
-                'type': providers.get_by_id(providerid).typename,
-                'provider': providerid,
-                'text': p.contents[str(providerid)] if isinstance(p.contents, dict) else p.contents,
-                'link': providers.get_by_id(providerid).get_link(postid)[1],
-            } for postid, providerid in p.postids.items()]
-        } for p in posts]
-
-    # Special case for legacy compatibility, returns news as top level object
-    if 'include' not in request.GET:
-        r = HttpResponse(json.dumps(
-            ret['news'],
-            cls=JsonSerializer), content_type='application/json')
-    else:
-        r = HttpResponse(json.dumps(
-            ret,
-            cls=JsonSerializer), content_type='application/json')
+    # News and posts can be scheduled in the future, so apart from the
+    # content version we need to know the latest one that's visible now.
+    version, modified = get_conference_content_version(conference, 'news')
+    latest = exec_to_scalar("""SELECT max(datetime) FROM (
+ SELECT max(datetime) AS datetime FROM confreg_conferencenews WHERE conference_id=%(confid)s AND datetime < CURRENT_TIMESTAMP
+ UNION ALL
+ SELECT max(datetime) FROM confreg_conferencetweetqueue WHERE conference_id=%(confid)s AND approved AND sent AND datetime < CURRENT_TIMESTAMP
+) x""", {
+        'confid': conference.id,
+    })
 
+    def _render():
+        ret = {}
+        if 'news' in parts:
+            news = ConferenceNews.objects.select_related('author').filter(
+                conference=conference,
+                datetime__lt=timezone.now(),
+            )[:count]
+            ret['news'] = [{
+                'id': n.id,
+                'title': n.title,
+                'titleslug': slugify(n.title),
+                'datetime': timezone.localtime(n.datetime),
+                'authorname': n.author.fullname,
+                'summary': markdown.markdown(n.summary),
+                'inrss': n.inrss,
+                'url': '{}/events/{}/news/{}-{}/'.format(settings.SITEBASE, conference.urlname, slugify(n.title), n.id),
+            } for n in news]
+
+        if 'posts' in parts:
+            providers = ProviderCache()
+
+            # Only include posts that are sent to all associated accounts, otherwise we can end up generating invalid links.
+            posts = ConferenceTweetQueue.objects.defer('image', 'imagethumb').filter(
+                conference=conference,
+                approved=True,
+                sent=True,
+                datetime__lt=timezone.now(),
+            ).exclude(postids={}).extra(
+                select={'hasimage': "image is not null and image != ''"}
+            ).order_by('-datetime')[:count]
+
+            ret['posts'] = [{
+                'id': p.id,
+                'datetime': timezone.localtime(p.datetime),
+                'hasimage': p.hasimage,
+                'posts': [{
+                    'type': providers.get_by_id(providerid).typename,
+                    'provider': providerid,
+                    'text': p.contents[str(providerid)] if isinstance(p.contents, dict) else p.contents,
+                    'link': providers.get_by_id(providerid).get_link(postid)[1],
+                } for postid, providerid in p.postids.items()]
+            } for p in posts]
+
+        # Special case for legacy compatibility, returns news as top level object
+        if 'include' not in request.GET:
+            return HttpResponse(json.dumps(
+                ret['news'],
+                cls=JsonSerializer), content_type='application/json')
+        else:
+            return HttpResponse(json.dumps(
+                ret,
+                cls=JsonSerializer), content_type='application/json')
+
+    r = conditional_response(
+        request,
+        (conference.id, conference.urlname, conference.tzname, version, latest, parts, count, 'include' in request.GET),
+        max(modified, latest or modified),
+        _render,
+    )
     r['Access-Control-Allow-Origin'] = '*'
     return r
 
@@ -961,7 +984,7 @@ def reg_add_options(request, confname, whatfor=None):
     # Check the count on each option (yes, this is inefficient, but who cares)
     for o in options:
         if o.maxcount > 0:
-            if o.conferenceregistration_set.count() + o.pendingadditionalorder_set.filter(payconfirmedat__isnull=True).count() >= o.maxcount:
+            if o.used_count >= o.maxcount:
                 messages.warning(request, "Option '{0}' is sold out.".format(o.name))
                 return HttpResponseRedirect('../')
 
@@ -1296,7 +1319,7 @@ class SessionSet(object):
                 yield s
 
 
-def _scheduledata(request, conference):
+def _build_scheduledata(conference):
     with ensure_conference_timezone(conference):
         tracks = exec_to_dict("SELECT id, color, fgcolor, incfp, trackname, sortkey, showcompany FROM confreg_track t WHERE conference_id=%(confid)s AND EXISTS (SELECT 1 FROM confreg_conferencesession s WHERE s.conference_id=%(confid)s AND s.track_id=t.id AND (s.status=1{}) AND s.track_id IS NOT NULL) ORDER BY sortkey".format(" or s.status=3" if conference.tbdinschedule else ''), {
             'confid': conference.id,
@@ -1321,7 +1344,7 @@ INNER JOIN confreg_room r ON r.id=t.room_id GROUP BY day
             'confid': conference.id,
         })
 
-        raw = exec_to_grouped_dict("""SELECT
+        raw = exec_to_grouped_dict_iterator("""SELECT
     s.starttime::date AS day,
     s.id,
     s.id as sessionid,
@@ -1371,28 +1394,30 @@ ORDER BY day, s.starttime, r.sortkey""".format(
             'confid': conference.id,
         })
 
-    days = []
-    roomsinuse = set()
-    for d, sessions in list(raw.items()):
-        if d not in day_rooms:
-            # This day has no rooms. This can happen if *all* sessions for the day are cross-schedule.
-            # It cannot happen if there are no sessions at all, because then they simply wouldn't
-            # be included in the raw result.
-            # For now, just ignore days that have only cross-schedule entries, to avoid crashing.
-            continue
-        roomsinuse |= set(day_rooms[d]['rooms'])
-
-        sessionset = SessionSet(allrooms, day_rooms[d]['rooms'],
-                                conference.schedulewidth, conference.pixelsperminute,
-                                conference.feedbackopen,
-                                sessions)
-        days.append({
-            'day': d,
-            'sessions': list(sessionset.all()),
-            'rooms': sessionset.allrooms(),
-            'schedule_height': sessionset.schedule_height(),
-            'schedule_width': sessionset.schedule_width(),
-        })
+        # The rows are fetched as we go, so this needs to be done while the
+        # conference timezone is still set.
+        days = []
+        roomsinuse = set()
+        for d, sessions in raw:
+            if d not in day_rooms:
+                # This day has no rooms. This can happen if *all* sessions for the day are cross-schedule.
+                # It cannot happen if there are no sessions at all, because then they simply wouldn't
+                # be included in the raw result.
+                # For now, just ignore days that have only cross-schedule entries, to avoid crashing.
+                continue
+            roomsinuse |= set(day_rooms[d]['rooms'])
+
+            sessionset = SessionSet(allrooms, day_rooms[d]['rooms'],
+                                    conference.schedulewidth, conference.pixelsperminute,
+                                    conference.feedbackopen,
+                                    sessions)
+            days.append({
+                'day': d,
+                'sessions': list(sessionset.all()),
+                'rooms': sessionset.allrooms(),
+                'schedule_height': sessionset.schedule_height(),
+                'schedule_width': sessionset.schedule_width(),
+            })
 
     return {
         'days': days,
@@ -1401,6 +1426,107 @@ ORDER BY day, s.starttime, r.sortkey""".format(
     }
 
 
+def _build_schedule_sessions(conference):
+    # Flat list of all published sessions, used for the calendar feeds
+    return exec_to_dict("""SELECT
+    s.id,
+    s.title,
+    s.abstract,
+    s.starttime,
+    s.endtime,
+    s.lastmodified,
+    s.cross_schedule,
+    s.can_feedback,
+    r.roomname,
+    t.trackname,
+    COALESCE(json_agg(json_build_object(
+       'id', spk.id,
+       'name', spk.fullname
+    ) ORDER BY spk.fullname) FILTER (WHERE spk.id IS NOT NULL), '[]') AS speakers
+FROM confreg_conferencesession s
+INNER JOIN confreg_track t ON t.id=s.track_id
+LEFT JOIN confreg_room r ON r.id=s.room_id
+LEFT JOIN confreg_conferencesession_speaker css ON css.conferencesession_id=s.id
+LEFT JOIN confreg_speaker spk ON spk.id=css.speaker_id
+WHERE s.conference_id=%(confid)s AND s.status=1 AND s.starttime IS NOT NULL
+GROUP BY s.id, t.id, r.id
+ORDER BY s.starttime, s.cross_schedule, r.sortkey""", {
+        'confid': conference.id,
+    })
+
+
+# Building the schedule is expensive, so a snapshot of it is kept per
+# conference and used for all the different schedule formats. Snapshots
+# are keyed on the schedule content version, which is bumped by triggers
+# in the database whenever anything that's shown on the schedule changes,
+# as well as on the conference settings that affect the output.
+SCHEDULE_CACHE_SIZE = 100
+_schedule_cache = OrderedDict()
+_schedule_cache_lock = threading.Lock()
+
+
+def _schedule_cache_key(conference, version):
+    return (
+        conference.id,
+        version,
+        conference.urlname,
+        conference.conferencename,
+        conference.startdate,
+        conference.enddate,
+        conference.tzname,
+        conference.scheduleactive,
+        conference.tbdinschedule,
+        conference.schedulewidth,
+        conference.pixelsperminute,
+        conference.feedbackopen,
+    )
+
+
+def _get_schedule_snapshot(conference, key=None):
+    if key is None:
+        key = _schedule_cache_key(conference, get_conference_content_version(conference, 'schedule')[0])
+    now = timezone.now()
+    with _schedule_cache_lock:
+        snapshot = _schedule_cache.get(conference.id, None)
+        if snapshot and snapshot['key'] == key and (snapshot['validuntil'] is None or snapshot['validuntil'] > now):
+            _schedule_cache.move_to_end(conference.id)
+            return snapshot
+
+    sessions = _build_schedule_sessions(conference)
+    snapshot = {
+        'key': key,
+        'scheduledata': _build_scheduledata(conference),
+        'sessions': sessions,
+        # Which sessions can be given feedback on depends on the time they
+        # start, so if feedback is open the snapshot is only valid until
+        # the next session starts.
+        'validuntil': min((s['starttime'] for s in sessions if s['can_feedback'] and s['starttime'] > now), default=None) if conference.feedbackopen else None,
+    }
+    with _schedule_cache_lock:
+        _schedule_cache[conference.id] = snapshot
+        _schedule_cache.move_to_end(conference.id)
+        while len(_schedule_cache) > SCHEDULE_CACHE_SIZE:
+            _schedule_cache.popitem(last=False)
+    return snapshot
+
+
+def _scheduledata(request, conference):
+    # The snapshot is shared between requests, so hand out a copy in case
+    # a template decides to modify it.
+    return copy.deepcopy(_get_schedule_snapshot(conference)['scheduledata'])
+
+
+def _schedule_feed_response(request, conference, renderfunc):
+    # Return the schedule in one of the feed formats, as rendered by
+    # renderfunc from the snapshot, or a 304 if the client already has
+    # the current version. The feeds don't depend on when feedback can
+    # be given, so this can be decided from the content version without
+    # even looking at the snapshot.
+    version, modified = get_conference_content_version(conference, 'schedule')
+    key = _schedule_cache_key(conference, version)
+    return conditional_response(request, key, modified, lambda: renderfunc(_get_schedule_snapshot(conference, key)))
+
+
 def schedule(request, confname):
     conference = get_conference_or_404(confname)
 
@@ -1501,10 +1627,21 @@ def schedule_favorite(request, confname):
 def schedulejson(request, confname):
     conference = get_authenticated_conference(request, confname)
 
-    return HttpResponse(json.dumps(_scheduledata(request, conference),
-                                   cls=JsonSerializer,
-                                   indent=2),
-                        content_type='application/json')
+    version, modified = get_conference_content_version(conference, 'schedule')
+    key = etagparts = _schedule_cache_key(conference, version)
+    if conference.feedbackopen:
+        # Unlike the feeds, the json data includes which sessions can be
+        # given feedback on, which changes over time without the content
+        # version changing. So use the snapshot to tell, and don't even
+        # try to figure out a last modified time.
+        etagparts = (key, _get_schedule_snapshot(conference, key)['validuntil'])
+        modified = None
+
+    return conditional_response(request, etagparts, modified, lambda: HttpResponse(
+        json.dumps(_get_schedule_snapshot(conference, key)['scheduledata'],
+                   cls=JsonSerializer,
+                   indent=2),
+        content_type='application/json'))
 
 
 def sessionlist(request, confname):
@@ -1526,18 +1663,21 @@ def sessionlist(request, confname):
 def schedule_ical(request, confname):
     conference = get_conference_or_404(confname)
 
-    if not conference.scheduleactive:
-        # Not open. But we can't really render an error, so render a
-        # completely empty session list instead
-        sessions = None
-    else:
-        sessions = ConferenceSession.objects.filter(conference=conference).filter(cross_schedule=False).filter(status=1).filter(starttime__isnull=False).filter(track__isnull=False).order_by('starttime')
-    resp = render(request, 'confreg/schedule.ical', {
-        'conference': conference,
-        'sessions': sessions,
-    }, content_type='text/calendar')
-    resp['Content-Disposition'] = 'attachment; filename="{}.ical"'.format(conference.urlname)
-    return resp
+    def _render(snapshot):
+        if not conference.scheduleactive:
+            # Not open. But we can't really render an error, so render a
+            # completely empty session list instead
+            sessions = None
+        else:
+            sessions = [s for s in snapshot['sessions'] if not s['cross_schedule']]
+        resp = render(request, 'confreg/schedule.ical', {
+            'conference': conference,
+            'sessions': sessions,
+        }, content_type='text/calendar')
+        resp['Content-Disposition'] = 'attachment; filename="{}.ical"'.format(conference.urlname)
+        return resp
+
+    return _schedule_feed_response(request, conference, _render)
 
 
 def schedule_xcal(request, confname):
@@ -1545,30 +1685,36 @@ def schedule_xcal(request, confname):
 
     if not conference.scheduleactive:
         raise Http404()
-    x = ET.Element('iCalendar')
-    v = ET.SubElement(x, 'vcalendar')
-    ET.SubElement(v, 'version').text = '2.0'
-    ET.SubElement(v, 'prodid').text = '//pgeusys//Schedule 1.0//EN'
-    ET.SubElement(v, 'x-wr-caldesc')
-    ET.SubElement(v, 'x-wr-calname').text = 'Schedule for {0}'.format(conference.conferencename)
-    for sess in ConferenceSession.objects.filter(conference=conference).filter(cross_schedule=False).filter(status=1).filter(starttime__isnull=False).filter(track__isnull=False).order_by('starttime'):
-        s = ET.SubElement(v, 'vevent')
-        ET.SubElement(s, 'method').text = 'PUBLISH'
-        ET.SubElement(s, 'uid').text = '{0}@{1}'.format(sess.id, conference.urlname)
-        ET.SubElement(s, 'dtstart').text = sess.starttime.strftime('%Y%m%dT%H%M%SZ')
-        ET.SubElement(s, 'dtend').text = sess.endtime.strftime('%Y%m%dT%H%M%SZ')
-        ET.SubElement(s, 'summary').text = sess.title
-        ET.SubElement(s, 'description').text = sess.abstract
-        ET.SubElement(s, 'class').text = 'PUBLIC'
-        ET.SubElement(s, 'status').text = 'CONFIRMED'
-        ET.SubElement(s, 'url').text = '{0}/events/{1}/schedule/session/{2}/'.format(settings.SITEBASE, conference.urlname, sess.id)
-        ET.SubElement(s, 'location').text = sess.room and sess.room.roomname or ''
-        for spk in sess.speaker.all():
-            ET.SubElement(s, 'attendee').text = spk.name
-    resp = HttpResponse(content_type='text/xml; charset=utf-8')
-    ET.ElementTree(x).write(resp, encoding='utf-8', xml_declaration=True)
-    resp['Content-Disposition'] = 'attachment; filename="{}.xcs"'.format(conference.urlname)
-    return resp
+
+    def _render(snapshot):
+        x = ET.Element('iCalendar')
+        v = ET.SubElement(x, 'vcalendar')
+        ET.SubElement(v, 'version').text = '2.0'
+        ET.SubElement(v, 'prodid').text = '//pgeusys//Schedule 1.0//EN'
+        ET.SubElement(v, 'x-wr-caldesc')
+        ET.SubElement(v, 'x-wr-calname').text = 'Schedule for {0}'.format(conference.conferencename)
+        for sess in snapshot['sessions']:
+            if sess['cross_schedule']:
+                continue
+            s = ET.SubElement(v, 'vevent')
+            ET.SubElement(s, 'method').text = 'PUBLISH'
+            ET.SubElement(s, 'uid').text = '{0}@{1}'.format(sess['id'], conference.urlname)
+            ET.SubElement(s, 'dtstart').text = sess['starttime'].strftime('%Y%m%dT%H%M%SZ')
+            ET.SubElement(s, 'dtend').text = sess['endtime'].strftime('%Y%m%dT%H%M%SZ')
+            ET.SubElement(s, 'summary').text = sess['title']
+            ET.SubElement(s, 'description').text = sess['abstract']
+            ET.SubElement(s, 'class').text = 'PUBLIC'
+            ET.SubElement(s, 'status').text = 'CONFIRMED'
+            ET.SubElement(s, 'url').text = '{0}/events/{1}/schedule/session/{2}/'.format(settings.SITEBASE, conference.urlname, sess['id'])
+            ET.SubElement(s, 'location').text = sess['roomname'] or ''
+            for spk in sess['speakers']:
+                ET.SubElement(s, 'attendee').text = spk['name']
+        resp = HttpResponse(content_type='text/xml; charset=utf-8')
+        ET.ElementTree(x).write(resp, encoding='utf-8', xml_declaration=True)
+        resp['Content-Disposition'] = 'attachment; filename="{}.xcs"'.format(conference.urlname)
+        return resp
+
+    return _schedule_feed_response(request, conference, _render)
 
 
 def _timedelta_minutes(td):
@@ -1582,43 +1728,46 @@ def schedule_xml(request, confname):
 
     if not conference.scheduleactive:
         raise Http404()
-    x = ET.Element('schedule')
-    ET.SubElement(x, 'version').text = 'Firefly'
-    c = ET.SubElement(x, 'conference')
-    ET.SubElement(c, 'title').text = conference.conferencename
-    ET.SubElement(c, 'start').text = conference.startdate.strftime("%Y-%m-%d")
-    ET.SubElement(c, 'end').text = conference.enddate.strftime("%Y-%m-%d")
-    ET.SubElement(c, 'days').text = str((conference.enddate - conference.startdate).days + 1)
-    ET.SubElement(c, 'baseurl').text = '{0}/events/{1}/schedule/'.format(settings.SITEBASE, conference.urlname)
-
-    lastday = None
-    lastroom = None
-    for sess in ConferenceSession.objects.filter(conference=conference).filter(status=1).filter(starttime__isnull=False).filter(track__isnull=False).order_by('starttime', 'cross_schedule', 'room__sortkey'):
-        if lastday != timezone.localdate(sess.starttime):
-            lastday = timezone.localdate(sess.starttime)
-            lastroom = None
-            xday = ET.SubElement(x, 'day', date=lastday.strftime("%Y-%m-%d"))  # START/END!
-        thisroom = sess.cross_schedule and 'Other' or sess.room.roomname
-        if lastroom != thisroom:
-            lastroom = thisroom
-            xroom = ET.SubElement(xday, 'room', name=lastroom)
-        e = ET.SubElement(xroom, 'event', id=str(sess.id))
-        ET.SubElement(e, 'start').text = timezone.localtime(sess.starttime).strftime('%H:%M')
-        ET.SubElement(e, 'duration').text = _timedelta_minutes(sess.endtime - sess.starttime)
-        ET.SubElement(e, 'room').text = lastroom
-        ET.SubElement(e, 'title').text = sess.title
-        ET.SubElement(e, 'abstract').text = sess.abstract
-        ET.SubElement(e, 'url').text = '{0}/events/{1}/schedule/session/{2}/'.format(settings.SITEBASE, conference.urlname, sess.id)
-        if sess.track:
-            ET.SubElement(e, 'track').text = sess.track.trackname
-        p = ET.SubElement(e, 'persons')
-        for spk in sess.speaker.all():
-            ET.SubElement(p, 'person', id=str(spk.id)).text = spk.name
-
-    resp = HttpResponse(content_type='text/xml; charset=utf-8')
-    ET.ElementTree(x).write(resp, encoding='utf-8', xml_declaration=True)
-    resp['Content-Disposition'] = 'attachment; filename="{}.xml"'.format(conference.urlname)
-    return resp
+
+    def _render(snapshot):
+        x = ET.Element('schedule')
+        ET.SubElement(x, 'version').text = 'Firefly'
+        c = ET.SubElement(x, 'conference')
+        ET.SubElement(c, 'title').text = conference.conferencename
+        ET.SubElement(c, 'start').text = conference.startdate.strftime("%Y-%m-%d")
+        ET.SubElement(c, 'end').text = conference.enddate.strftime("%Y-%m-%d")
+        ET.SubElement(c, 'days').text = str((conference.enddate - conference.startdate).days + 1)
+        ET.SubElement(c, 'baseurl').text = '{0}/events/{1}/schedule/'.format(settings.SITEBASE, conference.urlname)
+
+        lastday = None
+        lastroom = None
+        for sess in snapshot['sessions']:
+            if lastday != timezone.localdate(sess['starttime']):
+                lastday = timezone.localdate(sess['starttime'])
+                lastroom = None
+                xday = ET.SubElement(x, 'day', date=lastday.strftime("%Y-%m-%d"))  # START/END!
+            thisroom = sess['cross_schedule'] and 'Other' or sess['roomname']
+            if lastroom != thisroom:
+                lastroom = thisroom
+                xroom = ET.SubElement(xday, 'room', name=lastroom)
+            e = ET.SubElement(xroom, 'event', id=str(sess['id']))
+            ET.SubElement(e, 'start').text = timezone.localtime(sess['starttime']).strftime('%H:%M')
+            ET.SubElement(e, 'duration').text = _timedelta_minutes(sess['endtime'] - sess['starttime'])
+            ET.SubElement(e, 'room').text = lastroom
+            ET.SubElement(e, 'title').text = sess['title']
+            ET.SubElement(e, 'abstract').text = sess['abstract']
+            ET.SubElement(e, 'url').text = '{0}/events/{1}/schedule/session/{2}/'.format(settings.SITEBASE, conference.urlname, sess['id'])
+            ET.SubElement(e, 'track').text = sess['trackname']
+            p = ET.SubElement(e, 'persons')
+            for spk in sess['speakers']:
+                ET.SubElement(p, 'person', id=str(spk['id'])).text = spk['name']
+
+        resp = HttpResponse(content_type='text/xml; charset=utf-8')
+        ET.ElementTree(x).write(resp, encoding='utf-8', xml_declaration=True)
+        resp['Content-Disposition'] = 'attachment; filename="{}.xml"'.format(conference.urlname)
+        return resp
+
+    return _schedule_feed_response(request, conference, _render)
 
 
 def session(request, confname, section, sessionid, slug=None):
@@ -2710,7 +2859,7 @@ def createvouchers(request, confname):
 def listvouchers(request, confname):
     conference = get_authenticated_conference(request, confname)
 
-    batches = PrepaidBatch.objects.select_related('regtype', 'purchasedvoucher', 'purchasedvoucher__invoice').filter(conference=conference).prefetch_related('prepaidvoucher_set')
+    batches = PrepaidBatch.objects.select_related('regtype', 'purchasedvoucher', 'purchasedvoucher__invoice').defer('purchasedvoucher__invoice__pdf_invoice', 'purchasedvoucher__invoice__pdf_receipt').filter(conference=conference).prefetch_related('prepaidvoucher_set')
 
     return render(request, 'confreg/prepaid_list.html', {
         'conference': conference,
@@ -3460,8 +3609,11 @@ def admin_registration_dashboard(request, urlname):
 
     tables = []
 
+    # All counts come from the registration counters, which are maintained
+    # by triggers in the database, so we don't have to count all the
+    # registrations on every load.
     if conference.confirmpolicy:
-        policyquery = "count(r.id) FILTER (WHERE payconfirmedat IS NOT NULL AND canceledat IS NULL AND policyconfirmedat IS NULL) AS nopolicy,"
+        policyquery = "COALESCE(c.nopolicy, 0) AS nopolicy,"
         policycolumns = ['Pend. policy', ]
     else:
         policyquery = ""
@@ -3469,18 +3621,17 @@ def admin_registration_dashboard(request, urlname):
 
     # Registrations by reg type
     curs.execute("""SELECT regtype,
- count(payconfirmedat) - count(canceledat) AS confirmed,
- count(r.id) FILTER (WHERE payconfirmedat IS NULL AND (r.invoice_id IS NOT NULL OR bp.invoice_id IS NOT NULL)) AS invoiced,
- count(r.id) FILTER (WHERE payconfirmedat IS NULL AND (r.invoice_id IS NULL AND bp.invoice_id IS NULL)) AS unconfirmed,
- count(r.id) - count(canceledat) AS total,
- count(canceledat) AS canceled,
+ COALESCE(c.confirmed - c.canceled, 0) AS confirmed,
+ COALESCE(c.invoiced, 0) AS invoiced,
+ COALESCE(c.unconfirmed, 0) AS unconfirmed,
+ COALESCE(c.total - c.canceled, 0) AS total,
+ COALESCE(c.canceled, 0) AS canceled,
  {}
  invoice_autocancel_hours
-FROM confreg_conferenceregistration r
-RIGHT JOIN confreg_registrationtype rt ON rt.id=r.regtype_id
-LEFT JOIN confreg_bulkpayment bp ON bp.id=r.bulkpayment_id
+FROM confreg_registrationtype rt
+LEFT JOIN confreg_registrationcounter c ON c.countertype='r' AND c.objectid=rt.id
 WHERE rt.conference_id={}
-GROUP BY rt.id ORDER BY rt.sortkey""".format(policyquery, conference.id))
+ORDER BY rt.sortkey""".format(policyquery, conference.id))
     tables.append({'title': 'Registration types',
                    'columns': ['Type', 'Confirmed', 'Invoiced', 'Unconfirmed', 'Total', 'Canceled', ] + policycolumns + ['Inv. autoc'],
                    'fixedcols': 1,
@@ -3488,45 +3639,21 @@ GROUP BY rt.id ORDER BY rt.sortkey""".format(policyquery, conference.id))
                    'hidecols': 0,
                    'rows': curs.fetchall()},)
 
-    # Additional options. We need to run basically two queries (we do so in CTEs) here since
-    # an AO can be added both as part of a pending registration and as a pending additional
-    # order on a confirmed registration.
+    # Additional options. An AO can be added both as part of a pending registration and as
+    # a pending additional order on a confirmed registration, and both are counted.
     # Pending orders don't count when they are confirmed, since they are then part of the
     # regular ones, but they have to count when they are pending.
-    curs.execute("""WITH direct AS (
- SELECT rao.conferenceadditionaloption_id AS aoid,
-        count(*) FILTER (WHERE r.payconfirmedat IS NOT NULL) AS confirmed,
-        count(*) FILTER (WHERE r.payconfirmedat IS NULL AND (r.invoice_id IS NOT NULL OR bp.invoice_id IS NOT NULL)) AS invoiced,
-        count(*) FILTER (WHERE r.payconfirmedat IS NULL AND r.invoice_id IS NULL AND bp.invoice_id IS NULL) AS unconfirmed,
-        count(*) AS total
- FROM confreg_conferenceregistration r
- INNER JOIN confreg_conferenceregistration_additionaloptions rao ON rao.conferenceregistration_id=r.id
- LEFT JOIN confreg_bulkpayment bp ON bp.id=r.bulkpayment_id
- WHERE r.conference_id={0}
- GROUP BY aoid
-),
-pending AS (
- SELECT paoo.conferenceadditionaloption_id AS aoid,
-        count(*) FILTER (WHERE pao.invoice_id IS NOT NULL) AS invoiced,
-        count(*) FILTER (WHERE pao.invoice_id IS NULL) AS unconfirmed,
-        count(*) AS total
- FROM confreg_pendingadditionalorder_options paoo
- INNER JOIN confreg_pendingadditionalorder pao ON pao.id=paoo.pendingadditionalorder_id
- INNER JOIN confreg_conferenceregistration r ON r.id=pao.reg_id
- WHERE r.conference_id={0} AND pao.payconfirmedat IS NULL
- GROUP BY aoid
-)
-SELECT ao.id, ao.name, ao.maxcount,
-       COALESCE(direct.confirmed, 0) AS confirmed,
-       COALESCE(direct.invoiced, 0)+COALESCE(pending.invoiced, 0) AS invoiced,
-       COALESCE(direct.unconfirmed, 0)+COALESCE(pending.unconfirmed, 0) AS unconfirmed,
-       COALESCE(direct.total, 0)+COALESCE(pending.total, 0) AS total,
-       ao.maxcount-COALESCE(direct.total, 0)-COALESCE(pending.total, 0) AS remaining,
+    curs.execute("""SELECT ao.id, ao.name, ao.maxcount,
+       COALESCE(c.confirmed, 0) AS confirmed,
+       COALESCE(c.invoiced + c.pendinginvoiced, 0) AS invoiced,
+       COALESCE(c.unconfirmed + c.pendingunconfirmed, 0) AS unconfirmed,
+       COALESCE(c.total + c.pendinginvoiced + c.pendingunconfirmed, 0) AS total,
+       ao.maxcount - COALESCE(c.total + c.pendinginvoiced + c.pendingunconfirmed, 0) AS remaining,
        ao.invoice_autocancel_hours
 FROM confreg_conferenceadditionaloption ao
-LEFT JOIN pending ON pending.aoid=ao.id
-LEFT JOIN direct ON direct.aoid=ao.id
+LEFT JOIN confreg_registrationcounter c ON c.countertype='a' AND c.objectid=ao.id
 WHERE ao.conference_id={0}
+ORDER BY ao.sortkey, ao.name
 """.format(conference.id))
 
     tables.append({'title': 'Additional options',
@@ -3539,16 +3666,15 @@ WHERE ao.conference_id={0}
 
     # Discount codes
     curs.execute("""SELECT dc.id, code, validuntil, s.name, maxuses,
- count(payconfirmedat) AS confirmed,
- count(r.id) FILTER (WHERE payconfirmedat IS NULL AND (r.invoice_id IS NOT NULL OR bp.invoice_id IS NOT NULL)) AS invoiced,
- count(r.id) FILTER (WHERE payconfirmedat IS NULL AND (r.invoice_id IS NULL AND bp.invoice_id IS NULL)) AS unconfirmed,
- count(r.id) AS total,
- CASE WHEN maxuses > 0 THEN maxuses-count(r.id) ELSE NULL END AS remaining
-FROM confreg_conferenceregistration r
-RIGHT JOIN confreg_discountcode dc ON dc.code=r.vouchercode
-LEFT JOIN confreg_bulkpayment bp ON bp.id=r.bulkpayment_id
+ COALESCE(c.confirmed, 0) AS confirmed,
+ COALESCE(c.invoiced, 0) AS invoiced,
+ COALESCE(c.unconfirmed, 0) AS unconfirmed,
+ COALESCE(c.total, 0) AS total,
+ CASE WHEN maxuses > 0 THEN maxuses-COALESCE(c.total, 0) ELSE NULL END AS remaining
+FROM confreg_discountcode dc
+LEFT JOIN confreg_registrationcounter c ON c.countertype='d' AND c.objectid=dc.id
 LEFT JOIN confsponsor_sponsor s ON s.id=dc.sponsor_id
-WHERE dc.conference_id={0} AND (r.conference_id={0} OR r.conference_id IS NULL) GROUP BY dc.id, s.name ORDER BY code""".format(conference.id))
+WHERE dc.conference_id={0} ORDER BY code""".format(conference.id))
     tables.append({'title': 'Discount codes',
                    'columns': ['id', 'Code', 'Expires', 'Sponsor', 'Max uses', 'Confirmed', 'Invoiced', 'Unconfirmed', 'Total', 'Remaining', ],
                    'fixedcols': 4,
@@ -3560,15 +3686,13 @@ WHERE dc.conference_id={0} AND (r.conference_id={0} OR r.conference_id IS NULL)
     # Voucher batches
     curs.execute("""SELECT b.id, b.buyername, s.name as sponsorname,
     CASE WHEN EXISTS (SELECT 1 FROM confsponsor_purchasedvoucher pv WHERE pv.batch_id=b.id) THEN 'Purchased' ELSE 'Given' END AS source,
-    count(v.user_id) AS used,
-    count(*) FILTER (WHERE v.user_id IS NULL) AS unused,
-    count(*) AS total
+    c.used,
+    c.total - c.used AS unused,
+    c.total
 FROM confreg_prepaidbatch b
-INNER JOIN confreg_prepaidvoucher v ON v.batch_id=b.id
-LEFT JOIN confreg_conferenceregistration r ON r.id=v.user_id
+INNER JOIN confreg_registrationcounter c ON c.countertype='b' AND c.objectid=b.id AND c.total > 0
 LEFT JOIN confsponsor_sponsor s ON s.id = b.sponsor_id
 WHERE b.conference_id={0}
-GROUP BY b.id, s.name
 ORDER BY buyername""".format(conference.id))
     tables.append({'title': 'Prepaid vouchers',
                    'columns': ['id', 'Buyer', 'Sponsor', 'Source', 'Used', 'Unused', 'Total', ],
@@ -3603,7 +3727,7 @@ def admin_registration_list(request, urlname):
     return render(request, 'confreg/admin_registration_list.html', {
         'conference': conference,
         'waitlist_active': conference.waitlist_active(),
-        'regs': ConferenceRegistration.objects.select_related('regtype', 'registrationwaitlistentry', 'invoice', 'bulkpayment').extra(select={
+        'regs': ConferenceRegistration.objects.select_related('regtype', 'registrationwaitlistentry', 'invoice', 'bulkpayment').defer('invoice__pdf_invoice', 'invoice__pdf_receipt').extra(select={
             'waitlist_offers_made': """CASE WHEN "confreg_registrationwaitlistentry"."registration_id" IS NULL THEN 0 ELSE (SELECT count(*) FROM confreg_registrationwaitlisthistory h WHERE h.waitlist_id="confreg_registrationwaitlistentry"."registration_id" AND h.text LIKE 'Made offer%%')  END""",
         }).filter(conference=conference),
         'regsummary': exec_to_dict("SELECT count(1) FILTER (WHERE payconfirmedat IS NOT NULL AND canceledat IS NULL) AS confirmed, count(1) FILTER (WHERE payconfirmedat IS NULL) AS unconfirmed, count(1) FILTER (WHERE canceledat IS NOT NULL) AS canceled FROM confreg_conferenceregistration WHERE conference_id=%(confid)s", {'confid': conference.id})[0],
@@ -4570,7 +4694,7 @@ def transfer_reg(request, urlname):
         'steps': steps,
         'stephash': stephash,
         'sponsors': Sponsor.objects.select_related('level').filter(conference=conference, confirmed=True).order_by('-level__levelcost', 'level__levelname', 'name'),
-        'pending': RegistrationTransferPending.objects.select_related('fromreg', 'toreg', 'invoice').filter(conference=conference),
+        'pending': RegistrationTransferPending.objects.select_related('fromreg', 'toreg', 'invoice').defer('invoice__pdf_invoice', 'invoice__pdf_receipt').filter(conference=conference),
         'helplink': 'registrations#transfer',
     })
 
@@ -4747,16 +4871,24 @@ def crossmail_send(request):
                 if r:
                     _addrule(email, r, True)
 
-            for r in recipients:
-                CrossConferenceEmailRecipient(email=email, address=r['email']).save()
-
-                send_simple_mail(form.data['senderaddr'],
-                                 r['email'],
-                                 form.data['subject'],
-                                 "{0}\n\n\nThis email was sent to you from {1}.\nTo opt-out from further communications about our events, please fill out the form at:\n{2}/events/optout/{3}/".format(form.data['text'], settings.ORG_NAME, settings.SITEBASE, r['token']),
-                                 sendername=form.data['sendername'],
-                                 receivername=r['fullname'],
-                )
+            CrossConferenceEmailRecipient.objects.bulk_create([
+                CrossConferenceEmailRecipient(email=email, address=r['email']) for r in recipients
+            ])
+
+            # Everybody gets the same email, apart from the opt-out token. The
+            # token is substituted for each recipient, so any braces in the
+            # text itself have to be escaped.
+            msgtxt = "{0}\n\n\nThis email was sent to you from {1}.\nTo opt-out from further communications about our events, please fill out the form at:\n{2}/events/optout/{{token}}/".format(
+                form.data['text'].replace('{', '{{').replace('}', '}}'),
+                settings.ORG_NAME,
+                settings.SITEBASE,
+            )
+            send_bulk_mail(form.data['senderaddr'],
+                           [(r['email'], r['fullname'], {'token': r['token']}) for r in recipients],
+                           form.data['subject'],
+                           msgtxt,
+                           sendername=form.data['sendername'],
+            )
 
             messages.info(request, "Sent {0} emails.".format(len(recipients)))
             return HttpResponseRedirect("../")
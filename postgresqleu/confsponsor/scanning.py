@@ -5,14 +5,20 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.db import transaction
 from django.conf import settings
+from django.utils import timezone
 
+import base64
 import csv
 import json
 import re
+import dateutil.parser
+
+from Cryptodome.Cipher import AES
+from Cryptodome.Hash import SHA256
 
 from postgresqleu.util.random import generate_random_token
 from postgresqleu.util.qr import generate_base64_qr
-from postgresqleu.util.db import exec_to_dict, exec_to_keyed_scalar
+from postgresqleu.util.db import exec_to_dict, exec_to_keyed_scalar, exec_to_list
 from postgresqleu.util.decorators import global_login_exempt
 from postgresqleu.confreg.models import ConferenceRegistration
 from postgresqleu.confreg.util import send_conference_mail, get_conference_or_404, render_conference_response
@@ -282,6 +288,137 @@ def _get_scanned_attendee(sponsor, token):
     return attendee
 
 
+# Maximum number of scans accepted in a single sync
+MAX_SYNC_SCANS = 1000
+
+
+# Store a batch of scans, typically collected by the scanner while it was
+# offline. Each scan has a token and optionally a note and the time of the
+# scan. Scans that are already stored are updated instead, so the same batch
+# can safely be sent again if the response got lost.
+def _sync_scans(request, scanner):
+    try:
+        scans = json.loads(request.body.decode('utf8'))['scans']
+        if not isinstance(scans, list):
+            raise ValueError()
+    except (ValueError, KeyError, TypeError):
+        return HttpResponse("Invalid format", status=400)
+
+    if len(scans) > MAX_SYNC_SCANS:
+        return HttpResponse("Too many scans, at most {} can be synced at once".format(MAX_SYNC_SCANS), status=400)
+
+    now = timezone.now()
+    tosync = []
+    for scan in scans:
+        if not isinstance(scan, dict) or not isinstance(scan.get('token', None), str) or not isinstance(scan.get('note', ''), (str, type(None))):
+            return HttpResponse("Invalid format", status=400)
+
+        # Accept both full URL version of token and just the key part
+        m = _tokenmatcher.match(scan['token'])
+        token = m.group(1) if m else scan['token']
+
+        if scan.get('scannedat', None):
+            try:
+                scannedat = dateutil.parser.isoparse(scan['scannedat'])
+            except (ValueError, TypeError):
+                return HttpResponse("Invalid scan time", status=400)
+            if not scannedat.tzinfo:
+                return HttpResponse("Scan time must include timezone", status=400)
+            # Don't trust a scanner clock that is ahead
+            scannedat = min(scannedat, now)
+        else:
+            scannedat = now
+
+        tosync.append({
+            'token': token,
+            'note': scan.get('note', None) or '',
+            'scannedat': scannedat.isoformat(),
+        })
+
+    # Upsert all scans in one statement, and get the attendee data back for
+    # all of them. If the same token is in the batch more than once, the
+    # latest scan wins. An empty note never overwrites an existing one, since
+    # the note may have been entered on another device. The join against the
+    # previous scan sees the rows from before the insert, so a badge that was
+    # looked up but never stored is reported as newly stored.
+    result = exec_to_dict("""WITH scans AS (
+  SELECT DISTINCT ON (token) token, note, scannedat
+  FROM jsonb_to_recordset(%(scans)s::jsonb) AS s(token text, note text, scannedat timestamptz)
+  ORDER BY token, scannedat DESC
+), stored AS (
+  INSERT INTO confsponsor_scannedattendee (sponsor_id, scannedby_id, attendee_id, scannedat, firstscan, note)
+  SELECT %(sponsorid)s, %(scannerid)s, r.id, scans.scannedat, false, scans.note
+  FROM scans
+  INNER JOIN confreg_conferenceregistration r ON r.conference_id=%(confid)s AND r.publictoken=scans.token
+  WHERE r.badgescan AND r.canceledat IS NULL
+  ON CONFLICT (sponsor_id, scannedby_id, attendee_id) DO UPDATE SET
+    note=CASE WHEN excluded.note='' THEN confsponsor_scannedattendee.note ELSE excluded.note END,
+    scannedat=LEAST(confsponsor_scannedattendee.scannedat, excluded.scannedat),
+    firstscan=false
+  RETURNING attendee_id, note, xmax=0 AS created
+)
+SELECT scans.token, r.id AS regid, r.badgescan, r.canceledat IS NOT NULL AS canceled,
+  r.firstname || ' ' || r.lastname AS name, r.company, country.printable_name AS country, r.email,
+  stored.note, stored.created OR COALESCE(previous.firstscan, false) AS created
+FROM scans
+LEFT JOIN confreg_conferenceregistration r ON r.conference_id=%(confid)s AND r.publictoken=scans.token
+LEFT JOIN country ON country.iso=r.country_id
+LEFT JOIN stored ON stored.attendee_id=r.id
+LEFT JOIN confsponsor_scannedattendee previous ON previous.sponsor_id=%(sponsorid)s AND previous.scannedby_id=%(scannerid)s AND previous.attendee_id=r.id""", {
+        'scans': json.dumps(tosync),
+        'sponsorid': scanner.sponsor_id,
+        'scannerid': scanner.scanner_id,
+        'confid': scanner.sponsor.conference_id,
+    })
+
+    bytoken = {r['token']: r for r in result}
+    response = []
+    for token in dict.fromkeys(s['token'] for s in tosync):
+        r = bytoken[token]
+        if r['regid'] is None:
+            response.append({'token': token, 'status': 'notfound', 'message': 'Attendee not found'})
+        elif not r['badgescan']:
+            response.append({'token': token, 'status': 'notauthorized', 'message': 'Attendee has not authorized badge scanning'})
+        elif r['canceled']:
+            response.append({'token': token, 'status': 'canceled', 'message': 'Attendee registration is canceled'})
+        else:
+            response.append({
+                'token': token,
+                'status': 'stored' if r['created'] else 'updated',
+                'reg': {
+                    'name': r['name'],
+                    'company': r['company'],
+                    'country': r['country'] or '',
+                    'email': r['email'],
+                    'note': r['note'],
+                    'token': token,
+                },
+            })
+
+    return HttpResponse(json.dumps({'scans': response}), content_type='application/json')
+
+
+# Index of all attendees that can be scanned, so the scanner can show who a
+# badge belongs to while offline. So as not to hand the full attendee list
+# to every sponsor, each entry is keyed on a hash of the badge token and
+# encrypted (AES-GCM, with the nonce first and the tag last) using the
+# SHA256 of the token as the key. An entry can only be read by scanning the
+# badge, and the tokens themselves are never included.
+def _attendee_index(scanner):
+    index = {}
+    for token, name, company in exec_to_list("""SELECT publictoken, firstname || ' ' || lastname, company
+FROM confreg_conferenceregistration
+WHERE conference_id=%(confid)s AND payconfirmedat IS NOT NULL AND canceledat IS NULL AND badgescan""", {
+            'confid': scanner.sponsor.conference_id,
+    }):
+        key = SHA256.new(token.encode('ascii')).digest()
+        cipher = AES.new(key, AES.MODE_GCM)
+        data, tag = cipher.encrypt_and_digest(json.dumps([name, company]).encode('utf8'))
+        index[SHA256.new(key).hexdigest()[:32]] = base64.b64encode(cipher.nonce + data + tag).decode('ascii')
+
+    return HttpResponse(json.dumps({'attendees': index}), content_type='application/json')
+
+
 @csrf_exempt
 @global_login_exempt
 def scanning_api(request, scannertoken, what):
@@ -366,6 +503,10 @@ def scanning_api(request, scannertoken, what):
                             'The note has been updated.' if 'note' in update else '',
                         ),
                     )
+        elif request.method == 'POST' and what == 'sync':
+            return _sync_scans(request, scanner)
+        elif what == 'index':
+            return _attendee_index(scanner)
         else:
             raise Http404()
     else:
@@ -6,7 +6,7 @@ from django.utils import timezone
 from postgresqleu.util.db import exec_to_list
 from postgresqleu.util.currency import format_currency
 from postgresqleu.mailqueue.util import send_simple_mail
-from postgresqleu.confreg.util import send_conference_mail, send_conference_simple_mail
+from postgresqleu.confreg.util import send_conference_bulk_mail, send_conference_simple_bulk_mail
 from postgresqleu.confsponsor.models import SponsorMail
 from postgresqleu.confsponsor.models import Sponsor
 from postgresqleu.confsponsor.models import SponsorshipLevel
@@ -127,34 +127,30 @@ def send_conference_sponsor_notification(conference, subject, message):
 
 
 def send_sponsor_manager_email(sponsor, subject, template, context, attachments=None, sendat=None):
-    for manager in sponsor.managers.all():
-        send_conference_mail(
-            sponsor.conference,
-            manager.email,
-            subject,
-            template,
-            context,
-            attachments=attachments,
-            sender=sponsor.conference.sponsoraddr,
-            sendername=sponsor.conference.conferencename,
-            receivername='{0} {1}'.format(manager.first_name, manager.last_name),
-            sendat=sendat,
-        )
+    send_conference_bulk_mail(
+        sponsor.conference,
+        [(manager.email, '{0} {1}'.format(manager.first_name, manager.last_name)) for manager in sponsor.managers.all()],
+        subject,
+        template,
+        context,
+        attachments=attachments,
+        sender=sponsor.conference.sponsoraddr,
+        sendername=sponsor.conference.conferencename,
+        sendat=sendat,
+    )
 
 
 def send_sponsor_manager_simple_email(sponsor, subject, message, attachments=None, sendat=None):
-    for manager in sponsor.managers.all():
-        send_conference_simple_mail(
-            sponsor.conference,
-            manager.email,
-            subject,
-            message,
-            attachments=attachments,
-            sender=sponsor.conference.sponsoraddr,
-            sendername=sponsor.conference.conferencename,
-            receivername='{0} {1}'.format(manager.first_name, manager.last_name),
-            sendat=None,
-        )
+    send_conference_simple_bulk_mail(
+        sponsor.conference,
+        [(manager.email, '{0} {1}'.format(manager.first_name, manager.last_name)) for manager in sponsor.managers.all()],
+        subject,
+        message,
+        attachments=attachments,
+        sender=sponsor.conference.sponsoraddr,
+        sendername=sponsor.conference.conferencename,
+        sendat=None,
+    )
 
 
 def get_mails_for_sponsor(sponsor, future=False):
@@ -17,6 +17,7 @@ class Command(BaseCommand):
     help = 'Run cleanup commands for all digisign providers'
 
     class ScheduledJob:
+        exclusive_group = 'digisign'
         scheduled_times = [time(3, 7), ]
 
         @classmethod
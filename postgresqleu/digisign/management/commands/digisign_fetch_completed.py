@@ -17,6 +17,7 @@ class Command(BaseCommand):
     help = 'Fetch completed contracts for all digisign providers'
 
     class ScheduledJob:
+        exclusive_group = 'digisign'
         scheduled_times = [time(1, 1), ]
 
         @classmethod
@@ -9,7 +9,7 @@ from django.utils.timezone import make_aware
 from django.db import transaction
 from django.conf import settings
 
-from postgresqleu.invoices.util import register_bank_transaction
+from postgresqleu.invoices.util import register_bank_transactions
 from postgresqleu.invoices.models import InvoicePaymentMethod
 from postgresqleu.mailqueue.util import send_simple_mail
 from postgresqleu.gocardless.models import GocardlessTransaction
@@ -22,6 +22,7 @@ class Command(BaseCommand):
     help = 'Fetch Gocadless transactions'
 
     class ScheduledJob:
+        exclusive_group = 'gocardless'
         scheduled_times = [
             time(9, 30),
             time(18, 30),
@@ -43,6 +44,7 @@ class Command(BaseCommand):
 
     def handle_method(self, method):
         impl = method.get_implementation()
+        banktransactions = []
 
         for t in impl.fetch_transactions():
             trans, created = GocardlessTransaction.objects.get_or_create(
@@ -69,13 +71,10 @@ class Command(BaseCommand):
                         ),
                     )
 
-                # Also register a pending bank transaction. This may immediately match an invoice
-                # if it was an invoice payment, in which case the entire process will complete..
                 if self.do_banktransactions:
-                    register_bank_transaction(
-                        method,
-                        trans.id,
-                        trans.amount,
-                        trans.paymentref,
-                        trans.paymentref,
-                    )
+                    banktransactions.append((trans.id, trans.amount, trans.paymentref, trans.paymentref, False))
+
+        # Register pending bank transactions for all the new transactions. This may immediately
+        # match invoices if they were invoice payments, in which case the entire process will complete.
+        # All transactions are matched in one pass, so invoices and matchers only have to be looked up once.
+        register_bank_transactions(method, banktransactions)
@@ -20,6 +20,7 @@ class Command(BaseCommand):
     help = 'Verify Gocardless balancse'
 
     class ScheduledJob:
+        exclusive_group = 'gocardless'
         scheduled_times = [datetime.time(3, 35), ]
 
         @classmethod
@@ -28,7 +28,7 @@ from postgresqleu.invoices.backendforms import BackendVatRateForm
 from postgresqleu.invoices.backendforms import BackendVatValidationCacheForm
 from postgresqleu.invoices.backendforms import BackendInvoicePaymentMethodForm
 from postgresqleu.invoices.backendforms import BankfilePaymentMethodChoiceForm
-from postgresqleu.invoices.util import register_bank_transaction
+from postgresqleu.invoices.util import register_bank_transactions
 
 import re
 import base64
@@ -132,7 +132,7 @@ def banktransactions_match(request, transid):
     authenticate_backend_group(request, 'Invoice managers')
 
     trans = get_object_or_404(PendingBankTransaction, pk=transid)
-    invoices = Invoice.objects.filter(finalized=True, paidat__isnull=True, deleted=False).order_by('invoicedate')
+    invoices = Invoice.objects.defer('pdf_invoice', 'pdf_receipt').filter(finalized=True, paidat__isnull=True, deleted=False).order_by('invoicedate')
 
     def _match_invoice(i):
         matchinfos = []
@@ -200,6 +200,7 @@ def bankfiles(request):
                     )
                     bankfile.save()  # To get an id we can use
 
+                    banktransactions = []
                     for r in rows:
                         if r['row_already_exists']:
                             continue
@@ -219,11 +220,11 @@ def bankfiles(request):
                         )
                         b.save()
                         numtrans += 1
+                        banktransactions.append((b.id, b.amount, b.description, '', False))
 
-                        if not register_bank_transaction(b.method, b.id, b.amount, b.description, ''):
-                            # This means the transaction wasn't directly matched and has been
-                            # registered as a pending transaction.
-                            numpending += 1
+                    # Match all the new rows in one pass. Any transaction that wasn't directly
+                    # matched has been registered as a pending transaction.
+                    numpending = register_bank_transactions(method, banktransactions).count(False)
 
                     bankfile.newtrans = numtrans
                     bankfile.newpending = numpending
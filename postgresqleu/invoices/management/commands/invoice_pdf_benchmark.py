@@ -0,0 +1,52 @@
+#
+# Benchmark rendering of invoice PDFs, by re-rendering a number of
+# existing finalized invoices. Nothing is saved.
+#
+from django.core.management.base import BaseCommand, CommandError
+
+import itertools
+import time
+
+from postgresqleu.invoices.models import Invoice
+from postgresqleu.invoices.util import render_pdf_invoices
+
+
+class Command(BaseCommand):
+    help = 'Benchmark rendering of invoice PDFs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100, help='Number of invoices to render')
+        parser.add_argument('--receipt', action='store_true', help='Render receipts for paid invoices instead of invoices')
+
+    def handle(self, *args, **options):
+        if options['count'] < 1:
+            raise CommandError("Count must be at least 1")
+
+        invoices = Invoice.objects.filter(finalized=True).defer('pdf_invoice', 'pdf_receipt').order_by('-id')
+        if options['receipt']:
+            invoices = invoices.filter(paidat__isnull=False)
+        invoices = list(invoices[:options['count']])
+        if not invoices:
+            raise CommandError("No invoices to render")
+
+        # If there are fewer invoices than requested, render them more than once
+        invoices = list(itertools.islice(itertools.cycle(invoices), options['count']))
+
+        # The first invoice rendered in a process also loads the fonts and
+        # images, so report it separately.
+        starttime = time.time()
+        render_pdf_invoices(invoices[:1], receipt=options['receipt'])
+        firsttime = time.time() - starttime
+
+        starttime = time.time()
+        pdfs = render_pdf_invoices(invoices[1:], receipt=options['receipt'])
+        elapsed = time.time() - starttime
+
+        self.stdout.write("First invoice: {:.1f} ms".format(firsttime * 1000))
+        if pdfs:
+            self.stdout.write("Rendered {} more invoices in {:.2f} seconds, {:.1f} ms per invoice, {} bytes per invoice".format(
+                len(pdfs),
+                elapsed,
+                elapsed * 1000 / len(pdfs),
+                sum(len(p) for p in pdfs) // len(pdfs),
+            ))
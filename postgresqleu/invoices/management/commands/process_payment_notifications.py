@@ -0,0 +1,59 @@
+# Process notifications received from payment providers.
+#
+# Webhooks from payment providers are authenticated, stored and
+# acknowledged immediately, and the actual processing of them (which
+# may include invoice processing, accounting entries, emails and API
+# calls back to the provider) is done here. The job is triggered as
+# soon as a notification is received, and also runs regularly to
+# handle retries of notifications that failed.
+#
+
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from datetime import timedelta
+
+from postgresqleu.invoices.models import IncomingPaymentNotification
+from postgresqleu.invoices.util import process_payment_notifications, get_payment_notification_latency
+
+
+class Command(BaseCommand):
+    help = 'Process notifications received from payment providers'
+
+    class ScheduledJob:
+        scheduled_interval = timedelta(minutes=5)
+
+        @classmethod
+        def should_run(self):
+            return IncomingPaymentNotification.objects.filter(
+                Q(processedat__isnull=True, nextattemptat__lte=timezone.now()) |
+                Q(processedat__lt=timezone.now() - timedelta(days=90))
+            ).exists()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--latency', action='store_true', help='Show processing latency per payment method instead of processing')
+        parser.add_argument('--days', type=int, default=7, help='Number of days to show latency for')
+
+    def handle(self, *args, **options):
+        if options['latency']:
+            self.show_latency(options['days'])
+            return
+
+        processed = process_payment_notifications(self.stdout.write)
+        if processed and options['verbosity'] > 1:
+            self.stdout.write("Processed {} notifications".format(processed))
+
+        # Processed notifications are kept around so that duplicate deliveries
+        # can be detected, but providers don't retry anywhere near this long.
+        IncomingPaymentNotification.objects.filter(processedat__lt=timezone.now() - timedelta(days=90)).delete()
+
+    def show_latency(self, days):
+        self.stdout.write("{:30} {:>9} {:>7} {:>12} {:>12} {:>12}".format('Payment method', 'Processed', 'Pending', 'Average', '95%', 'Max'))
+        for name, processed, pending, avg, p95, maxlatency in get_payment_notification_latency(timezone.now() - timedelta(days=days)):
+            self.stdout.write("{:30} {:>9} {:>7} {:>12} {:>12} {:>12}".format(
+                name[:30],
+                processed,
+                pending,
+                *['{:.1f}s'.format(v.total_seconds()) if v is not None else '-' for v in (avg, p95, maxlatency)]
+            ))
@@ -0,0 +1,105 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:04
+
+from django.db import migrations, models, connection, transaction
+
+
+# The PDFs used to be stored base64 encoded in text fields. Rather than
+# rewriting the whole tables in a single ALTER TABLE, the converted PDFs are
+# written to new columns in batches, each batch committed on its own. The
+# new columns replace the old ones in the next migration. While this runs,
+# PDFs can still be written to the old columns, so triggers keep the new
+# columns in step until the next migration removes them.
+PDF_COLUMNS = (
+    ('invoices_invoice', ('pdf_invoice', 'pdf_receipt')),
+    ('invoices_invoicerefund', ('refund_pdf', )),
+)
+BATCH_SIZE = 500
+
+
+def convert_pdfs(apps, schema_editor):
+    curs = connection.cursor()
+    for table, columns in PDF_COLUMNS:
+        curs.execute("SELECT max(id) FROM {}".format(table))
+        maxid = curs.fetchone()[0] or 0
+        for start in range(0, maxid + 1, BATCH_SIZE):
+            with transaction.atomic():
+                curs.execute("UPDATE {} SET {} WHERE id >= %(start)s AND id < %(end)s".format(
+                    table,
+                    ", ".join("{0}_new=NULLIF(decode({0}, 'base64'), ''), {0}_hashval=decode(md5(NULLIF(decode({0}, 'base64'), '')), 'hex')".format(c) for c in columns),
+                ), {
+                    'start': start,
+                    'end': start + BATCH_SIZE,
+                })
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('invoices', '0020_regtransfer_processor'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='pdf_invoice_hashval',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='pdf_receipt_hashval',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoicerefund',
+            name='refund_pdf_hashval',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunSQL(
+            """
+ALTER TABLE invoices_invoice ADD COLUMN pdf_invoice_new bytea, ADD COLUMN pdf_receipt_new bytea;
+ALTER TABLE invoices_invoicerefund ADD COLUMN refund_pdf_new bytea;
+            """,
+            """
+ALTER TABLE invoices_invoice DROP COLUMN pdf_invoice_new, DROP COLUMN pdf_receipt_new;
+ALTER TABLE invoices_invoicerefund DROP COLUMN refund_pdf_new;
+            """,
+        ),
+        migrations.RunSQL(
+            """
+CREATE FUNCTION invoices_invoice_sync_pdf() RETURNS trigger AS $$
+BEGIN
+        NEW.pdf_invoice_new = NULLIF(decode(NEW.pdf_invoice, 'base64'), '');
+        NEW.pdf_invoice_hashval = decode(md5(NEW.pdf_invoice_new), 'hex');
+        NEW.pdf_receipt_new = NULLIF(decode(NEW.pdf_receipt, 'base64'), '');
+        NEW.pdf_receipt_hashval = decode(md5(NEW.pdf_receipt_new), 'hex');
+        RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER invoices_invoice_sync_pdf_trigger
+BEFORE INSERT OR UPDATE OF pdf_invoice, pdf_receipt ON invoices_invoice
+FOR EACH ROW EXECUTE FUNCTION invoices_invoice_sync_pdf();
+
+CREATE FUNCTION invoices_invoicerefund_sync_pdf() RETURNS trigger AS $$
+BEGIN
+        NEW.refund_pdf_new = NULLIF(decode(NEW.refund_pdf, 'base64'), '');
+        NEW.refund_pdf_hashval = decode(md5(NEW.refund_pdf_new), 'hex');
+        RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER invoices_invoicerefund_sync_pdf_trigger
+BEFORE INSERT OR UPDATE OF refund_pdf ON invoices_invoicerefund
+FOR EACH ROW EXECUTE FUNCTION invoices_invoicerefund_sync_pdf();
+            """,
+            # The next migration drops these, so they may already be gone
+            """
+DROP TRIGGER IF EXISTS invoices_invoice_sync_pdf_trigger ON invoices_invoice;
+DROP FUNCTION IF EXISTS invoices_invoice_sync_pdf();
+DROP TRIGGER IF EXISTS invoices_invoicerefund_sync_pdf_trigger ON invoices_invoicerefund;
+DROP FUNCTION IF EXISTS invoices_invoicerefund_sync_pdf();
+            """,
+        ),
+        migrations.RunPython(convert_pdfs, migrations.RunPython.noop),
+    ]
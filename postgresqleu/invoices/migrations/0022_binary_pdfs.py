@@ -0,0 +1,103 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0021_binary_pdfs_convert'),
+    ]
+
+    operations = [
+        # Stop syncing the old columns into the new ones, added in 0021
+        migrations.RunSQL(
+            """
+DROP TRIGGER invoices_invoice_sync_pdf_trigger ON invoices_invoice;
+DROP FUNCTION invoices_invoice_sync_pdf();
+DROP TRIGGER invoices_invoicerefund_sync_pdf_trigger ON invoices_invoicerefund;
+DROP FUNCTION invoices_invoicerefund_sync_pdf();
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.RunSQL(
+                    """
+ALTER TABLE invoices_invoice DROP COLUMN pdf_invoice, DROP COLUMN pdf_receipt;
+ALTER TABLE invoices_invoice RENAME COLUMN pdf_invoice_new TO pdf_invoice;
+ALTER TABLE invoices_invoice RENAME COLUMN pdf_receipt_new TO pdf_receipt;
+ALTER TABLE invoices_invoicerefund DROP COLUMN refund_pdf;
+ALTER TABLE invoices_invoicerefund RENAME COLUMN refund_pdf_new TO refund_pdf;
+                    """,
+                    """
+ALTER TABLE invoices_invoice RENAME COLUMN pdf_invoice TO pdf_invoice_new;
+ALTER TABLE invoices_invoice RENAME COLUMN pdf_receipt TO pdf_receipt_new;
+ALTER TABLE invoices_invoice ADD COLUMN pdf_invoice text, ADD COLUMN pdf_receipt text;
+UPDATE invoices_invoice SET pdf_invoice=coalesce(translate(encode(pdf_invoice_new, 'base64'), E'\\n', ''), ''), pdf_receipt=coalesce(translate(encode(pdf_receipt_new, 'base64'), E'\\n', ''), '');
+ALTER TABLE invoices_invoice ALTER COLUMN pdf_invoice SET NOT NULL, ALTER COLUMN pdf_receipt SET NOT NULL;
+ALTER TABLE invoices_invoicerefund RENAME COLUMN refund_pdf TO refund_pdf_new;
+ALTER TABLE invoices_invoicerefund ADD COLUMN refund_pdf text;
+UPDATE invoices_invoicerefund SET refund_pdf=coalesce(translate(encode(refund_pdf_new, 'base64'), E'\\n', ''), '');
+ALTER TABLE invoices_invoicerefund ALTER COLUMN refund_pdf SET NOT NULL;
+                    """,
+                ),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='invoice',
+                    name='pdf_invoice',
+                    field=models.BinaryField(blank=True, null=True),
+                ),
+                migrations.AlterField(
+                    model_name='invoice',
+                    name='pdf_receipt',
+                    field=models.BinaryField(blank=True, null=True),
+                ),
+                migrations.AlterField(
+                    model_name='invoicerefund',
+                    name='refund_pdf',
+                    field=models.BinaryField(blank=True, null=True),
+                ),
+            ],
+        ),
+        migrations.RunSQL(
+            """
+CREATE FUNCTION invoices_invoice_update_hash() RETURNS trigger AS $$
+BEGIN
+        NEW.pdf_invoice_hashval = decode(md5(NEW.pdf_invoice), 'hex');
+        NEW.pdf_receipt_hashval = decode(md5(NEW.pdf_receipt), 'hex');
+        RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+            """,
+            "DROP FUNCTION invoices_invoice_update_hash();",
+        ),
+        migrations.RunSQL(
+            """
+CREATE TRIGGER invoices_invoice_update_hash_trigger
+BEFORE INSERT OR UPDATE OF pdf_invoice, pdf_receipt ON invoices_invoice
+FOR EACH ROW EXECUTE FUNCTION invoices_invoice_update_hash();
+            """,
+            "DROP TRIGGER invoices_invoice_update_hash_trigger ON invoices_invoice",
+        ),
+        migrations.RunSQL(
+            """
+CREATE FUNCTION invoices_invoicerefund_update_hash() RETURNS trigger AS $$
+BEGIN
+        NEW.refund_pdf_hashval = decode(md5(NEW.refund_pdf), 'hex');
+        RETURN NEW;
+END;
+$$ LANGUAGE plpgsql
+            """,
+            "DROP FUNCTION invoices_invoicerefund_update_hash();",
+        ),
+        migrations.RunSQL(
+            """
+CREATE TRIGGER invoices_invoicerefund_update_hash_trigger
+BEFORE INSERT OR UPDATE OF refund_pdf ON invoices_invoicerefund
+FOR EACH ROW EXECUTE FUNCTION invoices_invoicerefund_update_hash();
+            """,
+            "DROP TRIGGER invoices_invoicerefund_update_hash_trigger ON invoices_invoicerefund",
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 18:36
+
+import django.core.serializers.json
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0022_binary_pdfs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IncomingPaymentNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotencykey', models.CharField(max_length=200)),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('receivedat', models.DateTimeField(auto_now_add=True)),
+                ('processedat', models.DateTimeField(blank=True, null=True)),
+                ('attempts', models.IntegerField(default=0)),
+                ('nextattemptat', models.DateTimeField(blank=True, default=django.utils.timezone.now, null=True)),
+                ('lasterror', models.TextField(blank=True)),
+                ('paymentmethod', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='invoices.invoicepaymentmethod')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('processedat__isnull', True)), fields=['nextattemptat'], name='invoices_paymentnotif_pending')],
+                'unique_together': {('paymentmethod', 'idempotencykey')},
+            },
+        ),
+    ]
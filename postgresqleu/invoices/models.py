@@ -71,7 +71,9 @@ class InvoiceRefund(models.Model):
 
     payment_reference = models.CharField(max_length=100, null=False, blank=True, help_text="Reference in payment system, depending on system used for invoice.")
 
-    refund_pdf = models.TextField(blank=True, null=False)
+    # The PDF refund note, and a hash of it (maintained by a trigger)
+    refund_pdf = models.BinaryField(blank=True, null=True)
+    refund_pdf_hashval = models.BinaryField(blank=True, null=True)
 
     class Meta:
         ordering = ('id', )
@@ -112,8 +114,9 @@ class Invoice(models.Model):
     deleted = models.BooleanField(null=False, blank=False, default=False, help_text="This invoice has been deleted")
     deletion_reason = models.CharField(max_length=500, null=False, blank=True, default='', help_text="Reason for deletion of invoice")
 
-    # base64 encoded version of the PDF invoice
-    pdf_invoice = models.TextField(blank=True, null=False)
+    # The PDF invoice, and a hash of it (maintained by a trigger)
+    pdf_invoice = models.BinaryField(blank=True, null=True)
+    pdf_invoice_hashval = models.BinaryField(blank=True, null=True)
 
     # Which class, if any, is responsible for processing the payment
     # of this invoice. This can typically be to flag a conference
@@ -134,8 +137,10 @@ class Invoice(models.Model):
     # Reminder (if any) sent when?
     remindersent = models.DateTimeField(null=True, blank=True, verbose_name="Automatic reminder sent at")
 
-    # Once an invoice is paid, a recipient is generated. PDF base64
-    pdf_receipt = models.TextField(blank=True, null=False)
+    # Once an invoice is paid, a recipient is generated. PDF, and a hash
+    # of it (maintained by a trigger)
+    pdf_receipt = models.BinaryField(blank=True, null=True)
+    pdf_receipt_hashval = models.BinaryField(blank=True, null=True)
 
     # Information for accounting of this invoice. This is intentionally not
     # foreign keys - we'll just drop some such information into the system
@@ -370,3 +375,27 @@ class BankStatementRow(models.Model):
         index_together = (
             ('method', 'date'),
         )
+
+
+class IncomingPaymentNotification(models.Model):
+    # Notifications (webhooks) received from payment providers. They are
+    # stored here once authenticated and acknowledged right away, and then
+    # processed by the process_payment_notifications job. The key is
+    # provided by the payment implementation and is used to ignore
+    # notifications that the provider delivers more than once.
+    paymentmethod = models.ForeignKey(InvoicePaymentMethod, null=False, blank=False, on_delete=models.CASCADE)
+    idempotencykey = models.CharField(max_length=200, null=False, blank=False)
+    payload = models.JSONField(null=False, blank=False, encoder=DjangoJSONEncoder)
+    receivedat = models.DateTimeField(null=False, blank=False, auto_now_add=True)
+    processedat = models.DateTimeField(null=True, blank=True)
+    attempts = models.IntegerField(null=False, blank=False, default=0)
+    nextattemptat = models.DateTimeField(null=True, blank=True, default=timezone.now)
+    lasterror = models.TextField(null=False, blank=True)
+
+    class Meta:
+        unique_together = (
+            ('paymentmethod', 'idempotencykey'),
+        )
+        indexes = [
+            models.Index(name='invoices_paymentnotif_pending', fields=['nextattemptat'], condition=models.Q(processedat__isnull=True)),
+        ]
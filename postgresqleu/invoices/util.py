@@ -1,14 +1,18 @@
 from django.db import transaction
-from django.db.models import Sum
+from django.db.models import Sum, Prefetch, prefetch_related_objects
 from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
 
 from collections import defaultdict
+from contextlib import nullcontext
 from dateutil import rrule
+from datetime import timedelta
 from decimal import Decimal
+import functools
 import importlib
-import base64
+import json
 import re
 import io
 
@@ -16,14 +20,26 @@ from postgresqleu.mailqueue.util import send_template_mail, send_simple_mail
 from postgresqleu.accounting.util import create_accounting_entry
 from postgresqleu.util.currency import format_currency
 from postgresqleu.util.random import generate_random_token
+from postgresqleu.util.checksum import luhn
+from postgresqleu.util.db import exec_to_scalar, exec_to_list
+from postgresqleu.scheduler.util import trigger_immediate_job_run
 
 from .models import Invoice, InvoiceRow, InvoiceHistory, InvoiceLog
 from .models import InvoiceRefund
 from .models import InvoicePaymentMethod, PaymentMethodWrapper
 from .models import PendingBankTransaction, PendingBankMatcher
+from .models import IncomingPaymentNotification
 from postgresqleu.accounting.models import Account
 
 
+# The classes used to build PDFs are configured by their full python path,
+# and only need to be looked up once per process.
+@functools.lru_cache(maxsize=None)
+def _get_pdf_builder(classpath):
+    (modname, classname) = classpath.rsplit('.', 1)
+    return getattr(importlib.import_module(modname), classname)
+
+
 # Proxy around an invoice that adds presentation information,
 # such as the ability to render a return URL for the invoice.
 # It also blocks access to unsafe variables that could be used
@@ -78,7 +94,7 @@ class InvoiceWrapper(object):
         self.invoice.recipient_secret = generate_random_token()
 
         # Generate pdf
-        self.invoice.pdf_invoice = base64.b64encode(self.render_pdf_invoice()).decode('ascii')
+        self.invoice.pdf_invoice = self.render_pdf_invoice()
 
         # Indicate that we're finalized
         self.invoice.finalized = True
@@ -94,8 +110,7 @@ class InvoiceWrapper(object):
         return self._render_pdf(receipt=True)
 
     def _render_pdf(self, preview=False, receipt=False):
-        (modname, classname) = settings.INVOICE_PDF_BUILDER.rsplit('.', 1)
-        PDFInvoice = getattr(importlib.import_module(modname), classname)
+        PDFInvoice = _get_pdf_builder(settings.INVOICE_PDF_BUILDER)
         if self.invoice.recipient_secret:
             paymentlink = '{0}/invoices/{1}/{2}/'.format(settings.SITEBASE, self.invoice.pk, self.invoice.recipient_secret)
         else:
@@ -130,15 +145,19 @@ class InvoiceWrapper(object):
         # Order of rows is important - so preserve whatever order they were created
         # in. This is also the order that they get rendered by automatically by
         # djangos inline forms, so it should be consistent with whatever is shown
-        # on the website.
-        for r in self.invoice.invoicerow_set.all().order_by('id'):
+        # on the website. If the rows have been prefetched by render_pdf_invoices()
+        # they are already in this order.
+        if hasattr(self.invoice, 'pdfrows'):
+            rows = self.invoice.pdfrows
+        else:
+            rows = self.invoice.invoicerow_set.select_related('vatrate').order_by('id')
+        for r in rows:
             pdfinvoice.addrow(r.rowtext, r.rowamount, r.rowcount, r.vatrate)
 
         return pdfinvoice.save().getvalue()
 
     def render_pdf_refund(self, refund):
-        (modname, classname) = settings.REFUND_PDF_BUILDER.rsplit('.', 1)
-        PDFRefund = getattr(importlib.import_module(modname), classname)
+        PDFRefund = _get_pdf_builder(settings.REFUND_PDF_BUILDER)
         pdfnote = PDFRefund("%s\n%s" % (self.invoice.recipient_name, self.invoice.recipient_address),
                             self.invoice.invoicedate,
                             refund.completed,
@@ -215,7 +234,7 @@ class InvoiceWrapper(object):
 
     def email_refund_sent(self, refund):
         # Generate the refund notice so we have something to send
-        refund.refund_pdf = base64.b64encode(self.render_pdf_refund(refund)).decode('ascii')
+        refund.refund_pdf = self.render_pdf_refund(refund)
         refund.save()
 
         self._email_something('invoice_refund.txt',
@@ -257,7 +276,7 @@ class InvoiceWrapper(object):
 
         pdfdata = []
         if pdfname:
-            pdfdata = [(pdfname, 'application/pdf', base64.b64decode(pdfcontents)), ]
+            pdfdata = [(pdfname, 'application/pdf', bytes(pdfcontents)), ]
 
         if bcc:
             bcclist = [settings.INVOICE_NOTIFICATION_RECEIVER, ]
@@ -277,6 +296,19 @@ class InvoiceWrapper(object):
                        )
 
 
+# Render the invoice PDFs (or receipt PDFs) for a list of invoices, loading
+# the rows and payment methods of all of them in a single pass. Returns a list
+# with the PDFs in the same order as the invoices.
+def render_pdf_invoices(invoices, receipt=False):
+    invoices = list(invoices)
+    prefetch_related_objects(
+        invoices,
+        Prefetch('invoicerow_set', queryset=InvoiceRow.objects.select_related('vatrate').order_by('id'), to_attr='pdfrows'),
+        'allowedmethods',
+    )
+    return [InvoiceWrapper(i)._render_pdf(receipt=receipt) for i in invoices]
+
+
 def _standard_logger(message):
     print(message)
 
@@ -387,7 +419,7 @@ class InvoiceManager(object):
 
         # Generate a PDF receipt for this, since it's now paid
         wrapper = InvoiceWrapper(invoice)
-        invoice.pdf_receipt = base64.b64encode(wrapper.render_pdf_receipt()).decode('ascii')
+        invoice.pdf_receipt = wrapper.render_pdf_receipt()
 
         # Save and we're done!
         invoice.save()
@@ -805,9 +837,10 @@ def is_managed_bank_account(account):
     ).exists()
 
 
-def automatch_bank_transaction_rule(trans, matcher):
-    # We only do exact matching, fuzzyness is handled elsewhere
-    if trans.amount == matcher.amount and re.match(matcher.pattern, trans.transtext, re.I):
+def automatch_bank_transaction_rule(trans, matcher, regex):
+    # We only do exact matching, fuzzyness is handled elsewhere. The regex is
+    # the compiled version of the pattern on the matcher.
+    if trans.amount == matcher.amount and regex.match(trans.transtext):
         # Flag the journal entry as closed since this transaction now arrived
         if matcher.journalentry.closed:
             send_simple_mail(settings.INVOICE_SENDER_EMAIL,
@@ -837,6 +870,10 @@ def automatch_bank_transaction_rule(trans, matcher):
         return True
 
 
+def compile_bank_matcher_pattern(pattern):
+    return re.compile(pattern, re.I)
+
+
 # Handle a new bank matcher. If it matches something already in the pending bank transfer
 # queue then process it. If not, then stick it in the queue.
 def register_pending_bank_matcher(account, pattern, amount, journalentry):
@@ -851,10 +888,12 @@ def register_pending_bank_matcher(account, pattern, amount, journalentry):
                                  amount=amount,
                                  foraccount=account,
                                  journalentry=journalentry)
+    regex = compile_bank_matcher_pattern(pattern)
 
-    # Run the matcher across all pending banktransactions
-    for bt in PendingBankTransaction.objects.all():
-        if automatch_bank_transaction_rule(bt, matcher):
+    # Run the matcher across all pending banktransactions. Only exact amounts
+    # can ever match, so let the database do that part of the filtering.
+    for bt in PendingBankTransaction.objects.filter(amount=amount):
+        if automatch_bank_transaction_rule(bt, matcher, regex):
             # The matcher object is never saved, but remove the pending
             # bank transaction since it is now "used".
             bt.delete()
@@ -865,22 +904,91 @@ def register_pending_bank_matcher(account, pattern, amount, journalentry):
     matcher.save()
 
 
-# Handle a new bank transaction that has arrived. If it matches an invoice or
-# an existing BankMatcher, process that one immediately. If not, stick it on
-# the list of pending ones.
-# Returns true if the transaction was immediately matched to something and needs
-# no further processing.
-def register_bank_transaction(method, methodidentifier, amount, transtext, sender, canreturn=False):
-    if not isinstance(amount, Decimal):
-        raise Exception("Amount must be specified as Decimal, not {}!".format(type(amount)))
-
-    # First try to match it against pending invoices.
-    # We search by amount and then match by payment reference as our primary choice.
-    for invoice in Invoice.objects.filter(finalized=True,
-                                          deleted=False,
-                                          paidat__isnull=True,
-                                          total_amount=amount):
-        if invoice.payment_reference in transtext.replace(' ', ''):
+# Payment references are made from the last 4 digits of the invoice timestamp,
+# the invoice id zero-padded to at least 5 digits and a luhn check digit (see
+# Invoice.payment_reference). Since invoice ids are regular integers, the id
+# part can never be more than 10 digits.
+_payment_reference_digits_re = re.compile(r'[0-9]{10,}')
+
+
+# Find the ids of all invoices whose payment reference could be included in
+# the text of a bank transaction, by looking at every string of digits in
+# it that looks like a payment reference with a valid check digit. This is
+# only used to find candidates, the actual match is always made against the
+# payment reference of the invoice itself.
+def _payment_reference_invoice_ids(transtext):
+    ids = set()
+    for m in _payment_reference_digits_re.finditer(transtext.replace(' ', '')):
+        digits = m.group(0)
+        for length in range(10, min(len(digits), 15) + 1):
+            for start in range(0, len(digits) - length + 1):
+                ref = digits[start:start + length]
+                if luhn(ref[:-1]) != int(ref[-1]):
+                    continue
+                idstr = ref[4:-1]
+                if len(idstr) > 5 and idstr[0] == '0':
+                    # Ids are only zero-padded up to 5 digits
+                    continue
+                invoiceid = int(idstr)
+                if 0 < invoiceid <= 2147483647:
+                    ids.add(invoiceid)
+    return ids
+
+
+# Match a set of bank transactions that have arrived against unpaid invoices
+# and pending bank matchers. Candidate invoices for all transactions are looked
+# up by their payment references in a single query, and the pending bank matchers
+# are loaded (and their patterns compiled) once for the whole set, so this should
+# be used when processing a whole bank statement or feed at once.
+class BankTransactionMatcher(object):
+    def __init__(self, method, transactions):
+        self.method = method
+
+        invoiceids = set()
+        self.amounts = set()
+        for methodidentifier, amount, transtext, sender, canreturn in transactions:
+            if not isinstance(amount, Decimal):
+                raise Exception("Amount must be specified as Decimal, not {}!".format(type(amount)))
+            invoiceids.update(_payment_reference_invoice_ids(transtext))
+            self.amounts.add(amount)
+
+        # Unpaid invoices indexed by id, in the order they should be tried
+        if invoiceids:
+            self.invoices = {i.id: i for i in Invoice.objects.defer('pdf_invoice', 'pdf_receipt').filter(
+                finalized=True,
+                deleted=False,
+                paidat__isnull=True,
+                pk__in=invoiceids,
+            ).order_by('-id')}
+        else:
+            self.invoices = {}
+        self._matchers = None
+
+    @property
+    def matchers(self):
+        # Pending bank matchers indexed by amount, with their compiled patterns.
+        # Loaded the first time a transaction doesn't match an invoice.
+        if self._matchers is None:
+            self._matchers = defaultdict(list)
+            for matcher in PendingBankMatcher.objects.select_related('journalentry').filter(amount__in=self.amounts).order_by('id'):
+                self._matchers[matcher.amount].append((matcher, compile_bank_matcher_pattern(matcher.pattern)))
+        return self._matchers
+
+    def find_invoice(self, amount, transtext):
+        reftext = transtext.replace(' ', '')
+        for invoiceid in sorted(_payment_reference_invoice_ids(transtext) & self.invoices.keys(), reverse=True):
+            invoice = self.invoices[invoiceid]
+            if invoice.total_amount == amount and invoice.payment_reference in reftext:
+                return invoice
+        return None
+
+    def register(self, methodidentifier, amount, transtext, sender, canreturn=False):
+        method = self.method
+
+        # First try to match it against pending invoices.
+        # We search by payment reference and then verify the amount as our primary choice.
+        invoice = self.find_invoice(amount, transtext)
+        if invoice:
             # We have a match!
             pm = method.get_implementation()
 
@@ -923,6 +1031,9 @@ def register_bank_transaction(method, methodidentifier, amount, transtext, sende
 
                 return False  # Needs more preocessing since we failed
 
+            # The invoice is paid now, so it can't be matched by any other transaction
+            del self.invoices[invoice.id]
+
             # On success, send a notification
             send_simple_mail(settings.INVOICE_SENDER_EMAIL,
                              settings.INVOICE_NOTIFICATION_RECEIVER,
@@ -941,27 +1052,171 @@ def register_bank_transaction(method, methodidentifier, amount, transtext, sende
             # yet, so just consider it done.
             return True
 
-    # If no invoices are found, then try to match it against the pending
-    # bank matchers. (Check this later because it's a it more expensive)
+        # If no invoices are found, then try to match it against the pending
+        # bank matchers. (Check this later because it's a it more expensive)
 
-    # Create an object so we can try to match it, but hold off on saving
-    # it until we know.
-    trans = PendingBankTransaction(method=method,
-                                   methodidentifier=methodidentifier,
-                                   created=timezone.now(),
-                                   amount=amount,
-                                   transtext=transtext,
-                                   sender=sender,
-                                   canreturn=canreturn and amount > 0,
-    )
+        # Create an object so we can try to match it, but hold off on saving
+        # it until we know.
+        trans = PendingBankTransaction(method=method,
+                                       methodidentifier=methodidentifier,
+                                       created=timezone.now(),
+                                       amount=amount,
+                                       transtext=transtext,
+                                       sender=sender,
+                                       canreturn=canreturn and amount > 0,
+        )
+
+        matchers = self.matchers[amount]
+        for n, (matcher, regex) in enumerate(matchers):
+            if automatch_bank_transaction_rule(trans, matcher, regex):
+                matcher.delete()
+                del matchers[n]
+                return True
+
+        # Not found, so save it for future matching (probably going to end up manual)
+        trans.save()
+
+        # More processing needed later, so return False
+        return False
+
+
+# Handle a list of new bank transactions that have arrived, all on the same payment
+# method. Each transaction is a tuple of (methodidentifier, amount, transtext, sender,
+# canreturn), and they are processed in order just like register_bank_transaction.
+# Returns a list with the result for each transaction.
+def register_bank_transactions(method, transactions):
+    transactions = list(transactions)
+    if not transactions:
+        return []
+
+    matcher = BankTransactionMatcher(method, transactions)
+    return [matcher.register(*t) for t in transactions]
 
-    for matcher in PendingBankMatcher.objects.all():
-        if automatch_bank_transaction_rule(trans, matcher):
-            matcher.delete()
-            return True
 
-    # Not found, so save it for future matching (probably going to end up manual)
-    trans.save()
+# Handle a new bank transaction that has arrived. If it matches an invoice or
+# an existing BankMatcher, process that one immediately. If not, stick it on
+# the list of pending ones.
+# Returns true if the transaction was immediately matched to something and needs
+# no further processing.
+def register_bank_transaction(method, methodidentifier, amount, transtext, sender, canreturn=False):
+    return register_bank_transactions(method, [(methodidentifier, amount, transtext, sender, canreturn)])[0]
+
+
+# Queue a notification received from a payment provider for processing by
+# the process_payment_notifications job. The caller is expected to have
+# verified the authenticity of the notification already, so that it can be
+# acknowledged to the provider as soon as this returns. Returns False if a
+# notification with the same key has already been received, in which case
+# nothing is queued.
+def queue_payment_notification(method, idempotencykey, payload):
+    if not hasattr(method.get_implementation(), 'process_queued_notification'):
+        raise Exception("Payment method {} does not support queued notifications".format(method.internaldescription))
+
+    notificationid = exec_to_scalar("""INSERT INTO invoices_incomingpaymentnotification
+ (paymentmethod_id, idempotencykey, payload, receivedat, attempts, nextattemptat, lasterror)
+ VALUES (%(methodid)s, %(key)s, %(payload)s, CURRENT_TIMESTAMP, 0, CURRENT_TIMESTAMP, '')
+ ON CONFLICT (paymentmethod_id, idempotencykey) DO NOTHING
+ RETURNING id""", {
+        'methodid': method.id,
+        'key': idempotencykey,
+        'payload': json.dumps(payload, cls=DjangoJSONEncoder),
+    })
+    if notificationid is None:
+        return False
+
+    trigger_immediate_job_run('process_payment_notifications')
+    return True
+
+
+# Number of attempts made to process a notification before giving up
+# and leaving it for manual investigation.
+PAYMENT_NOTIFICATION_MAX_ATTEMPTS = 10
+
+
+def _payment_notification_retry_delay(attempts):
+    return min(timedelta(minutes=5) * 2 ** (attempts - 1), timedelta(hours=6))
+
+
+# Process all queued payment notifications that are due. Each notification
+# is handed to the process_queued_notification() method of the payment
+# implementation that received it, which should return True once it has
+# been dealt with. Notifications that fail are retried with an increasing
+# delay. Returns the number of notifications successfully processed.
+def process_payment_notifications(logger=None):
+    processed = 0
+    while True:
+        # Claim the next notification and push the time for the next attempt
+        # ahead before we start processing, so if processing crashes the
+        # notification will be retried later instead of immediately.
+        with transaction.atomic():
+            n = IncomingPaymentNotification.objects.select_related('paymentmethod').select_for_update(skip_locked=True, of=('self', )).filter(
+                processedat__isnull=True,
+                nextattemptat__lte=timezone.now(),
+            ).order_by('nextattemptat').first()
+            if not n:
+                return processed
+            n.attempts += 1
+            n.nextattemptat = timezone.now() + _payment_notification_retry_delay(n.attempts)
+            n.save(update_fields=['attempts', 'nextattemptat'])
+
+        giveup = n.attempts >= PAYMENT_NOTIFICATION_MAX_ATTEMPTS
+        try:
+            impl = n.paymentmethod.get_implementation()
+            if not hasattr(impl, 'process_queued_notification'):
+                # Retrying won't help
+                error = "Payment method does not support queued notifications"
+                giveup = True
+            else:
+                # Methods that don't manage their own transactions get the
+                # processing and flagging the notification as processed done
+                # in a single one, so a failure half way through is rolled
+                # back and the whole notification processed again on retry.
+                with transaction.atomic() if getattr(impl, 'atomic_queued_notifications', False) else nullcontext():
+                    if impl.process_queued_notification(n.payload):
+                        error = None
+                        n.processedat = timezone.now()
+                        n.lasterror = ''
+                        n.save(update_fields=['processedat', 'lasterror'])
+                    else:
+                        error = "Processing failed, see the payment provider log for details"
+        except Exception as e:
+            error = "Exception processing notification: {}".format(e)
+
+        if error is None:
+            processed += 1
+            continue
 
-    # More processing needed later, so return False
-    return False
+        n.lasterror = error
+        if giveup:
+            n.nextattemptat = None
+            send_simple_mail(settings.INVOICE_SENDER_EMAIL,
+                             settings.INVOICE_NOTIFICATION_RECEIVER,
+                             'Payment notification processing failed',
+                             "Processing of notification {} ({}) from {} failed {} times and will not be retried.\nThe last error was:\n\n{}\n".format(
+                                 n.id,
+                                 n.idempotencykey,
+                                 n.paymentmethod.internaldescription,
+                                 n.attempts,
+                                 error,
+                             ))
+        n.save(update_fields=['lasterror', 'nextattemptat'])
+        if logger:
+            logger("Notification {} from {} failed: {}".format(n.id, n.paymentmethod.internaldescription, error))
+
+
+# Processing latency for payment notifications, per payment method, over
+# the given period.
+def get_payment_notification_latency(since):
+    return exec_to_list("""SELECT m.internaldescription,
+ count(*) FILTER (WHERE processedat IS NOT NULL),
+ count(*) FILTER (WHERE processedat IS NULL),
+ avg(processedat - receivedat),
+ percentile_cont(0.95) WITHIN GROUP (ORDER BY processedat - receivedat),
+ max(processedat - receivedat)
+FROM invoices_incomingpaymentnotification n
+INNER JOIN invoices_invoicepaymentmethod m ON m.id=n.paymentmethod_id
+WHERE n.receivedat >= %(since)s
+GROUP BY m.id, m.internaldescription
+ORDER BY m.internaldescription""", {
+        'since': since,
+    })
@@ -1,21 +1,20 @@
 from django.shortcuts import render, get_object_or_404
 from django.forms.models import inlineformset_factory
 from django.forms import ModelMultipleChoiceField
-from django.http import HttpResponseRedirect, HttpResponse, HttpResponseForbidden
+from django.http import HttpResponseRedirect, HttpResponse, HttpResponseForbidden, Http404
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
 from django.db.models import Q, Count, Max
 from django.contrib import messages
 from django.conf import settings
 
-import base64
 import io
 from datetime import timedelta
 from decimal import Decimal
 
 from postgresqleu.util.auth import authenticate_backend_group
 from postgresqleu.util.pagination import simple_pagination
-from postgresqleu.util.request import get_int_or_error
+from postgresqleu.util.request import get_int_or_error, conditional_response
 from postgresqleu.util.time import today_global
 from .models import Invoice, InvoiceRow, InvoiceHistory, InvoicePaymentMethod, VatRate
 from .models import InvoiceRefund
@@ -45,8 +44,8 @@ def _homeview(request, invoice_objects, unpaid=False, pending=False, deleted=Fal
     # check here.
     authenticate_backend_group(request, 'Invoice managers')
 
-    # Add info about refunds to all invoices
-    invoice_objects = invoice_objects.extra(select={
+    # Add info about refunds to all invoices, and skip loading the PDFs
+    invoice_objects = invoice_objects.defer('pdf_invoice', 'pdf_receipt').extra(select={
         'has_refund': 'EXISTS (SELECT 1 FROM invoices_invoicerefund r WHERE r.invoice_id=invoices_invoice.id)',
     })
 
@@ -99,7 +98,7 @@ def search(request):
         # Not an integer, so perform an actual search...
         pass
 
-    invoices = Invoice.objects.filter(Q(recipient_name__icontains=term) | Q(recipient_address__icontains=term) | Q(title__icontains=term))
+    invoices = Invoice.objects.defer('pdf_invoice', 'pdf_receipt').filter(Q(recipient_name__icontains=term) | Q(recipient_address__icontains=term) | Q(title__icontains=term))
     if len(invoices) == 0:
         messages.warning(request, "No invoice matching '%s' found." % term)
         return HttpResponseRedirect("/invoiceadmin/")
@@ -403,75 +402,91 @@ def viewinvoice_secret(request, invoiceid, invoicesecret):
     })
 
 
+def _pdf_response(request, hashval, getpdf, filename):
+    # The hash of the PDF is maintained by the database, so it can be used to
+    # return 304 without loading the actual PDF, which is only fetched (from a
+    # deferred field) if the client doesn't already have it.
+    if not hashval:
+        raise Http404()
+
+    def _render():
+        r = HttpResponse(getpdf(), content_type='application/pdf')
+        r['Content-disposition'] = 'filename={}'.format(filename)
+        return r
+
+    return conditional_response(request, bytes(hashval).hex(), None, _render)
+
+
+def _invoicepdf_response(request, invoice):
+    return _pdf_response(request,
+                         invoice.pdf_invoice_hashval,
+                         lambda: invoice.pdf_invoice,
+                         '{}_invoice_{}.pdf'.format(settings.INVOICE_FILENAME_PREFIX, invoice.id))
+
+
+def _receipt_response(request, invoice):
+    return _pdf_response(request,
+                         invoice.pdf_receipt_hashval,
+                         lambda: invoice.pdf_receipt,
+                         '{}_receipt_{}.pdf'.format(settings.INVOICE_FILENAME_PREFIX, invoice.id))
+
+
+def _refundnote_response(request, invoice, refundid):
+    refund = get_object_or_404(InvoiceRefund.objects.defer('refund_pdf'), invoice=invoice, pk=refundid)
+    return _pdf_response(request,
+                         refund.refund_pdf_hashval,
+                         lambda: refund.refund_pdf,
+                         '{}_refund_{}.pdf'.format(settings.INVOICE_FILENAME_PREFIX, invoice.id))
+
+
 @login_required
 def viewinvoicepdf(request, invoiceid):
-    invoice = get_object_or_404(Invoice, pk=invoiceid)
+    invoice = get_object_or_404(Invoice.objects.defer('pdf_invoice', 'pdf_receipt'), pk=invoiceid)
     if invoice.recipient_user != request.user:
         # End users can only view their own invoices, but invoice managers can view all
         authenticate_backend_group(request, 'Invoice managers')
 
-    r = HttpResponse(content_type='application/pdf')
-    r['Content-disposition'] = 'filename={}_invoice_{}.pdf'.format(settings.INVOICE_FILENAME_PREFIX, invoice.id)
-    r.write(base64.b64decode(invoice.pdf_invoice))
-    return r
+    return _invoicepdf_response(request, invoice)
 
 
 def viewinvoicepdf_secret(request, invoiceid, invoicesecret):
-    invoice = get_object_or_404(Invoice, pk=invoiceid, recipient_secret=invoicesecret)
-    r = HttpResponse(content_type='application/pdf')
-    r['Content-disposition'] = 'filename={}_invoice_{}.pdf'.format(settings.INVOICE_FILENAME_PREFIX, invoice.id)
-    r.write(base64.b64decode(invoice.pdf_invoice))
-    return r
+    invoice = get_object_or_404(Invoice.objects.defer('pdf_invoice', 'pdf_receipt'), pk=invoiceid, recipient_secret=invoicesecret)
+    return _invoicepdf_response(request, invoice)
 
 
 @login_required
 def viewreceipt(request, invoiceid):
-    invoice = get_object_or_404(Invoice, pk=invoiceid)
+    invoice = get_object_or_404(Invoice.objects.defer('pdf_invoice', 'pdf_receipt'), pk=invoiceid)
     if invoice.recipient_user != request.user:
         # End users can only view their own invoices, but invoice managers can view all
         authenticate_backend_group(request, 'Invoice managers')
 
-    r = HttpResponse(content_type='application/pdf')
-    r['Content-disposition'] = 'filename={}_receipt_{}.pdf'.format(settings.INVOICE_FILENAME_PREFIX, invoice.id)
-    r.write(base64.b64decode(invoice.pdf_receipt))
-    return r
+    return _receipt_response(request, invoice)
 
 
 def viewreceipt_secret(request, invoiceid, invoicesecret):
-    invoice = get_object_or_404(Invoice, pk=invoiceid, recipient_secret=invoicesecret)
-    r = HttpResponse(content_type='application/pdf')
-    r['Content-disposition'] = 'filename={}_receipt_{}.pdf'.format(settings.INVOICE_FILENAME_PREFIX, invoice.id)
-    r.write(base64.b64decode(invoice.pdf_receipt))
-    return r
+    invoice = get_object_or_404(Invoice.objects.defer('pdf_invoice', 'pdf_receipt'), pk=invoiceid, recipient_secret=invoicesecret)
+    return _receipt_response(request, invoice)
 
 
 @login_required
 def viewrefundnote(request, invoiceid, refundid):
-    invoice = get_object_or_404(Invoice, pk=invoiceid)
+    invoice = get_object_or_404(Invoice.objects.defer('pdf_invoice', 'pdf_receipt'), pk=invoiceid)
     if invoice.recipient_user != request.user:
         # End users can only view their own invoices, but invoice managers can view all
         authenticate_backend_group(request, 'Invoice managers')
 
-    refund = get_object_or_404(InvoiceRefund, invoice=invoiceid, pk=refundid)
-
-    r = HttpResponse(content_type='application/pdf')
-    r['Content-disposition'] = 'filename={}_refund_{}.pdf'.format(settings.INVOICE_FILENAME_PREFIX, invoice.id)
-    r.write(base64.b64decode(refund.refund_pdf))
-    return r
+    return _refundnote_response(request, invoice, refundid)
 
 
 def viewrefundnote_secret(request, invoiceid, invoicesecret, refundid):
-    invoice = get_object_or_404(Invoice, pk=invoiceid, recipient_secret=invoicesecret)
-    refund = get_object_or_404(InvoiceRefund, invoice=invoice, pk=refundid)
-    r = HttpResponse(content_type='application/pdf')
-    r['Content-disposition'] = 'filename={}_refund_{}.pdf'.format(settings.INVOICE_FILENAME_PREFIX, invoice.id)
-    r.write(base64.b64decode(refund.refund_pdf))
-    return r
+    invoice = get_object_or_404(Invoice.objects.defer('pdf_invoice', 'pdf_receipt'), pk=invoiceid, recipient_secret=invoicesecret)
+    return _refundnote_response(request, invoice, refundid)
 
 
 @login_required
 def userhome(request):
-    invoices = Invoice.objects.filter(recipient_user=request.user, deleted=False, finalized=True)
+    invoices = Invoice.objects.defer('pdf_invoice', 'pdf_receipt').filter(recipient_user=request.user, deleted=False, finalized=True)
     return render(request, 'invoices/userhome.html', {
         'invoices': invoices,
     })
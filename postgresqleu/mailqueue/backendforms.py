@@ -21,8 +21,10 @@ class BackendMailqueueAttachmentManager:
 
 class BackendMailqueueForm(BackendForm):
     decoded = forms.CharField(label="Decoded message", widget=StaticTextWidget(monospace=True))
+    fullmsg = forms.CharField(label="Full message", widget=forms.Textarea)
 
     list_fields = ['sendtime', 'regtime', 'sendtime', 'sender', 'receiver', 'subject', ]
+    queryset_select_related = ['body', ]
     helplink = 'mail'
     readonly_fields = ['sender', 'receiver', 'sendtime', 'subject', 'fullmsg', ]
     linked_objects = OrderedDict({
@@ -31,9 +33,10 @@ class BackendMailqueueForm(BackendForm):
 
     class Meta:
         model = QueuedMail
-        fields = ['sender', 'receiver', 'sendtime', 'subject', 'fullmsg', ]
+        fields = ['sender', 'receiver', 'sendtime', 'subject', ]
 
     def fix_fields(self):
+        self.initial['fullmsg'] = self.instance.fullmsg
         self.initial['decoded'] = self.parsed_content().decode('utf8', errors='ignore').replace("\n", "<br/>")
 
     def parsed_content(self):
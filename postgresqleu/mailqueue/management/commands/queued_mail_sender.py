@@ -0,0 +1,60 @@
+#
+# Daemon to send queued email as soon as it's committed to the queue,
+# instead of waiting for the next cron run of send_queued_mail.
+#
+
+from django.db import connection
+from django.db.models import Min
+from django.utils import timezone
+
+import select
+import smtplib
+
+from postgresqleu.util.reload import ReloadCommand
+from postgresqleu.mailqueue.models import QueuedMail
+from postgresqleu.mailqueue.sender import send_pending_mail
+
+
+class Command(ReloadCommand):
+    help = 'Daemon to send queued mail'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of parallel workers')
+        parser.add_argument('--batchsize', type=int, default=50, help='Number of messages to send in each batch')
+
+    def handle_with_reload(self, args, options):
+        with connection.cursor() as curs:
+            curs.execute("LISTEN pgeu_mail")
+            curs.execute("SET application_name = 'pgeu mail sender'")
+
+        while True:
+            # Eat notifications before we start sending, so that anything
+            # queued while we're sending wakes us up again.
+            self.eat_notifications()
+
+            try:
+                stats = send_pending_mail(options['workers'], options['batchsize'])
+                if stats.sent:
+                    print("Sent {} messages in {:.2f} seconds".format(stats.sent, stats.elapsed))
+            except (smtplib.SMTPException, OSError) as e:
+                # If the mailserver is unavailable, retry in a minute. Anything
+                # that's been sent already has been removed from the queue.
+                print("Failed to send queued mail: {}. Retrying in 60 seconds.".format(e))
+                select.select([], [], [], 60)
+                continue
+
+            # Sleep until the next mail that is scheduled in the future is
+            # due, or until new mail is queued. Wake up every 5 minutes just
+            # in case a notification was lost.
+            nexttime = QueuedMail.objects.filter(sendtime__gt=timezone.now()).aggregate(n=Min('sendtime'))['n']
+            if nexttime:
+                timeout = min(max((nexttime - timezone.now()).total_seconds(), 0), 5 * 60)
+            else:
+                timeout = 5 * 60
+
+            select.select([connection.connection], [], [], timeout)
+
+    def eat_notifications(self):
+        connection.connection.poll()
+        while connection.connection.notifies:
+            connection.connection.notifies.pop()
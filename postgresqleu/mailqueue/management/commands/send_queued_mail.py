@@ -2,36 +2,47 @@
 #
 # This script is intended to be run frequently from cron. We queue things
 # up in the db so that they get automatically rolled back as necessary,
-# but once we reach this point we're just going to send all of them one
-# by one.
+# but once we reach this point we're just going to send all of them, in
+# batches, over a small pool of reused SMTP connections.
 #
 from django.core.management.base import BaseCommand, CommandError
 from django.db import connection
-from django.conf import settings
-from django.utils import timezone
 
-import smtplib
-
-from postgresqleu.mailqueue.models import QueuedMail
+from postgresqleu.mailqueue.sender import send_pending_mail
 
 
 class Command(BaseCommand):
     help = 'Send queued mail'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Number of parallel workers')
+        parser.add_argument('--batchsize', type=int, default=50, help='Number of messages to send in each batch')
+
     def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError("Must have at least one worker")
+        if options['batchsize'] < 1:
+            raise CommandError("Batch size must be at least one")
+
         # Grab advisory lock, if available. Lock id is just a random number
         # since we only need to interlock against ourselves. The lock is
-        # automatically released when we're done.
+        # automatically released when we're done. Individual rows are locked
+        # as they are sent, so this only protects against piling up runs.
         curs = connection.cursor()
         curs.execute("SELECT pg_try_advisory_lock(72181378)")
         if not curs.fetchall()[0][0]:
             raise CommandError("Failed to get advisory lock, existing send_queued_mail process stuck?")
 
-        for m in QueuedMail.objects.filter(sendtime__lte=timezone.now()):
-            # Yes, we do a new connection for each run. Just because we can.
-            # If it fails we'll throw an exception and just come back on the
-            # next cron job. And local delivery should never fail...
-            smtp = smtplib.SMTP(getattr(settings, "SMTPSERVER", "localhost"))
-            smtp.sendmail(m.sender, m.receiver, m.fullmsg.encode('utf-8'))
-            smtp.close()
-            m.delete()
+        verbose = options['verbosity'] > 1
+
+        def _batchstats(numsent, elapsed):
+            if verbose:
+                self.stdout.write("Sent batch of {} messages in {:.2f} seconds ({:.1f} messages/second)".format(
+                    numsent,
+                    elapsed,
+                    numsent / elapsed if elapsed else 0,
+                ))
+
+        stats = send_pending_mail(options['workers'], options['batchsize'], _batchstats)
+        if verbose and stats.sent:
+            self.stdout.write("Sent {} messages in {} batches in {:.2f} seconds".format(stats.sent, stats.batches, stats.elapsed))
@@ -0,0 +1,35 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailqueue', '0003_queuedmail_regtime'),
+    ]
+
+    # The body reference is added without a constraint here, filled in by
+    # 0005 and only made required and constrained in 0006. Each migration
+    # runs in its own transaction, so the constraint is never added while
+    # there are pending deferred trigger events from updating the rows.
+    # fullmsg is made nullable so that reversing the removal in 0006 can
+    # add it back on a non-empty queue before 0005 fills it in again.
+    operations = [
+        migrations.CreateModel(
+            name='QueuedMailBody',
+            fields=[
+                ('hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('fullmsg', models.TextField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='queuedmail',
+            name='body',
+            field=models.ForeignKey(null=True, db_constraint=False, on_delete=django.db.models.deletion.PROTECT, to='mailqueue.queuedmailbody'),
+        ),
+        migrations.AlterField(
+            model_name='queuedmail',
+            name='fullmsg',
+            field=models.TextField(null=True),
+        ),
+    ]
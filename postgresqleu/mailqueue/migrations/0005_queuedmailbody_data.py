@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailqueue', '0004_queuedmailbody'),
+    ]
+
+    operations = [
+        # Must match the hashing in mailqueue.util
+        migrations.RunSQL("""INSERT INTO mailqueue_queuedmailbody (hash, fullmsg)
+SELECT DISTINCT encode(sha256(convert_to(fullmsg, 'UTF8')), 'hex'), fullmsg FROM mailqueue_queuedmail""",
+                          migrations.RunSQL.noop),
+        migrations.RunSQL("UPDATE mailqueue_queuedmail SET body_id=encode(sha256(convert_to(fullmsg, 'UTF8')), 'hex')",
+                          "UPDATE mailqueue_queuedmail q SET fullmsg=b.fullmsg FROM mailqueue_queuedmailbody b WHERE b.hash=q.body_id"),
+    ]
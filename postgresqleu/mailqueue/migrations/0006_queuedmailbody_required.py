@@ -0,0 +1,21 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailqueue', '0005_queuedmailbody_data'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='queuedmail',
+            name='body',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, to='mailqueue.queuedmailbody'),
+        ),
+        migrations.RemoveField(
+            model_name='queuedmail',
+            name='fullmsg',
+        ),
+    ]
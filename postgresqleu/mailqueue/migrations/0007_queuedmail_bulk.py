@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 19:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mailqueue', '0006_queuedmailbody_required'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='queuedmail',
+            name='bodytext',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='queuedmail',
+            name='receiverheader',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -1,19 +1,47 @@
 from django.db import models
 from django.utils import timezone
 
+# Bodies shared by all receivers of a bulk mail have these lines in place of
+# the To header and the text part, which are then stored on each QueuedMail
+# row. Neither can appear in a flattened MIME message.
+BULK_RECEIVER_PLACEHOLDER = '<<bulk-receiver>>\n'
+BULK_TEXT_PLACEHOLDER = '<<bulk-text>>\n'
+
+
+class QueuedMailBody(models.Model):
+    # The raw MIME message, stored once per unique content no matter how
+    # many recipients it's queued for. Attachments are included in here.
+    hash = models.CharField(max_length=64, null=False, blank=False, primary_key=True)
+    fullmsg = models.TextField(null=False, blank=False)
+
+    def __str__(self):
+        return self.hash
+
 
 class QueuedMail(models.Model):
     sender = models.EmailField(max_length=100, null=False, blank=False)
     receiver = models.EmailField(max_length=100, null=False, blank=False)
-    # We store the raw MIME message, so if there are any attachments or
-    # anything, we just push them right in there!
-    fullmsg = models.TextField(null=False, blank=False)
+    body = models.ForeignKey(QueuedMailBody, null=False, blank=False, on_delete=models.PROTECT)
     sendtime = models.DateTimeField(null=False, blank=False, default=timezone.now)
     regtime = models.DateTimeField(null=False, blank=False, auto_now_add=True)
     subject = models.CharField(max_length=500, null=False, blank=False)
+    # Only set for bulk mail, see above
+    receiverheader = models.TextField(null=False, blank=True, default='')
+    bodytext = models.TextField(null=False, blank=True, default='')
 
     def __str__(self):
         return "%s: %s -> %s" % (self.pk, self.sender, self.receiver)
 
+    def fullmsg_from_body(self, bodymsg):
+        if self.receiverheader:
+            bodymsg = bodymsg.replace(BULK_RECEIVER_PLACEHOLDER, self.receiverheader, 1)
+        if self.bodytext:
+            bodymsg = bodymsg.replace(BULK_TEXT_PLACEHOLDER, self.bodytext, 1)
+        return bodymsg
+
+    @property
+    def fullmsg(self):
+        return self.fullmsg_from_body(self.body.fullmsg)
+
     class Meta:
         ordering = ('sendtime', )
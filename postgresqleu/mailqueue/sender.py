@@ -0,0 +1,205 @@
+# Mail delivery functionality lives in a separate module so it can
+# be used both from the cron/scheduled job and from a daemon.
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+import queue
+import smtplib
+import threading
+import time
+
+from postgresqleu.util.db import exec_no_result
+
+from .models import QueuedMail, QueuedMailBody
+
+
+class SMTPConnectionPool(object):
+    """
+    A small pool of SMTP connections that are kept open between messages
+    and batches. Connections are health checked with a NOOP before they
+    are handed out again, and anything that looks broken is thrown away
+    and replaced with a fresh connection.
+    """
+    def __init__(self, size=1, server=None):
+        self.server = server or getattr(settings, "SMTPSERVER", "localhost")
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self):
+        return smtplib.SMTP(self.server)
+
+    def _is_healthy(self, smtp):
+        try:
+            return smtp.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    def get(self):
+        while True:
+            try:
+                smtp = self.idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if self._is_healthy(smtp):
+                return smtp
+            self.discard(smtp)
+
+    def put(self, smtp):
+        try:
+            # Make sure no half-finished transaction is left on the connection
+            smtp.rset()
+            self.idle.put_nowait(smtp)
+        except (smtplib.SMTPException, OSError, queue.Full):
+            self.discard(smtp)
+
+    def discard(self, smtp):
+        try:
+            smtp.close()
+        except Exception:
+            pass
+
+    def close(self):
+        while True:
+            try:
+                smtp = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                self.discard(smtp)
+
+
+class DeliveryStats(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.sent = 0
+        self.starttime = time.time()
+
+    def add_batch(self, numsent):
+        with self.lock:
+            self.batches += 1
+            self.sent += numsent
+
+    @property
+    def elapsed(self):
+        return time.time() - self.starttime
+
+
+def send_queued_batch(pool, batchsize, stats=None, statscallback=None):
+    """
+    Send one batch of queued mail, returning the number of messages sent.
+
+    Rows are locked with SKIP LOCKED, so multiple workers (in this or in
+    other processes) will never pick up the same message. All successfully
+    sent rows are deleted in a single statement at the end of the batch,
+    also if a send fails half way through (in which case the exception is
+    re-raised once the rows that did get sent are gone).
+    """
+    batchstart = time.time()
+    sentids = []
+    err = None
+
+    with transaction.atomic():
+        mails = list(QueuedMail.objects.select_for_update(skip_locked=True).
+                     only('sender', 'receiver', 'body_id', 'receiverheader', 'bodytext').
+                     filter(sendtime__lte=timezone.now()).
+                     order_by('sendtime', 'id')[:batchsize])
+        if not mails:
+            return 0
+
+        # Bodies are shared between recipients, so fetch each of them only
+        # once per batch. Bulk mail gets the receiver specific parts filled
+        # in for each message.
+        bodies = {b.hash: b.fullmsg for b in QueuedMailBody.objects.filter(hash__in=set(m.body_id for m in mails))}
+
+        smtp = pool.get()
+        try:
+            for m in mails:
+                smtp.sendmail(m.sender, m.receiver, m.fullmsg_from_body(bodies[m.body_id]).encode('utf-8'))
+                sentids.append(m.id)
+            pool.put(smtp)
+        except Exception as e:
+            pool.discard(smtp)
+            err = e
+
+        if sentids:
+            QueuedMail.objects.filter(pk__in=sentids).delete()
+            remove_unreferenced_bodies(list(bodies.keys()))
+
+    if stats:
+        stats.add_batch(len(sentids))
+    if statscallback:
+        statscallback(len(sentids), time.time() - batchstart)
+
+    if err:
+        raise err
+
+    return len(sentids)
+
+
+def remove_unreferenced_bodies(hashes=None):
+    # Bodies that are locked are being referenced by a transaction that's
+    # queueing new mail, so they are skipped.
+    exec_no_result("""DELETE FROM mailqueue_queuedmailbody WHERE hash IN (
+ SELECT hash FROM mailqueue_queuedmailbody b
+ WHERE ({}) AND NOT EXISTS (SELECT 1 FROM mailqueue_queuedmail q WHERE q.body_id=b.hash)
+ FOR UPDATE SKIP LOCKED
+)""".format(hashes is None and 'true' or 'hash=ANY(%(hashes)s)'), {
+        'hashes': hashes,
+    })
+
+
+def _send_worker(pool, batchsize, stats, statscallback, errors):
+    try:
+        while send_queued_batch(pool, batchsize, stats, statscallback):
+            pass
+    except Exception as e:
+        errors.append(e)
+    finally:
+        # Each thread gets its own database connection from django, so
+        # make sure it's not left behind.
+        connection.close()
+
+
+def send_pending_mail(workers=1, batchsize=50, statscallback=None):
+    """
+    Send all mail that is currently due, using the specified number of
+    parallel workers sharing a pool of SMTP connections.
+
+    statscallback, if given, is called after each batch with the number of
+    messages sent and the time it took.
+
+    Returns a DeliveryStats object. If any of the workers failed, the first
+    exception is re-raised once all workers have finished.
+    """
+    pool = SMTPConnectionPool(size=workers)
+    stats = DeliveryStats()
+
+    try:
+        if workers == 1:
+            # Run inline, no need for threads
+            while send_queued_batch(pool, batchsize, stats, statscallback):
+                pass
+        else:
+            errors = []
+            threads = [threading.Thread(target=_send_worker, args=(pool, batchsize, stats, statscallback, errors))
+                       for i in range(workers)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            if errors:
+                raise errors[0]
+    finally:
+        pool.close()
+
+    # Workers sending the same body concurrently can each leave it behind
+    # for the other one, so make a final sweep for anything unreferenced.
+    if stats.sent:
+        remove_unreferenced_bodies()
+
+    return stats
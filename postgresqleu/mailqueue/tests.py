@@ -0,0 +1,53 @@
+from django.test import TestCase
+
+from email.parser import Parser
+import datetime
+
+from postgresqleu.mailqueue.models import QueuedMail, QueuedMailBody
+from postgresqleu.mailqueue.util import send_bulk_mail, _build_mail
+from postgresqleu.mailqueue.sender import send_queued_batch
+
+
+class FakeSMTPPool(object):
+    def __init__(self):
+        self.sent = {}
+
+    def get(self):
+        return self
+
+    def put(self, smtp):
+        pass
+
+    def sendmail(self, sender, receiver, msg):
+        self.sent[receiver] = msg.decode('utf-8')
+
+
+class BulkMailTest(TestCase):
+    def test_bulk_mail_shares_body(self):
+        sendat = datetime.datetime(2020, 1, 1, 12, 0, tzinfo=datetime.timezone.utc)
+        attachments = [('test.pdf', 'application/pdf', b'%PDF' * 1000), ]
+        receivers = [
+            ('one@example.com', 'Receiver One'),
+            ('two@example.com', 'Receivér Two', None),
+            ('three@example.com', 'Receiver Three', {'name': 'Three'}),
+        ]
+        num = send_bulk_mail('sender@example.com', receivers, 'Test', 'Hello {name}', attachments, 'Sender', sendat=sendat)
+        self.assertEqual(num, 3)
+
+        # One body for the shared text and one for the substituted
+        self.assertEqual(QueuedMailBody.objects.count(), 2)
+        for m in QueuedMail.objects.all():
+            self.assertLess(len(m.receiverheader) + len(m.bodytext), 100)
+
+        for r in receivers:
+            m = QueuedMail.objects.get(receiver=r[0])
+            text = 'Hello {name}'.format_map(r[2]) if len(r) > 2 and r[2] else 'Hello {name}'
+            expected = _build_mail('sender@example.com', r[0], 'Test', text, attachments, 'Sender', r[1], True, False, sendat)
+            expected.set_boundary(Parser().parsestr(m.fullmsg).get_boundary())
+            self.assertEqual(m.fullmsg, expected.as_string())
+
+        fullmsgs = {m.receiver: m.fullmsg for m in QueuedMail.objects.all()}
+        pool = FakeSMTPPool()
+        self.assertEqual(send_queued_batch(pool, 10), 3)
+        self.assertEqual(pool.sent, fullmsgs)
+        self.assertFalse(QueuedMailBody.objects.exists())
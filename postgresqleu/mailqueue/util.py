@@ -5,13 +5,16 @@ from email.utils import formatdate, formataddr, format_datetime
 from email.header import Header
 from email import encoders
 from email.parser import Parser
+import hashlib
+import itertools
 
 from postgresqleu.util.context_processors import settings_context
+from postgresqleu.util.db import exec_no_result
 
 from django.template.loader import get_template
 from django.utils import timezone
 
-from .models import QueuedMail
+from .models import QueuedMail, BULK_RECEIVER_PLACEHOLDER, BULK_TEXT_PLACEHOLDER
 
 
 def template_to_string(templatename, attrs={}):
@@ -34,7 +37,7 @@ def _encoded_email_header(name, email):
     return email
 
 
-def send_simple_mail(sender, receiver, subject, msgtxt, attachments=None, bcc=None, sendername=None, receivername=None, suppress_auto_replies=True, is_auto_reply=False, sendat=None):
+def _build_mail(sender, receiver, subject, msgtxt, attachments, sendername, receivername, suppress_auto_replies, is_auto_reply, sendat):
     # attachment format, each is a tuple of (name, mimetype,contents)
     # content should be *binary* and not base64 encoded, since we need to
     # use the base64 routines from the email library to get a properly
@@ -67,35 +70,146 @@ def send_simple_mail(sender, receiver, subject, msgtxt, attachments=None, bcc=No
             encoders.encode_base64(part)
             msg.attach(part)
 
-    # Just write it to the queue, so it will be transactionally rolled back
-    QueuedMail(
-        sender=sender,
-        receiver=receiver,
-        subject=subject,
-        fullmsg=msg.as_string(),
-        sendtime=sendat or timezone.now(),
-    ).save()
-
-    # Any bcc is just entered as a separate email
+    return msg
+
+
+def send_simple_mail(sender, receiver, subject, msgtxt, attachments=None, bcc=None, sendername=None, receivername=None, suppress_auto_replies=True, is_auto_reply=False, sendat=None):
+    msg = _build_mail(sender, receiver, subject, msgtxt, attachments, sendername, receivername, suppress_auto_replies, is_auto_reply, sendat)
+
+    # Any bcc is just entered as a separate email, but they all share the
+    # same stored message body.
+    receivers = [receiver, ]
     if bcc:
         if type(bcc) is list or type(bcc) is tuple:
             bcc = set(bcc)
         else:
             bcc = set((bcc, ))
+        receivers.extend(bcc)
 
-        for b in bcc:
-            QueuedMail(
+    # Just write it to the queue, so it will be transactionally rolled back
+    _queue_mail(sender, receivers, subject, msg.as_string(), sendat or timezone.now())
+
+
+def send_bulk_template_mail(sender, receivers, subject, templatename, templateattr={}, attachments=None, sendername=None, suppress_auto_replies=True, is_auto_reply=False, sendat=None):
+    # The template is rendered only once, so it can't contain anything
+    # specific to the receiver other than through substitutions.
+    return send_bulk_mail(sender, receivers, subject,
+                          template_to_string(templatename, templateattr),
+                          attachments, sendername,
+                          suppress_auto_replies, is_auto_reply, sendat)
+
+
+# Number of receivers to queue at a time when sending to many receivers
+BULK_QUEUE_BATCH_SIZE = 500
+
+
+def send_bulk_mail(sender, receivers, subject, msgtxt, attachments=None, sendername=None, suppress_auto_replies=True, is_auto_reply=False, sendat=None):
+    """
+    Send the same message to many receivers.
+
+    receivers is an iterable of (email, name) or (email, name, substitutions)
+    tuples. If substitutions is given it is a dict that is applied to msgtxt
+    using str.format_map() for that receiver, which can be used for small
+    per-receiver parts like a name or an opt-out link. Any literal braces in
+    msgtxt then have to be doubled.
+
+    The MIME message is built and flattened only once and stored as a single
+    body shared by all receivers, with placeholders for the To header and
+    the text part. Only the To header, and the text for receivers that have
+    substitutions, are stored on each queue entry, and filled in when the
+    mail is sent. The queue entries are created in batches.
+
+    Returns the number of receivers the mail was queued for.
+    """
+    msg = _build_mail(sender, 'bulk-receiver@invalid', subject, 'bulk-text', attachments, sendername, None, suppress_auto_replies, is_auto_reply, sendat)
+    # as_string() doesn't fold headers, so neither can we
+    policy = msg.policy.clone(max_line_length=0)
+    charset = msg.get_payload(0).get_charset()
+    head, rest = msg.as_string().split(policy.fold('To', 'bulk-receiver@invalid'), 1)
+    middle, tail = rest.split(charset.body_encode('bulk-text'), 1)
+
+    # One body with the text included for receivers without substitutions,
+    # and one with a placeholder for those that have them.
+    sharedbody = head + BULK_RECEIVER_PLACEHOLDER + middle + charset.body_encode(msgtxt) + tail
+    textbody = head + BULK_RECEIVER_PLACEHOLDER + middle + BULK_TEXT_PLACEHOLDER + tail
+    hashes = {}
+
+    sendtime = sendat or timezone.now()
+    num = 0
+    for batch in _batched(receivers, BULK_QUEUE_BATCH_SIZE):
+        mails = []
+        for r in batch:
+            if len(r) > 2 and r[2] is not None:
+                body, bodytext = textbody, charset.body_encode(msgtxt.format_map(r[2]))
+            else:
+                body, bodytext = sharedbody, ''
+            if body not in hashes:
+                hashes[body] = _store_mail_bodies([body, ])[0]
+            mails.append(QueuedMail(
                 sender=sender,
-                receiver=b,
+                receiver=r[0],
                 subject=subject,
-                fullmsg=msg.as_string(),
-                sendtime=sendat or timezone.now(),
-            ).save()
+                body_id=hashes[body],
+                receiverheader=policy.fold('To', _encoded_email_header(r[1], r[0])),
+                bodytext=bodytext,
+                sendtime=sendtime,
+            ))
+        QueuedMail.objects.bulk_create(mails)
+        num += len(batch)
+
+    if num:
+        exec_no_result("NOTIFY pgeu_mail")
+    return num
+
+
+def _batched(iterable, size):
+    it = iter(iterable)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
 
 
 def send_mail(sender, receiver, subject, fullmsg):
     # Send an email, prepared as the full MIME encoded mail already
-    QueuedMail(sender=sender, receiver=receiver, subject=subject, fullmsg=fullmsg).save()
+    _queue_mail(sender, [receiver, ], subject, fullmsg, timezone.now())
+
+
+def _store_mail_bodies(fullmsgs):
+    # Message bodies are stored content-addressed by their hash, so the same
+    # message queued to many recipients is only stored once. This hashing
+    # must match the one in migration 0004. Returns the list of hashes, in
+    # the same order as the messages.
+    hashes = [hashlib.sha256(fullmsg.encode('utf8')).hexdigest() for fullmsg in fullmsgs]
+    unique = dict(zip(hashes, fullmsgs))
+
+    # If the body already exists, we still "update" it so that the row gets
+    # locked. That way it can't be removed as unreferenced by a concurrent
+    # queue run before our QueuedMail rows pointing to it are committed.
+    exec_no_result("INSERT INTO mailqueue_queuedmailbody (hash, fullmsg) SELECT * FROM unnest(%(hashes)s::text[], %(fullmsgs)s::text[]) ON CONFLICT (hash) DO UPDATE SET hash=excluded.hash", {
+        'hashes': list(unique.keys()),
+        'fullmsgs': list(unique.values()),
+    })
+    return hashes
+
+
+def _queue_mail(sender, receivers, subject, fullmsg, sendtime):
+    bodyhash = _store_mail_bodies([fullmsg, ])[0]
+    QueuedMail.objects.bulk_create([
+        QueuedMail(
+            sender=sender,
+            receiver=r,
+            subject=subject,
+            body_id=bodyhash,
+            sendtime=sendtime,
+        )
+        for r in receivers
+    ])
+
+    # Wake up the mail sender daemon, if one is running. The notification is
+    # only delivered once the transaction commits.
+    exec_no_result("NOTIFY pgeu_mail")
 
 
 def parse_mail_content(fullmsg):
@@ -9,7 +9,7 @@ from django.conf import settings
 
 from postgresqleu.util.backendviews import backend_list_editor, backend_process_form
 from postgresqleu.util.auth import authenticate_backend_group
-from postgresqleu.mailqueue.util import send_simple_mail
+from postgresqleu.mailqueue.util import send_bulk_mail
 from postgresqleu.membership.models import MembershipConfiguration, get_config, Member
 from postgresqleu.membership.models import MemberMail
 from postgresqleu.membership.models import Meeting, MeetingMessageLog
@@ -90,11 +90,11 @@ def sendmail(request):
         idl = request.GET['idlist']
 
     if idl == 'allactive':
-        recipients = list(Member.objects.filter(paiduntil__gte=today_global()))
+        recipients = list(Member.objects.select_related('user').filter(paiduntil__gte=today_global()))
         idlist = [m.user_id for m in recipients]
     else:
         idlist = list(map(int, idl.split(',')))
-        recipients = Member.objects.filter(pk__in=idlist)
+        recipients = Member.objects.select_related('user').filter(pk__in=idlist)
 
     initial = {
         '_from': '{0} <{1}>'.format(cfg.sender_name, cfg.sender_email),
@@ -118,14 +118,12 @@ def sendmail(request):
                 mail.save()
                 mail.sentto.set(recipients)
 
-                for r in recipients:
-                    send_simple_mail(cfg.sender_email,
-                                     r.user.email,
-                                     form.cleaned_data['subject'],
-                                     msgtxt,
-                                     sendername=cfg.sender_name,
-                                     receivername=r.fullname,
-                    )
+                send_bulk_mail(cfg.sender_email,
+                               [(r.user.email, r.fullname) for r in recipients],
+                               form.cleaned_data['subject'],
+                               msgtxt,
+                               sendername=cfg.sender_name,
+                )
                 messages.info(request, "Email sent to %s members" % len(recipients))
 
             return HttpResponseRedirect('/admin/membership/emails/')
@@ -9,7 +9,7 @@ from django.utils import timezone
 from datetime import timedelta
 
 from postgresqleu.membership.models import MeetingReminder, get_config
-from postgresqleu.mailqueue.util import send_template_mail
+from postgresqleu.mailqueue.util import send_bulk_template_mail
 
 
 class Command(BaseCommand):
@@ -29,18 +29,15 @@ class Command(BaseCommand):
 
         for r in MeetingReminder.objects.select_related('meeting').filter(sentat__isnull=True,
                                                                           sendat__lte=timezone.now()):
-            for a in r.meeting.get_all_attendees().select_related('user'):
-                send_template_mail(
-                    cfg.sender_email,
-                    a.user.email,
-                    "Upcoming meeting: {}".format(r.meeting.name),
-                    'membership/mail/meeting_reminder.txt',
-                    {
-                        'meeting': r.meeting,
-                        'member': a,
-                    },
-                    sendername=cfg.sender_name,
-                    receivername=a.fullname,
-                )
+            send_bulk_template_mail(
+                cfg.sender_email,
+                [(a.user.email, a.fullname) for a in r.meeting.get_all_attendees().select_related('user')],
+                "Upcoming meeting: {}".format(r.meeting.name),
+                'membership/mail/meeting_reminder.txt',
+                {
+                    'meeting': r.meeting,
+                },
+                sendername=cfg.sender_name,
+            )
             r.sentat = timezone.now()
             r.save()
@@ -25,6 +25,7 @@ class Command(BaseCommand):
     help = 'Fetch updated list of transactions from paypal'
 
     class ScheduledJob:
+        exclusive_group = 'paypal'
         scheduled_interval = timedelta(minutes=30)
         trigger_next_jobs = 'postgresqleu.paypal.paypal_match'
 
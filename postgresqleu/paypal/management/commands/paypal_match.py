@@ -27,6 +27,7 @@ class Command(BaseCommand):
     help = 'Match pending paypal payments'
 
     class ScheduledJob:
+        exclusive_group = 'paypal'
         # This job gets scheduled to run after paypal_fetch only.
         internal = True
 
@@ -21,6 +21,7 @@ class Command(BaseCommand):
     help = 'Send paypal reports'
 
     class ScheduledJob:
+        exclusive_group = 'paypal'
         scheduled_times = [time(1, 15), ]
         internal = True
 
@@ -23,6 +23,7 @@ class Command(BaseCommand):
     help = 'Compare paypal balance to the accounting system'
 
     class ScheduledJob:
+        exclusive_group = 'paypal'
         scheduled_times = [time(3, 4), ]
 
         @classmethod
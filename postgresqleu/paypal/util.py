@@ -1,11 +1,12 @@
 from django.conf import settings
 from django.utils import timezone
 
-import requests
 from requests.auth import HTTPBasicAuth
 from decimal import Decimal
 from datetime import datetime, timedelta
 
+from postgresqleu.util.http import get_http_session, get_cached_token
+
 
 class PaypalAPI(object):
     BASE_HEADERS = {
@@ -16,26 +17,35 @@ class PaypalAPI(object):
     def __init__(self, pm):
         self.token = None
         self.pm = pm
+        self.session = get_http_session('paypal')
         if pm.config('sandbox'):
             self.REST_ENDPOINT = 'https://api.sandbox.paypal.com/'
         else:
             self.REST_ENDPOINT = 'https://api.paypal.com/'
 
+    def _fetch_access_token(self):
+        r = self.session.post(
+            '{0}v1/oauth2/token'.format(self.REST_ENDPOINT),
+            headers=self.BASE_HEADERS,
+            data={
+                'grant_type': 'client_credentials',
+            },
+            auth=HTTPBasicAuth(self.pm.config('clientid'), self.pm.config('clientsecret')),
+            idempotent=True,
+        )
+        if r.status_code != 200:
+            r.raise_for_status()
+        j = r.json()
+        return ((j['access_token'], j['scope']), j['expires_in'])
+
     def ensure_access_token(self):
         if not self.token:
-            r = requests.post(
-                '{0}v1/oauth2/token'.format(self.REST_ENDPOINT),
-                headers=self.BASE_HEADERS,
-                data={
-                    'grant_type': 'client_credentials',
-                },
-                auth=HTTPBasicAuth(self.pm.config('clientid'), self.pm.config('clientsecret')),
+            # Tokens are valid for several hours, so reuse them between API instances
+            self.token, self.tokenscope = get_cached_token(
+                'paypal',
+                (self.REST_ENDPOINT, self.pm.config('clientid'), self.pm.config('clientsecret')),
+                self._fetch_access_token,
             )
-            if r.status_code != 200:
-                r.raise_for_status()
-            j = r.json()
-            self.token = j['access_token']
-            self.tokenscope = j['scope']
 
     def _authorized_headers(self):
         self.ensure_access_token()
@@ -44,18 +54,18 @@ class PaypalAPI(object):
         return h
 
     def _rest_api_call(self, suburl, params):
-        return requests.get('{0}{1}'.format(self.REST_ENDPOINT, suburl),
-                            params=params,
-                            headers=self._authorized_headers(),
+        return self.session.get('{0}{1}'.format(self.REST_ENDPOINT, suburl),
+                                params=params,
+                                headers=self._authorized_headers(),
         )
 
     def _rest_api_post(self, suburl, json):
         self.ensure_access_token()
         h = self.BASE_HEADERS.copy()
         h['Authorization'] = 'Bearer ' + self.token
-        return requests.post('{0}{1}'.format(self.REST_ENDPOINT, suburl),
-                             json=json,
-                             headers=self._authorized_headers(),
+        return self.session.post('{0}{1}'.format(self.REST_ENDPOINT, suburl),
+                                 json=json,
+                                 headers=self._authorized_headers(),
         )
 
     def _dateformat(self, d):
@@ -9,7 +9,7 @@ from django.utils.timezone import make_aware
 from django.db import transaction
 from django.conf import settings
 
-from postgresqleu.invoices.util import register_bank_transaction
+from postgresqleu.invoices.util import register_bank_transactions
 from postgresqleu.invoices.models import InvoicePaymentMethod
 from postgresqleu.mailqueue.util import send_simple_mail
 from postgresqleu.plaid.models import PlaidTransaction
@@ -22,6 +22,7 @@ class Command(BaseCommand):
     help = 'Fetch Plaid transactions'
 
     class ScheduledJob:
+        exclusive_group = 'plaid'
         scheduled_interval = timedelta(hours=12)
 
         @classmethod
@@ -40,6 +41,7 @@ class Command(BaseCommand):
 
     def handle_method(self, method):
         impl = method.get_implementation()
+        banktransactions = []
 
         for t in impl.sync_transactions():
             # a sync_transactions should normally only get transactions to add, but there is at least a small chance
@@ -68,13 +70,10 @@ class Command(BaseCommand):
                         ),
                     )
 
-                # Else register a pending bank transaction. This may immediately match an invoice
-                # if it was an invoice payment, in which case the entire process will complete..
                 if self.do_banktransactions:
-                    register_bank_transaction(
-                        method,
-                        trans.id,
-                        trans.amount,
-                        trans.paymentref,
-                        trans.paymentref,
-                    )
+                    banktransactions.append((trans.id, trans.amount, trans.paymentref, trans.paymentref, False))
+
+        # Register pending bank transactions for all the new transactions. This may immediately
+        # match invoices if they were invoice payments, in which case the entire process will complete.
+        # All transactions are matched in one pass, so invoices and matchers only have to be looked up once.
+        register_bank_transactions(method, banktransactions)
@@ -20,6 +20,7 @@ class Command(BaseCommand):
     help = 'Verify Plaid balancse'
 
     class ScheduledJob:
+        exclusive_group = 'plaid'
         scheduled_times = [datetime.time(3, 25), ]
 
         @classmethod
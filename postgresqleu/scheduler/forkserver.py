@@ -0,0 +1,136 @@
+#
+# Run external scheduled jobs in processes forked off a pre-initialized
+# fork server, instead of starting a new python and manage.py for each
+# run.
+#
+# This module is preloaded in the multiprocessing fork server, which
+# means it's imported (and django set up, and all management commands
+# loaded) once when the server starts. Each job is then run in a fresh
+# process forked off that server, so it still gets full isolation from
+# both the job runner and other jobs, but skips the startup cost.
+#
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.management import ManagementUtility, get_commands, load_command_class
+from django.db import connections
+
+import multiprocessing
+import os
+import sys
+import time
+
+from postgresqleu.util.http import collect_http_metrics, format_http_metrics
+
+
+def _preload():
+    django.setup()
+
+    # Import all our own management commands, which in turn imports most
+    # of the code they need to run.
+    for name, app in get_commands().items():
+        if app.startswith('postgresqleu'):
+            try:
+                load_command_class(app, name)
+            except Exception:
+                # If it fails here, it will fail again when the job is run
+                # and will be reported there.
+                pass
+
+    # Make sure we don't have a database connection open that would be
+    # inherited by the forked processes.
+    connections.close_all()
+
+
+if not apps.ready:
+    # If django isn't set up yet, we are being imported in the fork server
+    # itself and not in the job runner.
+    _preload()
+
+
+def _run_command(command, outputfile, startpipe):
+    # Send stdout and stderr, including anything written by child processes,
+    # to the output file, just like it would be from a regular subprocess.
+    fd = os.open(outputfile, os.O_WRONLY | os.O_APPEND)
+    os.dup2(fd, 1)
+    os.dup2(fd, 2)
+    os.close(fd)
+
+    startpipe.send(time.time())
+
+    # Run the command the same way manage.py would, which gives us the same
+    # handling of errors and exit codes. System checks have already been run
+    # when the job runner started, so don't waste time on them for every job.
+    argv = ['manage.py', command]
+    app = get_commands().get(command, None)
+    if app and load_command_class(app, command).requires_system_checks:
+        argv.append('--skip-checks')
+    try:
+        with collect_http_metrics() as metrics:
+            ManagementUtility(argv).execute()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        # Pass the metrics back, since they die with this process
+        startpipe.send(format_http_metrics(metrics))
+        startpipe.close()
+
+
+_context = None
+
+
+def get_context():
+    global _context
+    if not _context:
+        # The fork server is started with the environment of the job runner,
+        # but not its path, so make sure it can find our code no matter what
+        # directory we're running in.
+        rootdir = os.path.abspath(os.path.join(settings.PROJECT_ROOT, '..'))
+        pythonpath = os.environ.get('PYTHONPATH', '')
+        if rootdir not in pythonpath.split(os.pathsep):
+            os.environ['PYTHONPATH'] = pythonpath and os.pathsep.join((rootdir, pythonpath)) or rootdir
+
+        _context = multiprocessing.get_context('forkserver')
+        _context.set_forkserver_preload([__name__, ])
+    return _context
+
+
+def run_forked_command(command, outputfile, timeout):
+    """
+    Run a management command in a process forked off the fork server, with
+    stdout and stderr sent to the file outputfile.
+
+    Returns a tuple of (exitcode, startuptime, httpstats), where exitcode is
+    None if the command timed out (and was killed), startuptime is the number
+    of seconds before the command started executing (or None if it never did),
+    and httpstats is a summary of the requests made to external integrations
+    (or an empty string if there were none, or the command didn't finish).
+    """
+    ctx = get_context()
+    startread, startwrite = ctx.Pipe(duplex=False)
+    starttime = time.time()
+
+    p = ctx.Process(target=_run_command, args=(command, outputfile, startwrite), name=command)
+    p.start()
+    startwrite.close()
+
+    p.join(timeout)
+    if p.is_alive():
+        p.kill()
+        p.join()
+        exitcode = None
+    else:
+        exitcode = p.exitcode
+
+    startuptime = None
+    httpstats = ''
+    try:
+        if startread.poll():
+            startuptime = startread.recv() - starttime
+            if startread.poll():
+                httpstats = startread.recv()
+    except EOFError:
+        pass
+    startread.close()
+
+    return (exitcode, startuptime, httpstats)
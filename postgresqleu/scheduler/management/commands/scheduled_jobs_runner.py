@@ -5,6 +5,13 @@
 # crash on database loss for example, so should be run from an init
 # handler that automaticaly restarts (after some delay)
 #
+# Up to SCHEDULED_JOBS_CONCURRENCY jobs are run at the same time, each
+# in its own thread. Jobs that don't declare anything in their
+# ScheduledJob class all belong to the same exclusive group, and are
+# thus run one at a time. A job can set `exclusive_group` to only be
+# serialized against other jobs in the same group, or `parallel = True`
+# to be allowed to run alongside any other job.
+#
 
 from django.core.management import load_command_class
 from django.db import connection
@@ -18,17 +25,30 @@ import sys
 import os
 import subprocess
 import select
+import tempfile
+import threading
 import traceback
 
 from postgresqleu.util.reload import ReloadCommand
 from postgresqleu.mailqueue.util import send_simple_mail
+from postgresqleu.util.http import collect_http_metrics, format_http_metrics
 from postgresqleu.scheduler.util import reschedule_job
 from postgresqleu.scheduler.models import ScheduledJob, JobHistory, get_config
+from postgresqleu.scheduler.forkserver import run_forked_command
+
+
+DEFAULT_EXCLUSIVE_GROUP = '__default__'
 
 
 class Command(ReloadCommand):
     help = 'Run all scheduled jobs'
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        # Running jobs, indexed by job id, with a tuple of (thread, exclusive group)
+        self.running = {}
+
     def handle_with_reload(self, *args, **options):
         try:
             self.inner_handle()
@@ -42,17 +62,47 @@ class Command(ReloadCommand):
             curs.execute("LISTEN pgeu_scheduled_job")
             curs.execute("SET application_name = 'pgeu scheduled job runner'")
 
+        # Job threads write to this pipe when they finish, so we wake up and
+        # can start any jobs that were waiting for a free slot.
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        os.set_blocking(self.wakeup_read, False)
+
         while True:
+            # Empty the wakeup pipe before looking at which jobs have finished,
+            # so a job finishing after this point will wake us up again.
+            self.eat_wakeups()
+            self.reap_finished_jobs()
+
             if get_config().hold_all_jobs:
                 self.stderr.write("All jobs are being held, sleeping for 10 minutes and then reconsidering")
                 self.eat_notifications()
-                select.select([connection.connection], [], [], 600)
+                select.select([connection.connection, self.wakeup_read], [], [], 600)
                 continue
 
-            self.run_pending_jobs()
+            if self.start_pending_jobs():
+                # There are jobs that are due but could not be started because
+                # there is no free slot for them, so wait for a running job to
+                # finish (or a notification) and then try again. Jobs that
+                # aren't due yet may be able to start when they are, so don't
+                # sleep past the next one of those.
+                now = timezone.now()
+                nextjob = self.get_next_job(now)
+                if nextjob:
+                    timeout = min(600, max(1, int((nextjob.nextrun - now).total_seconds() + 1)))
+                else:
+                    timeout = 600
+                self.eat_notifications()
+                select.select([connection.connection, self.wakeup_read], [], [], timeout)
+                continue
+
+            # Find when the next job that isn't already running runs, and sleep until then
+            nextjob = self.get_next_job()
+            if not nextjob:
+                self.stderr.write("No jobs scheduled to run, sleeping for 10 minutes and then reconsidering")
+                self.eat_notifications()
+                select.select([connection.connection, self.wakeup_read], [], [], 600)
+                continue
 
-            # Find when the next job runs, and sleep until then
-            nextjob = ScheduledJob.objects.only('nextrun').filter(enabled=True).order_by('nextrun')[0]
             # Find seconds until next job. Add one second to make sure we don't end up in a tight loop due
             # to time roundoff.
             secondsuntil = int((nextjob.nextrun - timezone.now()).total_seconds() + 1)
@@ -68,98 +118,170 @@ class Command(ReloadCommand):
                 self.eat_notifications()
 
                 # Then wait for either the number of seconds specified or until something
-                # shows up on our connection. That is normally the result of a NOTIFY, so
-                # we don't bother checking what it is, and just continue in the next loop.
-                select.select([connection.connection], [], [], secondsuntil)
+                # shows up on our connection or a running job finishes. On the connection
+                # that is normally the result of a NOTIFY, so we don't bother checking what
+                # it is, and just continue in the next loop.
+                select.select([connection.connection, self.wakeup_read], [], [], secondsuntil)
+
+    def get_next_job(self, after=None):
+        # Get the next job to run that isn't already running, optionally only
+        # considering jobs that are due after the given time.
+        jobs = ScheduledJob.objects.only('nextrun').filter(enabled=True, nextrun__isnull=False).exclude(pk__in=list(self.running.keys()))
+        if after:
+            jobs = jobs.filter(nextrun__gt=after)
+        return jobs.order_by('nextrun').first()
 
     def eat_notifications(self):
         connection.connection.poll()
         while connection.connection.notifies:
             connection.connection.notifies.pop()
 
-    def run_pending_jobs(self):
-        while True:
-            jobs = ScheduledJob.objects.filter(nextrun__lte=timezone.now(), enabled=True)
-            if not jobs:
-                # Nothing left to do!
-                return
+    def eat_wakeups(self):
+        try:
+            while os.read(self.wakeup_read, 1024):
+                pass
+        except BlockingIOError:
+            pass
 
-            for job in jobs:
-                # Start by finding the command class itself
-                try:
-                    cmd = load_command_class(job.app, job.command)
-                    if hasattr(cmd.ScheduledJob, 'should_run'):
-                        # If method should_run exists, call it and figure out if the job should
-                        # run. If we get an excpetion in this check, we make sure to run the job,
-                        # to be on the safe side.
-                        try:
-                            if not cmd.ScheduledJob.should_run():
-                                self.stderr.write("Skipping job {}".format(job.description))
-                                job.lastskip = timezone.now()
-                                reschedule_job(job, save=True)
-                                continue
-                        except Exception as e:
-                            sys.stderr.write("Exception when trying to figure out if '{0}' should run:\n{1}\n\nJob will be run.\n".format(job.description, e))
-
-                    self.stderr.write("Running job {}".format(job.description))
-                    # Now figure out what type of job it is, and run it
-                    job.lastrunsuccess = self.run_job(job, cmd)
-                    job.lastrun = timezone.now()
-                    job.lastskip = None
-                    reschedule_job(job, save=True)
-
-                    # A job can define one or more other jobs to schedule immediately
-                    # after this job has completed.
-                    if hasattr(cmd.ScheduledJob, 'trigger_next_jobs'):
-                        if isinstance(cmd.ScheduledJob.trigger_next_jobs, str):
-                            nextjobs = [cmd.ScheduledJob.trigger_next_jobs, ]
-                        elif isinstance(cmd.ScheduledJob.trigger_next_jobs, list) or isinstance(cmd.ScheduledJob.trigger_next_jobs, tuple):
-                            nextjobs = cmd.ScheduledJob.trigger_next_jobs
-                        else:
-                            raise Exception("trigger_next_jobs must be string or iterable!")
-
-                        for j in nextjobs:
-                            try:
-                                pieces = j.split('.')
-                                sj = ScheduledJob.objects.get(app='.'.join(pieces[:-1]),
-                                                              command=pieces[-1])
-                                sj.nextrun = timezone.now()
-                                sj.save()
-                            except ScheduledJob.DoesNotExist:
-                                self.stderr.write("Could not find job {} to run after {}".format(j, job.description))
-                                # But it's not critical, so we don't bother notifying
+    def reap_finished_jobs(self):
+        for jobid, (thread, group) in list(self.running.items()):
+            if not thread.is_alive():
+                thread.join()
+                del self.running[jobid]
+
+    def get_exclusive_group(self, job):
+        try:
+            sj = load_command_class(job.app, job.command).ScheduledJob
+        except Exception:
+            # If we can't load the job, it will fail once it's run, and
+            # that's where it gets reported.
+            return DEFAULT_EXCLUSIVE_GROUP
+
+        if getattr(sj, 'exclusive_group', None):
+            return sj.exclusive_group
+        if getattr(sj, 'parallel', False):
+            return None
+        return DEFAULT_EXCLUSIVE_GROUP
+
+    def start_pending_jobs(self):
+        # Start as many of the due jobs as we have free slots and free
+        # exclusive groups for. Returns True if there are due jobs left
+        # that could not be started.
+        blocked = False
+        for job in ScheduledJob.objects.filter(nextrun__lte=timezone.now(), enabled=True).exclude(pk__in=list(self.running.keys())).order_by('nextrun'):
+            if len(self.running) >= settings.SCHEDULED_JOBS_CONCURRENCY:
+                return True
+
+            group = self.get_exclusive_group(job)
+            if group and group in (g for t, g in self.running.values()):
+                blocked = True
+                continue
+
+            t = threading.Thread(target=self.job_thread, args=(job, ), name=job.command)
+            self.running[job.pk] = (t, group)
+            t.start()
+        return blocked
+
+    def job_thread(self, job):
+        try:
+            self.process_job(job)
+        except Exception:
+            # Same as an exception in the main thread, which is normally
+            # a lost database connection.
+            self.stderr.write("Exception in job thread:")
+            traceback.print_exc(file=self.stderr)
+            os._exit(1)
+        finally:
+            # Each thread gets its own database connection from django, so
+            # make sure it's not left behind.
+            connection.close()
+            os.write(self.wakeup_write, b'x')
 
+    def process_job(self, job):
+        # Start by finding the command class itself
+        try:
+            cmd = load_command_class(job.app, job.command)
+            if hasattr(cmd.ScheduledJob, 'should_run'):
+                # If method should_run exists, call it and figure out if the job should
+                # run. If we get an excpetion in this check, we make sure to run the job,
+                # to be on the safe side.
+                try:
+                    if not cmd.ScheduledJob.should_run():
+                        self.stderr.write("Skipping job {}".format(job.description))
+                        job.lastskip = timezone.now()
+                        reschedule_job(job, save=True)
+                        return
                 except Exception as e:
-                    # Hard exception at the top level will cause us to disbale
-                    # the job.
-                    job.lastrun = timezone.now()
-                    job.lastrunsuccess = False
-                    job.enabled = False
-                    job.nextrun = None
-                    job.save()
-                    JobHistory(job=job,
-                               time=timezone.now(),
-                               success=False,
-                               runtime=timedelta(),
-                               output="Internal exception:\n{0}\n\nJob has been disabled".format(e),
-                    ).save()
-                    self.send_notification_email("Exception running scheduled job",
-                                                 "Job has been disbaled.\nException:\n{0}\n".format(e))
+                    sys.stderr.write("Exception when trying to figure out if '{0}' should run:\n{1}\n\nJob will be run.\n".format(job.description, e))
+
+            self.stderr.write("Running job {}".format(job.description))
+            # Now figure out what type of job it is, and run it
+            job.lastrunsuccess = self.run_job(job, cmd)
+            job.lastrun = timezone.now()
+            job.lastskip = None
+            reschedule_job(job, save=True)
+
+            # A job can define one or more other jobs to schedule immediately
+            # after this job has completed.
+            if hasattr(cmd.ScheduledJob, 'trigger_next_jobs'):
+                if isinstance(cmd.ScheduledJob.trigger_next_jobs, str):
+                    nextjobs = [cmd.ScheduledJob.trigger_next_jobs, ]
+                elif isinstance(cmd.ScheduledJob.trigger_next_jobs, list) or isinstance(cmd.ScheduledJob.trigger_next_jobs, tuple):
+                    nextjobs = cmd.ScheduledJob.trigger_next_jobs
+                else:
+                    raise Exception("trigger_next_jobs must be string or iterable!")
+
+                for j in nextjobs:
+                    try:
+                        pieces = j.split('.')
+                        sj = ScheduledJob.objects.get(app='.'.join(pieces[:-1]),
+                                                      command=pieces[-1])
+                        sj.nextrun = timezone.now()
+                        sj.save()
+                    except ScheduledJob.DoesNotExist:
+                        self.stderr.write("Could not find job {} to run after {}".format(j, job.description))
+                        # But it's not critical, so we don't bother notifying
+
+        except Exception as e:
+            # Hard exception at the top level will cause us to disbale
+            # the job.
+            job.lastrun = timezone.now()
+            job.lastrunsuccess = False
+            job.enabled = False
+            job.nextrun = None
+            job.save()
+            JobHistory(job=job,
+                       time=timezone.now(),
+                       success=False,
+                       runtime=timedelta(),
+                       output="Internal exception:\n{0}\n\nJob has been disabled".format(e),
+            ).save()
+            self.send_notification_email("Exception running scheduled job",
+                                         "Job has been disbaled.\nException:\n{0}\n".format(e))
 
     def run_job(self, job, cmd):
         starttime = time.time()
+        startuptime = None
+        httpstats = ''
         if getattr(cmd.ScheduledJob, 'internal', False):
-            (output, success) = self.run_internal_job(job, cmd)
+            (output, success, httpstats) = self.run_internal_job(job, cmd)
+        elif settings.SCHEDULED_JOBS_FORKSERVER:
+            (output, success, startuptime, httpstats) = self.run_forked_job(job, cmd)
         else:
             (output, success) = self.run_external_job(job, cmd)
+        runtime = time.time() - starttime
 
         # Create a job history record. The caller will update the main job entry,
-        # but we want to store the output.
+        # but we want to store the output. If we know how long it took for the
+        # job to start up, that's stored separately from the runtime, and so are
+        # the metrics for any requests made to external integrations.
         JobHistory(job=job,
                    time=timezone.now(),
                    success=success,
-                   runtime=timedelta(seconds=time.time() - starttime),
+                   runtime=timedelta(seconds=runtime - (startuptime or 0)),
+                   startuptime=timedelta(seconds=startuptime) if startuptime is not None else None,
                    output=output.getvalue(),
+                   httpstats=httpstats,
         ).save()
 
         if success and job.notifyonsuccess and output.tell():
@@ -179,19 +301,20 @@ class Command(ReloadCommand):
         output = io.StringIO()
         success = False
 
-        try:
-            cmd.execute(no_color=True,
-                        force_color=False,
-                        skip_checks=True,
-                        stdout=output,
-                        stderr=output)
-            success = True
-        except Exception as e:
-            output.write("**** EXCEPTION ****\n")
-            output.write(str(e))
-            output.write("\n")
+        with collect_http_metrics() as metrics:
+            try:
+                cmd.execute(no_color=True,
+                            force_color=False,
+                            skip_checks=True,
+                            stdout=output,
+                            stderr=output)
+                success = True
+            except Exception as e:
+                output.write("**** EXCEPTION ****\n")
+                output.write(str(e))
+                output.write("\n")
 
-        return (output, success)
+        return (output, success, format_http_metrics(metrics))
 
     def run_external_job(self, job, cmd):
         # External jobs are run in an external process with a timeout, as set in the
@@ -221,6 +344,32 @@ class Command(ReloadCommand):
 
         return (fullout, success)
 
+    def run_forked_job(self, job, cmd):
+        # Forked jobs are external jobs with the same timeout, but instead of
+        # starting a new python and manage.py they are forked off a fork server
+        # that already has django and all the commands loaded.
+        timeout = getattr(cmd.ScheduledJob, 'timeout', 2)
+        timeout_seconds = timeout * 60
+
+        fullout = io.StringIO()
+        success = False
+
+        with tempfile.NamedTemporaryFile() as f:
+            (exitcode, startuptime, httpstats) = run_forked_command(job.command, f.name, timeout_seconds)
+            output = f.read().decode('utf8', errors='ignore')
+
+        if exitcode is None:
+            fullout.write("Timeout of {0} seconds expired.".format(timeout_seconds))
+        elif exitcode != 0:
+            fullout.write("Exit code {0}\n\n".format(exitcode))
+            fullout.write(output)
+            fullout.write("\n")
+        else:
+            fullout.write(output)
+            success = True
+
+        return (fullout, success, startuptime, httpstats)
+
     def send_notification_email(self, subject, contents):
         send_simple_mail(
             settings.SCHEDULED_JOBS_EMAIL_SENDER,
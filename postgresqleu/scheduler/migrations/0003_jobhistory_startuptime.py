@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 17:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0002_command_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobhistory',
+            name='startuptime',
+            field=models.DurationField(blank=True, null=True),
+        ),
+    ]
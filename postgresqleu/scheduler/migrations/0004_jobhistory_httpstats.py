@@ -0,0 +1,17 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scheduler', '0003_jobhistory_startuptime'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='jobhistory',
+            name='httpstats',
+            field=models.TextField(blank=True, default='', verbose_name='Requests to external integrations'),
+            preserve_default=False,
+        ),
+    ]
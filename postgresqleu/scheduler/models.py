@@ -66,7 +66,9 @@ class JobHistory(models.Model):
     time = models.DateTimeField(null=False, blank=False, auto_now_add=True)
     success = models.BooleanField(null=False)
     runtime = models.DurationField(null=False)
+    startuptime = models.DurationField(null=True, blank=True)
     output = models.TextField(null=False, blank=True)
+    httpstats = models.TextField(null=False, blank=True, verbose_name='Requests to external integrations')
 
     @property
     def first_output(self):
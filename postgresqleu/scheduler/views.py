@@ -60,7 +60,7 @@ def index(request):
         lastjobtime = None
         lastjob_recent = False
 
-    history = JobHistory.objects.only('time', 'job__description', 'success', 'runtime').select_related('job').order_by('-time')[:20]
+    history = JobHistory.objects.only('time', 'job__description', 'success', 'runtime', 'startuptime').select_related('job').order_by('-time')[:20]
 
     with connection.cursor() as curs:
         curs.execute("SELECT count(1) FROM pg_stat_activity WHERE application_name='pgeu scheduled job runner' AND datname=current_database()")
@@ -124,7 +124,7 @@ def history(request):
     if not request.user.is_superuser:
         raise PermissionDenied("Access denied")
 
-    history_objects = JobHistory.objects.only('time', 'job__description', 'success', 'runtime').select_related('job').order_by('-time')
+    history_objects = JobHistory.objects.only('time', 'job__description', 'success', 'runtime', 'startuptime').select_related('job').order_by('-time')
     (history, paginator, page_range) = simple_pagination(request, history_objects, 50)
 
     return render(request, 'scheduler/history.html', {
@@ -130,6 +130,12 @@ INSTALLED_APPS = [
 # Root directory for DejaVu truetype fonts
 FONTROOT = "/usr/share/fonts/truetype/ttf-dejavu"
 
+# Number of processes to use when rendering large sets of badges. The badges
+# are split into chunks of whole pages that are rendered in parallel, which
+# requires the fitz library. Badges are rendered in the web server, so this
+# forks the web server process.
+BADGE_RENDER_JOBS = 1
+
 # Locations of static assets
 ASSETS = {
     # Bootstrap 4 is used for the public default site, the default conference site,
@@ -226,6 +232,10 @@ EU_VAT_HOME_COUNTRY = "FR"
 # On-line validate EU vat numbers
 EU_VAT_VALIDATE = False
 
+# If set, compiled conference jinja templates are cached in this directory,
+# so they don't have to be recompiled when the processes are restarted.
+JINJA_BYTECODE_CACHE_DIR = None
+
 # Invoice module
 # --------------
 INVOICE_PDF_BUILDER = 'postgresqleu.util.misc.baseinvoice.BaseInvoice'
@@ -276,6 +286,15 @@ SCHEDULED_JOBS_EMAIL = DEFAULT_EMAIL
 # Email to send info about scheduled jobs from
 # SCHEDULED_JOBS_EMAIL_SENDER = DEFAULT_EMAIL
 
+# Maximum number of scheduled jobs to run at the same time. Only jobs that
+# declare themselves as parallel or in an exclusive group will actually run
+# concurrently, see the documentation for the job scheduler.
+SCHEDULED_JOBS_CONCURRENCY = 4
+
+# Run external scheduled jobs in processes forked off a pre-initialized fork
+# server, instead of starting a new manage.py process for each run.
+SCHEDULED_JOBS_FORKSERVER = True
+
 # Treasurer email address. This is only used as pass-through to templates for
 # end-user reference, and never actually by the system to send and receive.
 TREASURER_EMAIL = DEFAULT_EMAIL
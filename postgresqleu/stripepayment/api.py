@@ -3,9 +3,10 @@ from django.utils import timezone
 
 import datetime
 from decimal import Decimal
-import requests
 from requests.auth import HTTPBasicAuth
 
+from postgresqleu.util.http import get_http_session
+
 from .models import StripeRefund
 
 
@@ -46,19 +47,19 @@ class StripeApi(object):
 
     def secret(self, suburl, params=None, raise_for_status=True):
         if params:
-            r = requests.post(self.APIBASE + suburl,
-                              list(self._api_encode(params)),
-                              auth=HTTPBasicAuth(self.secret_key, ''),
-                              headers={
-                                  'Stripe-Version': self.APIVERSION,
-                              },
+            r = get_http_session('stripe').post(self.APIBASE + suburl,
+                                                list(self._api_encode(params)),
+                                                auth=HTTPBasicAuth(self.secret_key, ''),
+                                                headers={
+                                                    'Stripe-Version': self.APIVERSION,
+                                                },
             )
         else:
-            r = requests.get(self.APIBASE + suburl,
-                             auth=HTTPBasicAuth(self.secret_key, ''),
-                             headers={
-                                 'Stripe-Version': self.APIVERSION,
-                             },
+            r = get_http_session('stripe').get(self.APIBASE + suburl,
+                                               auth=HTTPBasicAuth(self.secret_key, ''),
+                                               headers={
+                                                   'Stripe-Version': self.APIVERSION,
+                                               },
             )
         if raise_for_status:
             r.raise_for_status()
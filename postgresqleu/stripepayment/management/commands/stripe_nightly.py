@@ -28,6 +28,7 @@ class Command(BaseCommand):
     help = 'Stripe payment nightly job'
 
     class ScheduledJob:
+        exclusive_group = 'stripe'
         scheduled_times = [time(3, 00), ]
 
         @classmethod
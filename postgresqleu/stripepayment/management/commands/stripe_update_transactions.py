@@ -16,6 +16,7 @@ class Command(BaseCommand):
     help = 'Update Stripe transactions'
 
     class ScheduledJob:
+        exclusive_group = 'stripe'
         scheduled_interval = timedelta(hours=4)
 
         @classmethod
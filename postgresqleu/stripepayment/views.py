@@ -8,21 +8,14 @@ from django.conf import settings
 import json
 import hmac
 import hashlib
-from decimal import Decimal
 
 from postgresqleu.invoices.models import Invoice, InvoicePaymentMethod
-from postgresqleu.invoices.util import InvoiceManager
-from postgresqleu.invoices.util import is_managed_bank_account
-from postgresqleu.invoices.util import register_pending_bank_matcher
+from postgresqleu.invoices.util import queue_payment_notification
 from postgresqleu.util.decorators import global_login_exempt
-from postgresqleu.util.currency import format_currency
-from postgresqleu.accounting.util import create_accounting_entry
-from postgresqleu.mailqueue.util import send_simple_mail
 
-from .models import StripeCheckout, StripeRefund, StripePayout, StripeLog
+from .models import StripeCheckout, StripeLog
 from .models import ReturnAuthorizationStatus
 from .api import StripeApi
-from .util import process_stripe_checkout
 
 
 @transaction.atomic
@@ -147,137 +140,8 @@ def webhook(request, methodid):
     if mac.hexdigest() != sigdata['v1']:
         return HttpResponse("Invalid signature", status=400)
 
-    # Signature is OK, figure out what to do
-    if payload['type'] == 'checkout.session.completed':
-        sessionid = payload['data']['object']['id']
-        try:
-            co = StripeCheckout.objects.get(sessionid=sessionid)
-        except StripeCheckout.DoesNotExist:
-            StripeLog(message="Received completed session event for non-existing sessions {}".format(sessionid),
-                      error=True,
-                      paymentmethod=method).save()
-            return HttpResponse("OK")
-
-        # We don't get enough data in the session, unfortunately, so we have to
-        # make some incoming API calls.
-        StripeLog(message="Received Stripe webhook for checkout {}. Processing.".format(co.id), paymentmethod=method).save()
-        process_stripe_checkout(co)
-        StripeLog(message="Completed processing webhook for checkout {}.".format(co.id), paymentmethod=method).save()
-        return HttpResponse("OK")
-    elif payload['type'] == 'charge.refunded':
-        chargeid = payload['data']['object']['id']
-        amount = Decimal(payload['data']['object']['amount_refunded']) / 100
-
-        # Stripe stopped including the refund id in the refund
-        # notification, and requires an extra API call to get
-        # it. Instead of doing that, since we have the charge id we
-        # can match it on that specific charge and the amount of the
-        # refund. This could potentially return multiple entries in
-        # case there is more than one refund made on the same charge
-        # before the webhook fires, but we'll just say that's unlikely
-        # enough we don't have to care about it.
-        try:
-            refund = StripeRefund.objects.get(
-                paymentmethod=method,
-                chargeid=chargeid,
-                amount=amount,
-            )
-        except StripeRefund.DoesNotExist:
-            StripeLog(
-                message="Received completed refund event for charge {} with amount {} which could not be found in the database. Event has been acknowledged, but refund not marked as completed!",
-                error=True,
-                paymentmethod=method,
-            ).save()
-            return HttpResponse("OK")
-        except StripeRefund.MultipleObjectsReturned:
-            StripeLog(
-                message="Received completed refund event for charge {} with amount {} which matched multiple entries. Event has been acknowledged, but refund not marked as completed!",
-                error=True,
-                paymentmethod=method,
-            ).save()
-
-        if refund.completedat:
-            StripeLog(message="Received duplicate Stripe webhook for refund {}, ignoring.".format(refund.id), paymentmethod=method).save()
-        else:
-            # If it's not already processed, flag it as done and trigger the process.
-
-            StripeLog(message="Received Stripe webhook for refund {}. Processing.".format(refund.id), paymentmethod=method).save()
-
-            refund.completedat = timezone.now()
-            refund.save(update_fields=['completedat'])
-
-            manager = InvoiceManager()
-            manager.complete_refund(
-                refund.invoicerefundid_id,
-                refund.amount,
-                0,  # Unknown fee
-                pm.config('accounting_income'),
-                pm.config('accounting_fee'),
-                [],
-                method)
-        return HttpResponse("OK")
-    elif payload['type'] == 'payout.paid':
-        # Payout has left Stripe. Should include both automatic and manual ones
-        payoutid = payload['data']['object']['id']
-
-        obj = payload['data']['object']
-        if obj['currency'].lower() != settings.CURRENCY_ISO.lower():
-            StripeLog(message="Received payout in incorrect currency {}, ignoring".format(obj['currency']),
-                      error=True,
-                      paymentmethod=method).save()
-            return HttpResponse("OK")
-
-        with transaction.atomic():
-            if StripePayout.objects.filter(payoutid=payoutid).exists():
-                StripeLog(message="Received duplicate notification for payout {}, ignoring".format(payoutid),
-                          error=True,
-                          paymentmethod=method).save()
-                return HttpResponse("OK")
-
-            payout = StripePayout(paymentmethod=method,
-                                  payoutid=payoutid,
-                                  amount=Decimal(obj['amount']) / 100,
-                                  sentat=timezone.now(),
-                                  description=obj['description'])
-            payout.save()
-
-            acctrows = [
-                (pm.config('accounting_income'), 'Stripe payout {}'.format(payout.payoutid), -payout.amount, None),
-                (pm.config('accounting_payout'), 'Stripe payout {}'.format(payout.payoutid), payout.amount, None),
-            ]
-
-            if is_managed_bank_account(pm.config('accounting_payout')):
-                entry = create_accounting_entry(acctrows, True)
-
-                # Stripe payouts include a "magic number", but unfortunately this magic number
-                # is not available through the APIs so there is no way to match on it.
-                register_pending_bank_matcher(pm.config('accounting_payout'),
-                                              r'.*STRIPE(\s+[^\s+].*|$)',
-                                              payout.amount,
-                                              entry)
-                msg = "A Stripe payout of {} with description {} completed for {}.\n\nAccounting entry {} was created and will automatically be closed once the payout has arrived.".format(
-                    format_currency(payout.amount),
-                    payout.description,
-                    method.internaldescription,
-                    entry,
-                )
-            else:
-                msg = "A Stripe payout of {} with description {} completed for {}.\n".format(
-                    format_currency(payout.amount),
-                    payout.description,
-                    method.internaldescription,
-                )
-
-            StripeLog(message=msg, paymentmethod=method).save()
-            send_simple_mail(settings.INVOICE_SENDER_EMAIL,
-                             pm.config('notification_receiver'),
-                             'Stripe payout completed',
-                             msg,
-            )
-            return HttpResponse("OK")
-    else:
-        StripeLog(message="Received unknown Stripe event type '{}'".format(payload['type']),
-                  error=True,
-                  paymentmethod=method).save()
-        # We still flag it as OK to stripe
-        return HttpResponse("OK")
+    # Signature is OK, so queue the event up for processing. Stripe retries
+    # events that were not acknowledged using the same event id, so that
+    # is used to ignore duplicates.
+    queue_payment_notification(method, payload['id'], payload)
+    return HttpResponse("OK")
@@ -11,13 +11,14 @@ from base64 import b64encode
 
 from postgresqleu.util.time import today_global
 from postgresqleu.util.crypto import rsa_sign_string_sha256
+from postgresqleu.util.http import get_http_session
 from .models import TransferwiseRefund
 
 
 class TransferwiseApi(object):
     def __init__(self, pm):
         self.pm = pm
-        self.session = requests.session()
+        self.session = get_http_session('transferwise', self.pm.id)
         self.session.headers.update({
             'Authorization': 'Bearer {}'.format(self.pm.config('apikey')),
         })
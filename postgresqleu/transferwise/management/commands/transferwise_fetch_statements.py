@@ -21,6 +21,7 @@ class Command(BaseCommand):
     help = 'Fetch TransferWise monthly statements'
 
     class ScheduledJob:
+        exclusive_group = 'transferwise'
         scheduled_times = [datetime.time(2, 2), ]
 
         @classmethod
@@ -11,7 +11,7 @@ from django.utils import timezone
 from postgresqleu.util.time import today_global
 from postgresqleu.accounting.util import create_accounting_entry
 from postgresqleu.invoices.util import is_managed_bank_account
-from postgresqleu.invoices.util import register_pending_bank_matcher, register_bank_transaction
+from postgresqleu.invoices.util import register_pending_bank_matcher, register_bank_transactions
 from postgresqleu.invoices.util import InvoiceManager
 from postgresqleu.invoices.models import InvoicePaymentMethod
 from postgresqleu.transferwise.models import TransferwiseTransaction, TransferwiseRefund
@@ -25,6 +25,7 @@ class Command(BaseCommand):
     help = 'Fetch TransferWise transactions'
 
     class ScheduledJob:
+        exclusive_group = 'transferwise'
         scheduled_interval = timedelta(minutes=60)
 
         @classmethod
@@ -48,6 +49,7 @@ class Command(BaseCommand):
         pm = method.get_implementation()
 
         api = pm.get_api()
+        banktransactions = []
 
         for t in api.get_transactions(startdate=startdate):
             # We will re-fetch most transactions, so only create them if they are not
@@ -106,7 +108,7 @@ class Command(BaseCommand):
                         twrefund = TransferwiseRefund.objects.get(transferid=transferid)
                     except TransferwiseRefund.DoesNotExist:
                         print("Could not find transferwise refund for id {0}, registering as manual bank transaction".format(transferid))
-                        register_bank_transaction(method, trans.id, trans.amount, trans.paymentref, trans.fulldescription, False)
+                        banktransactions.append((trans.id, trans.amount, trans.paymentref, trans.fulldescription, False))
                         continue
 
                     if twrefund.refundtransaction or twrefund.completedat:
@@ -193,12 +195,16 @@ class Command(BaseCommand):
                     else:
                         create_accounting_entry(accrows)
                 else:
-                    # Else register a pending bank transaction. This may immediately match an invoice
-                    # if it was an invoice payment, in which case the entire process will complete.
-                    register_bank_transaction(method,
-                                              trans.id,
-                                              trans.amount,
-                                              trans.paymentref,
-                                              trans.fulldescription,
-                                              trans.counterpart_valid_iban
-                    )
+                    # Else register a pending bank transaction once we have seen all transactions.
+                    banktransactions.append((trans.id,
+                                             trans.amount,
+                                             trans.paymentref,
+                                             trans.fulldescription,
+                                             trans.counterpart_valid_iban,
+                    ))
+
+        # Register pending bank transactions for all the new transactions. This may immediately
+        # match invoices if they were invoice payments, in which case the entire process will complete.
+        # This is done after all payouts above have registered their bank matchers, so that they can
+        # be matched in the same run, and all transactions are matched in one pass.
+        register_bank_transactions(method, banktransactions)
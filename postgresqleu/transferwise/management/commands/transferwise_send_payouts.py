@@ -16,6 +16,7 @@ class Command(BaseCommand):
     help = 'Send TransferWise payouts'
 
     class ScheduledJob:
+        exclusive_group = 'transferwise'
         scheduled_interval = timedelta(minutes=30)
         trigger_next_jobs = 'postgresqleu.transferwise.transferwise_fetch_transactions'
 
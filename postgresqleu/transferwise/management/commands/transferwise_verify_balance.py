@@ -32,6 +32,7 @@ class Command(BaseCommand):
     help = 'Compare TransferWise balance to the accounting system and make optional payouts'
 
     class ScheduledJob:
+        exclusive_group = 'transferwise'
         scheduled_times = [datetime.time(3, 15), ]
 
         @classmethod
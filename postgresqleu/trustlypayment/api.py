@@ -7,7 +7,8 @@ from Cryptodome.Signature import PKCS1_v1_5
 from Cryptodome.Hash import SHA
 from Cryptodome.PublicKey import RSA
 import base64
-import requests
+
+from postgresqleu.util.http import get_http_session
 
 
 class TrustlyException(Exception):
@@ -118,7 +119,7 @@ class TrustlyWrapper(object):
             'version': '1.1',
         }
 
-        resp = requests.post(self.apibase, json=p)
+        resp = get_http_session('trustly').post(self.apibase, json=p)
         if resp.status_code != 200:
             raise TrustlyException("bad http response code {0}".format(resp.status_code))
         r = resp.json()
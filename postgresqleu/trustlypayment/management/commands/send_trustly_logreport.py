@@ -20,6 +20,7 @@ class Command(BaseCommand):
     help = 'Send log information about Trustly events'
 
     class ScheduledJob:
+        exclusive_group = 'trustly'
         scheduled_times = [time(23, 15), ]
         internal = True
 
@@ -12,6 +12,7 @@ class Command(BaseCommand):
     help = 'Extend trustly invoices if they are in pending state'
 
     class ScheduledJob:
+        exclusive_group = 'trustly'
         scheduled_interval = timedelta(hours=1)
         internal = True
 
@@ -24,6 +24,7 @@ class Command(BaseCommand):
     help = 'Fetch Trustly withdrawals'
 
     class ScheduledJob:
+        exclusive_group = 'trustly'
         scheduled_times = [time(22, 00), ]
 
         @classmethod
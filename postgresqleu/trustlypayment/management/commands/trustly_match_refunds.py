@@ -26,6 +26,7 @@ class Command(BaseCommand):
     help = 'Flag completed Trustly refunds'
 
     class ScheduledJob:
+        exclusive_group = 'trustly'
         scheduled_interval = timedelta(hours=4)
 
         @classmethod
@@ -23,6 +23,7 @@ class Command(BaseCommand):
     help = 'Compare trustly balance to the accounting system'
 
     class ScheduledJob:
+        exclusive_group = 'trustly'
         scheduled_times = [time(3, 7), ]
 
         @classmethod
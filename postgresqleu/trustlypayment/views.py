@@ -6,6 +6,7 @@ from django.conf import settings
 from django.utils import timezone
 
 from postgresqleu.invoices.models import Invoice, InvoicePaymentMethod
+from postgresqleu.invoices.util import queue_payment_notification
 
 from .util import Trustly, TrustlyException
 from .models import TrustlyTransaction, TrustlyRawNotification, TrustlyLog
@@ -114,6 +115,16 @@ def notification(request, methodid):
 
     t = Trustly(method.get_implementation())
 
-    (ok, uuid, method) = t.process_raw_trustly_notification(raw)
-    return HttpResponse(t.create_notification_response(uuid, method, ok and "OK" or "FAILED"),
+    # Verify the signature before acknowledging, and then queue it up for
+    # processing. It will be parsed again when it's processed.
+    (uuid, notificationmethod, data) = t.parse_notification(raw.contents)
+    if not data:
+        TrustlyLog(message="Failed to parse trustly raw notification {0}".format(raw.id),
+                   error=True,
+                   paymentmethod=method).save()
+        return HttpResponse(t.create_notification_response(uuid, notificationmethod, "FAILED"),
+                            content_type='application/json')
+
+    queue_payment_notification(method, data['notificationid'], {'raw': raw.id})
+    return HttpResponse(t.create_notification_response(uuid, notificationmethod, "OK"),
                         content_type='application/json')
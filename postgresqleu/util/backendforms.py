@@ -18,6 +18,9 @@ class _NewFormDataField(django.forms.Field):
 class BackendForm(ConcurrentProtectedModelForm):
     list_fields = None
     list_order_by = None
+    list_server_side = False      # Sort, filter and page the list in the database
+    list_pagesize = 100
+    list_column_expressions = {}  # Fields to sort and filter related columns on, in server side lists
     queryset_select_related = []
     queryset_extra_fields = {}   # Goes into queryset.extra()
     queryset_extra_columns = []  # Just columns included in .only()
@@ -38,6 +41,7 @@ class BackendForm(ConcurrentProtectedModelForm):
     copy_transform_form = None
     coltypes = {}
     filtercolumns = {}
+    bulk_assignable_columns = []  # Assignable columns that need no per-object validation or save() side effects, and can be set with a single UPDATE
     defaultsort = []
     readonly_fields = []
     nosave_fields = []
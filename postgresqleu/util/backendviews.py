@@ -1,12 +1,20 @@
-from django.core.exceptions import PermissionDenied, ValidationError
+from django.core.exceptions import PermissionDenied, ValidationError, FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import transaction, DatabaseError
+from django.db.models import F, Q, TextField, CharField, BooleanField, JSONField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
 from django import forms
 from django.shortcuts import render, get_object_or_404
 from django.urls import reverse, NoReverseMatch
+from django.utils import timezone
 from django.http import HttpResponse, HttpResponseRedirect, Http404
 from django.contrib.admin.utils import NestedObjects
 from django.contrib import messages
 
+import datetime
+import json
+
 from postgresqleu.util.lists import flatten_list
 from postgresqleu.confreg.util import get_authenticated_conference
 from postgresqleu.confreg.backendforms import BackendCopySelectConferenceForm
@@ -227,6 +235,219 @@ def backend_process_form(request, urlname, formclass, id, cancel_url='../', save
     })
 
 
+# Server side lists. For lists that can grow large, the sorting, filtering
+# and searching that's normally done in the browser is done in the database
+# instead, and only one page of objects is loaded at a time. Pages are
+# fetched by keyset, continuing from the sort values of the last (or first)
+# object on the current page, so getting a page far into the list is as
+# cheap as getting the first one.
+def _list_column_expression(formclass, fieldname):
+    # Get the expression to sort and filter on for a column in the list, or
+    # None if it's not a column that can be handled in the database.
+    if fieldname in formclass.list_column_expressions:
+        return F(formclass.list_column_expressions[fieldname])
+    if fieldname in formclass.queryset_extra_fields:
+        return RawSQL(formclass.queryset_extra_fields[fieldname], [], output_field=TextField())
+    try:
+        field = formclass.Meta.model._meta.get_field(fieldname)
+    except FieldDoesNotExist:
+        return None
+    if field.is_relation:
+        return None
+    return F(fieldname)
+
+
+def _list_column_is_text(formclass, fieldname):
+    if fieldname in formclass.list_column_expressions or fieldname in formclass.queryset_extra_fields:
+        return True
+    try:
+        return isinstance(formclass.Meta.model._meta.get_field(fieldname), (CharField, TextField))
+    except FieldDoesNotExist:
+        return False
+
+
+def _list_column_is_searchable(formclass, fieldname):
+    if _list_column_is_text(formclass, fieldname):
+        return True
+    try:
+        return isinstance(formclass.Meta.model._meta.get_field(fieldname), JSONField)
+    except FieldDoesNotExist:
+        return False
+
+
+def _list_column_filter(formclass, objects, fieldname, value):
+    # Filter the objects on the value chosen in the filter for a column,
+    # which is the value as it's displayed in the list.
+    expr = _list_column_expression(formclass, fieldname)
+    if expr is None:
+        if value == '<Empty>':
+            return objects.filter(**{'{}__isnull'.format(fieldname): True})
+        elif value == '<Any>':
+            return objects.filter(**{'{}__isnull'.format(fieldname): False})
+        # Match the related objects used in the list on how they are displayed
+        field = formclass.Meta.model._meta.get_field(fieldname)
+        related = field.related_model.objects.filter(pk__in=objects.values(fieldname))
+        return objects.filter(**{'{}__in'.format(fieldname): [o.pk for o in related if str(o) == value]})
+
+    key = '_filt_{}'.format(fieldname)
+    objects = objects.annotate(**{key: expr})
+    empty = Q(**{'{}__isnull'.format(key): True})
+    if _list_column_is_text(formclass, fieldname):
+        empty |= Q(**{key: ''})
+    if value == '<Empty>':
+        return objects.filter(empty)
+    elif value == '<Any>':
+        return objects.exclude(empty)
+
+    try:
+        field = formclass.Meta.model._meta.get_field(fieldname)
+        if isinstance(field, BooleanField):
+            value = (value == 'true')
+        elif not field.is_relation:
+            value = field.to_python(value)
+    except FieldDoesNotExist:
+        pass
+    except ValidationError:
+        return objects.none()
+    return objects.filter(**{key: value})
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder truncates times to milliseconds, but the cursor has
+    # to match the stored values exactly or rows get skipped or repeated.
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def _list_keyset_filter(sortkeys, values, pk, forward):
+    # Get a Q object matching everything that sorts after (or before, if not
+    # forward) the row with the given values of the sort keys. NULLs sort
+    # last in ascending order and first in descending order, and the primary
+    # key is always the last sort key, ascending.
+    if not sortkeys:
+        return Q(pk__gt=pk) if forward else Q(pk__lt=pk)
+
+    (key, desc) = sortkeys[0]
+    v = values[0]
+    if desc != forward:
+        # Continuing in ascending order, where NULLs are last
+        if v is None:
+            after = Q(pk__in=[])
+        else:
+            after = Q(**{'{}__gt'.format(key): v}) | Q(**{'{}__isnull'.format(key): True})
+    else:
+        # Continuing in descending order, where NULLs are first
+        if v is None:
+            after = Q(**{'{}__isnull'.format(key): False})
+        else:
+            after = Q(**{'{}__lt'.format(key): v})
+    if v is None:
+        equal = Q(**{'{}__isnull'.format(key): True})
+    else:
+        equal = Q(**{key: v})
+    return after | (equal & _list_keyset_filter(sortkeys[1:], values[1:], pk, forward))
+
+
+def _backend_list_page(request, formclass, objects, conference):
+    headers = [formclass.get_field_verbose_name(f) for f in formclass.list_fields]
+    filtercolumns = formclass.get_column_filters(conference)
+    query = request.GET.copy()
+    for k in ('after', 'before'):
+        query.pop(k, None)
+
+    def _url(**kwargs):
+        q = query.copy()
+        for k, v in kwargs.items():
+            q.pop(k, None)
+            if v is not None:
+                q[k] = v
+        return '?{}'.format(q.urlencode())
+
+    # Column filters and free text search
+    filters = {}
+    for i, f in enumerate(formclass.list_fields):
+        v = request.GET.get('f{}'.format(i), '')
+        if v and headers[i] in filtercolumns:
+            filters[headers[i]] = v
+            objects = _list_column_filter(formclass, objects, f, v)
+
+    search = request.GET.get('search', '')
+    if search:
+        q = Q()
+        for f in formclass.list_fields:
+            expr = _list_column_expression(formclass, f)
+            if expr is not None and _list_column_is_searchable(formclass, f):
+                objects = objects.annotate(**{'_search_{}'.format(f): Cast(expr, TextField())})
+                q |= Q(**{'_search_{}__icontains'.format(f): search})
+        objects = objects.filter(q)
+
+    # Sorting, either on the column picked or the default sort of the form
+    sortable = [i for i, f in enumerate(formclass.list_fields) if _list_column_expression(formclass, f) is not None and 'nosort' not in formclass.coltypes.get(headers[i], [])]
+    try:
+        sortcol = int(request.GET.get('sort', ''))
+        if sortcol not in sortable:
+            raise ValueError()
+        sort = [(sortcol, request.GET.get('dir', 'asc') == 'desc')]
+    except ValueError:
+        sortcol = None
+        sort = [(formclass.list_fields.index(f), d == 'desc') for f, d in formclass.defaultsort]
+        sort = [(i, d) for i, d in sort if i in sortable]
+
+    sortkeys = []
+    ordering = []
+    for n, (i, desc) in enumerate(sort):
+        key = '_sort{}'.format(n)
+        objects = objects.annotate(**{key: _list_column_expression(formclass, formclass.list_fields[i])})
+        sortkeys.append((key, desc))
+        ordering.append(F(key).desc(nulls_first=True) if desc else F(key).asc(nulls_last=True))
+
+    total = objects.count()
+
+    # Pick the page, by continuing after the last row or before the first
+    # row of the page the user came from.
+    forward = True
+    for k in ('after', 'before'):
+        if k in request.GET:
+            try:
+                cursor = json.loads(request.GET[k])
+                # Turn the values back into the types of the sort keys
+                values = [objects.query.annotations[key].output_field.to_python(v) if v is not None else None for (key, desc), v in zip(sortkeys, cursor[:-1])]
+                objects = objects.filter(_list_keyset_filter(sortkeys, values, cursor[-1], k == 'after'))
+                forward = (k == 'after')
+            except (ValueError, TypeError, IndexError, ValidationError):
+                raise Http404()
+
+    if forward:
+        objects = objects.order_by(*ordering, 'pk')
+    else:
+        objects = objects.order_by(*[o.copy().reverse_ordering() for o in ordering], '-pk')
+
+    page = list(objects[:formclass.list_pagesize + 1])
+    more = len(page) > formclass.list_pagesize
+    page = page[:formclass.list_pagesize]
+    if not forward:
+        page.reverse()
+
+    def _cursor(o):
+        return json.dumps([getattr(o, k) for k, d in sortkeys] + [o.pk], cls=_CursorEncoder)
+
+    return page, {
+        'total': total,
+        'search': search,
+        'filters': filters,
+        'sortlinks': {
+            h: _url(sort=str(i), dir='desc' if i == sortcol and not sort[0][1] else 'asc') for i, h in enumerate(headers) if i in sortable
+        },
+        'sortheader': headers[sort[0][0]] if sortcol is not None else None,
+        'sortdesc': sort[0][1] if sortcol is not None else False,
+        'firsturl': _url() if 'after' in request.GET or 'before' in request.GET else None,
+        'prevurl': _url(before=_cursor(page[0])) if page and (('before' in request.GET and more) or 'after' in request.GET) else None,
+        'nexturl': _url(after=_cursor(page[-1])) if page and (more or 'before' in request.GET) else None,
+    }
+
+
 def backend_list_editor(request, urlname, formclass, resturl, allow_new=True, allow_delete=True, allow_save=True, conference=None, breadcrumbs=[], bypass_conference_filter=False, instancemaker=None, return_url='../', topadmin=None, object_queryset=None):
     if not conference and not bypass_conference_filter:
         conference = get_authenticated_conference(request, urlname)
@@ -281,8 +502,23 @@ def backend_list_editor(request, urlname, formclass, resturl, allow_new=True, al
                     # Empty -> None
                     setval = None
 
+                idlist = request.POST.get('idlist').split(',')
+                if what in formclass.bulk_assignable_columns:
+                    # Nothing to validate per object, so update all of them in one go.
+                    # Fields that would be set automatically on save() have to be set
+                    # explicitly, since update() bypasses save().
+                    if isinstance(formclass.Meta.model._meta.get_field(what), BooleanField):
+                        setval = bool(setval)
+                    updates = {what: setval}
+                    for f in formclass.Meta.model._meta.concrete_fields:
+                        if getattr(f, 'auto_now', False):
+                            updates[f.name] = timezone.now()
+                    with transaction.atomic():
+                        formclass.Meta.model.objects.filter(pk__in=objects.filter(id__in=idlist).values('pk')).update(**updates)
+                    return HttpResponseRedirect('.')
+
                 with transaction.atomic():
-                    for obj in objects.filter(id__in=request.POST.get('idlist').split(',')):
+                    for obj in objects.filter(id__in=idlist):
                         try:
                             if isinstance(getattr(obj, what), bool):
                                 # Special-case booleans, they can only be set to true or false, and clearfing
@@ -303,6 +539,11 @@ def backend_list_editor(request, urlname, formclass, resturl, allow_new=True, al
             else:
                 raise Http404()
 
+        if formclass.list_server_side:
+            (objects, serverside) = _backend_list_page(request, formclass, objects, conference)
+        else:
+            serverside = None
+
         cache = {}
         values = [{
             'id': o.pk,
@@ -327,6 +568,8 @@ def backend_list_editor(request, urlname, formclass, resturl, allow_new=True, al
             'allow_copy_previous': formclass.allow_copy_previous,
             'allow_email': formclass.allow_email,
             'assignable_columns': formclass.get_assignable_columns(conference),
+            'serverside': serverside,
+            'selectedfilters': serverside['filters'] if serverside else {},
             'breadcrumbs': breadcrumbs,
             'helplink': formclass.helplink,
         })
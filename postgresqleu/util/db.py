@@ -1,14 +1,20 @@
-from django.db import connection
+from django.db import connection, transaction
 from django.conf import settings
 import collections
+import contextlib
+import itertools
 
 from psycopg2.extras import register_default_jsonb
 from psycopg2.tz import LocalTimezone
 
 
-def get_native_cursor():
-    # Unwrap djangos many layers to get a raw psyopg2 cursor
-    curs = connection.cursor().cursor.connection.cursor()
+_cursor_counter = itertools.count()
+
+
+def get_native_cursor(named=False):
+    # Unwrap djangos many layers to get a raw psyopg2 cursor. A named cursor
+    # is a server side cursor, which can only be used inside a transaction.
+    curs = connection.cursor().cursor.connection.cursor('pgeu_cursor_{}'.format(next(_cursor_counter)) if named else None)
     register_default_jsonb(curs, globally=False)
     return curs
 
@@ -33,8 +39,8 @@ def exec_to_single_list(query, params=None):
 def exec_to_dict(query, params=None):
     curs = get_native_cursor()
     curs.execute(query, params)
-    columns = [col[0] for col in curs.description]
-    return [dict(list(zip(columns, row)))for row in curs.fetchall()]
+    columns = tuple(col[0] for col in curs.description)
+    return [dict(zip(columns, row)) for row in curs.fetchall()]
 
 
 def exec_to_scalar(query, params=None):
@@ -57,8 +63,8 @@ def conditional_exec_to_scalar(condition, query, params=None):
 def exec_to_keyed_dict(query, params=None):
     curs = get_native_cursor()
     curs.execute(query, params)
-    columns = [col[0] for col in curs.description]
-    return {r[columns[0]]: r for r in (dict(list(zip(columns, row)))for row in curs.fetchall())}
+    columns = tuple(col[0] for col in curs.description)
+    return {r[columns[0]]: r for r in (dict(zip(columns, row)) for row in curs.fetchall())}
 
 
 def exec_to_keyed_scalar(query, params=None):
@@ -70,7 +76,7 @@ def exec_to_keyed_scalar(query, params=None):
 def exec_to_grouped_dict(query, params=None):
     curs = get_native_cursor()
     curs.execute(query, params)
-    columns = [col[0] for col in curs.description[1:]]
+    columns = tuple(col[0] for col in curs.description[1:])
     full = collections.OrderedDict()
     last = None
     curr = []
@@ -80,12 +86,64 @@ def exec_to_grouped_dict(query, params=None):
                 full[last] = curr
             curr = []
             last = row[0]
-        curr.append(dict(list(zip(columns, row[1:]))))
+        curr.append(dict(zip(columns, row[1:])))
     if last:
         full[last] = curr
     return full
 
 
+#
+# Iterator variants of the above, that fetch the rows from a server side
+# cursor itersize rows at a time instead of loading the full result into
+# memory. These can only be iterated over once, so use them for large
+# results that are just looped over (reports, exports etc).
+#
+# Server side cursors only exist inside a transaction, so if we're not
+# already in one, a transaction is held open until the iteration is done.
+# Any settings that affect the output (such as ensure_conference_timezone)
+# must remain in effect until then as well, since the rows are converted
+# as they are fetched.
+#
+def _exec_to_row_iterator(query, params, itersize):
+    with contextlib.ExitStack() as stack:
+        if not connection.in_atomic_block:
+            stack.enter_context(transaction.atomic())
+        curs = get_native_cursor(named=True)
+        stack.callback(curs.close)
+        curs.itersize = itersize
+        curs.execute(query, params)
+        columns = None
+        for row in curs:
+            if columns is None:
+                # Named cursors have no description until the first fetch
+                columns = tuple(col[0] for col in curs.description)
+            yield columns, row
+
+
+def exec_to_dict_iterator(query, params=None, itersize=2000):
+    for columns, row in _exec_to_row_iterator(query, params, itersize):
+        yield dict(zip(columns, row))
+
+
+def exec_to_grouped_dict_iterator(query, params=None, itersize=2000):
+    # Yields tuples of (group, rows), with the same grouping on the first
+    # column as exec_to_grouped_dict. Only one group is kept in memory.
+    columns = None
+    last = None
+    curr = []
+    for allcolumns, row in _exec_to_row_iterator(query, params, itersize):
+        if columns is None:
+            columns = allcolumns[1:]
+        if last != row[0]:
+            if curr:
+                yield last, curr
+            curr = []
+            last = row[0]
+        curr.append(dict(zip(columns, row[1:])))
+    if curr:
+        yield last, curr
+
+
 class ensure_conference_timezone():
     """
     This context handler will set the timezone *in PostgreSQL* to the one from the
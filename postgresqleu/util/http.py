@@ -0,0 +1,217 @@
+# Shared HTTP client used for talking to payment providers and messaging
+# services.
+#
+# Each integration gets a requests session that lives for the lifetime of
+# the process, so connections are kept alive and reused between API calls
+# instead of doing a new TCP and TLS handshake for every call. Requests
+# that are rate limited or fail with a server error are retried with
+# exponential backoff and jitter, and the time spent on requests can be
+# collected per integration.
+
+from django.utils import timezone
+
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+import email.utils
+import hashlib
+import logging
+import os
+import random
+import threading
+import time
+import urllib.parse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+log = logging.getLogger(__name__)
+
+# Status codes that indicate that the request may succeed if retried
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# Methods that are safe to retry after the request has been sent. Other
+# methods are only retried when the server explicitly tells us it did not
+# process the request (rate limiting), or when the caller says the request
+# is safe to repeat.
+IDEMPOTENT_METHODS = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE')
+
+# Timeout used for requests that don't specify their own
+DEFAULT_TIMEOUT = 30
+
+
+class HttpMetrics(object):
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.totaltime = 0.0
+        self.maxtime = 0.0
+
+    @property
+    def avgtime(self):
+        return self.totaltime / self.requests if self.requests else 0.0
+
+    def __str__(self):
+        return "{} requests, {} errors, {} retries, average {:.3f}s, max {:.3f}s".format(
+            self.requests,
+            self.errors,
+            self.retries,
+            self.avgtime,
+            self.maxtime,
+        )
+
+
+_collector = threading.local()
+
+
+# Collect metrics for all requests made by the current thread inside the
+# block, as a dict of integration name -> HttpMetrics.
+@contextmanager
+def collect_http_metrics():
+    metrics = defaultdict(HttpMetrics)
+    previous = getattr(_collector, 'metrics', None)
+    _collector.metrics = metrics
+    try:
+        yield metrics
+    finally:
+        _collector.metrics = previous
+
+
+def format_http_metrics(metrics):
+    return "\n".join("{}: {}".format(k, v) for k, v in sorted(metrics.items()))
+
+
+# URLs can contain credentials (such as the Telegram bot token), so only
+# the scheme and host are ever logged.
+def _loggable_url(url):
+    u = urllib.parse.urlsplit(url)
+    return "{}://{}".format(u.scheme, u.hostname)
+
+
+def _parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(int(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max((email.utils.parsedate_to_datetime(value) - timezone.now()).total_seconds(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class IntegrationSession(requests.Session):
+    def __init__(self, integration, retries=3, backoff=0.5, maxbackoff=30, poolsize=4):
+        super().__init__()
+        self.integration = integration
+        self.retries = retries
+        self.backoff = backoff
+        self.maxbackoff = maxbackoff
+
+        # Connections are pooled per host by the adapter
+        adapter = HTTPAdapter(pool_connections=poolsize, pool_maxsize=poolsize)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+
+    def _record(self, elapsed, error=False, retry=False):
+        metrics = getattr(_collector, 'metrics', None)
+        if metrics is None:
+            return
+        m = metrics[self.integration]
+        m.requests += 1
+        m.totaltime += elapsed
+        m.maxtime = max(m.maxtime, elapsed)
+        if error:
+            m.errors += 1
+        if retry:
+            m.retries += 1
+
+    def _delay(self, attempt, retryafter=None):
+        # Exponential backoff with full jitter, unless the server told us
+        # how long to wait.
+        if retryafter is not None:
+            return retryafter
+        return random.uniform(0, min(self.maxbackoff, self.backoff * 2 ** attempt))
+
+    def request(self, method, url, *args, idempotent=None, **kwargs):
+        kwargs.setdefault('timeout', DEFAULT_TIMEOUT)
+
+        if idempotent is None:
+            idempotent = method.upper() in IDEMPOTENT_METHODS
+        # Uploaded files are consumed by the first attempt, so can't be resent
+        canresend = not kwargs.get('files', None)
+
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            try:
+                r = super().request(method, url, *args, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                # If we never managed to connect, nothing was sent and it's always
+                # safe to try again.
+                retry = canresend and attempt < self.retries and (idempotent or isinstance(e, requests.exceptions.ConnectTimeout))
+                self._record(time.monotonic() - start, error=True, retry=retry)
+                if not retry:
+                    raise
+                delay = self._delay(attempt)
+                # The exception text includes the full URL, so only log its type
+                log.warning("{} request to {} failed: {}. Retrying in {:.1f} seconds.".format(self.integration, _loggable_url(url), type(e).__name__, delay))
+            else:
+                retry = canresend and attempt < self.retries and r.status_code in RETRY_STATUS_CODES and (idempotent or r.status_code == 429)
+                if retry:
+                    delay = self._delay(attempt, _parse_retry_after(r.headers.get('Retry-After', None)))
+                    if delay > self.maxbackoff:
+                        # Don't block for ages, let the caller deal with it
+                        retry = False
+                self._record(time.monotonic() - start, error=r.status_code >= 500, retry=retry)
+                log.debug("{} {} {} returned {} in {:.3f} seconds".format(self.integration, method, _loggable_url(url), r.status_code, time.monotonic() - start))
+                if not retry:
+                    return r
+                r.close()
+                log.warning("{} request to {} returned status {}. Retrying in {:.1f} seconds.".format(self.integration, _loggable_url(url), r.status_code, delay))
+
+            attempt += 1
+            time.sleep(delay)
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+# Get the session for an integration. Integrations that keep per-account
+# state (such as authentication headers) in the session should pass an
+# identifier for the account as key, so each account gets its own session.
+def get_http_session(integration, key=None, **kwargs):
+    # Sessions are never shared with a forked process, since the pooled
+    # connections would then be used by both processes.
+    k = (os.getpid(), integration, key)
+    with _sessions_lock:
+        if k not in _sessions:
+            _sessions[k] = IntegrationSession(integration, **kwargs)
+        return _sessions[k]
+
+
+_tokens = {}
+_tokens_lock = threading.Lock()
+
+
+# Cache an access token (such as an OAuth client credentials token) for
+# reuse until shortly before it expires. The credentials are part of the
+# cache key, so changing them results in a new token being fetched.
+# fetchfunc is called to get a new token, and should return a tuple of
+# the token (which can be any object) and its lifetime in seconds.
+def get_cached_token(integration, credentials, fetchfunc, margin=timedelta(minutes=2)):
+    k = (integration, hashlib.sha256(repr(credentials).encode('utf8')).hexdigest())
+    with _tokens_lock:
+        if k in _tokens and _tokens[k][1] > timezone.now():
+            return _tokens[k][0]
+
+    token, lifetime = fetchfunc()
+    lifetime = timedelta(seconds=lifetime)
+    with _tokens_lock:
+        # Stop using the token a little before it expires, but always use
+        # at least half of the lifetime of short lived tokens.
+        _tokens[k] = (token, timezone.now() + lifetime - min(margin, lifetime / 2))
+    return token
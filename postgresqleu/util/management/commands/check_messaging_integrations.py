@@ -22,6 +22,7 @@ class Command(BaseCommand):
     help = 'Validate messaging integrations and refresh tokens'
 
     class ScheduledJob:
+        exclusive_group = 'messaging'
         scheduled_times = [datetime.time(4, 19)]
         default_notify_on_success = True
 
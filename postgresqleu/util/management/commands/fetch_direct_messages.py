@@ -19,6 +19,7 @@ class Command(BaseCommand):
     help = 'Fetch direct messages'
 
     class ScheduledJob:
+        exclusive_group = 'messaging'
         # Normally this integreates with webhooks, so we run the catchup
         # part separately and infrequently.
         scheduled_interval = timedelta(minutes=15)
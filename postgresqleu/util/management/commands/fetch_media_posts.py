@@ -20,6 +20,7 @@ class Command(BaseCommand):
     help = 'Fetch from social media'
 
     class ScheduledJob:
+        exclusive_group = 'messaging'
         scheduled_interval = timedelta(minutes=15)
 
         @classmethod
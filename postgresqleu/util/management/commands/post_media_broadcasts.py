@@ -19,6 +19,7 @@ class Command(BaseCommand):
     help = 'Post to social media'
 
     class ScheduledJob:
+        exclusive_group = 'messaging'
         scheduled_interval = timedelta(minutes=5)
 
         @classmethod
@@ -19,6 +19,7 @@ class Command(BaseCommand):
     help = 'Send pending notifications'
 
     class ScheduledJob:
+        parallel = True
         scheduled_interval = timedelta(minutes=10)
 
         @classmethod
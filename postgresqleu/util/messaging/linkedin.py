@@ -7,11 +7,11 @@ from django.utils import timezone
 
 from datetime import datetime, timedelta
 import re
-import requests
 import requests_oauthlib
 import time
 
 from postgresqleu.util.forms import SubmitButtonField
+from postgresqleu.util.http import get_http_session
 from postgresqleu.util.oauthapps import get_oauth_client, get_oauth_secret
 from postgresqleu.util.time import datetime_string
 from postgresqleu.util.widgets import StaticTextWidget
@@ -136,7 +136,7 @@ class Linkedin(object):
     @property
     def sess(self):
         if self._sess is None:
-            self._sess = requests.Session()
+            self._sess = get_http_session('linkedin', self.providerid)
             self._sess.headers.update({
                 'Authorization': 'Bearer {}'.format(self.providerconfig['token']),
                 'LinkedIn-Version': '202405',
@@ -241,7 +241,7 @@ class Linkedin(object):
         raise Exception("Not implemented")
 
     def refresh_access_token(self):
-        r = requests.post('https://www.linkedin.com/oauth/v2/accessToken', data={
+        r = get_http_session('linkedin').post('https://www.linkedin.com/oauth/v2/accessToken', data={
             'grant_type': 'refresh_token',
             'refresh_token': self.providerconfig['refresh_token'],
             'client_id': get_oauth_client('https://api.linkedin.com'),
@@ -5,11 +5,11 @@ from django.utils.html import strip_tags
 
 import re
 import requests_oauthlib
-import requests
 import dateutil.parser
 
 from postgresqleu.util.widgets import StaticTextWidget
 from postgresqleu.util.forms import LinkForCodeField
+from postgresqleu.util.http import get_http_session
 from postgresqleu.util.oauthapps import get_oauth_client, get_oauth_secret
 from postgresqleu.util.models import OAuthApplication
 from postgresqleu.util.messaging import re_token
@@ -155,7 +155,7 @@ class Mastodon(object):
 
     def _get(self, url, *args, **kwargs):
         ratelimiter.limit(self.providerconfig['baseurl'])
-        return requests.get(
+        return get_http_session('mastodon').get(
             self._api_url(url),
             timeout=30,
             headers=self.authheaders,
@@ -165,7 +165,7 @@ class Mastodon(object):
 
     def _post(self, url, *args, **kwargs):
         ratelimiter.limit(self.providerconfig['baseurl'])
-        return requests.post(
+        return get_http_session('mastodon').post(
             self._api_url(url),
             timeout=30,
             headers=self.authheaders,
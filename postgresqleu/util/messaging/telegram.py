@@ -10,11 +10,11 @@ import base64
 import io
 import json
 import re
-import requests
 from datetime import datetime
 
 from postgresqleu.util.random import generate_random_token
 from postgresqleu.util.forms import SubmitButtonField
+from postgresqleu.util.http import get_http_session
 from postgresqleu.util.widgets import StaticTextWidget
 from postgresqleu.util.messaging import re_token
 from postgresqleu.util.messaging.util import notify_twitter_moderation
@@ -179,7 +179,7 @@ class Telegram(object):
         return _disable_channel
 
     def get(self, method, params={}):
-        r = requests.get(
+        r = get_http_session('telegram').get(
             'https://api.telegram.org/bot{}/{}'.format(self.providerconfig['telegramtoken'], method),
             params=params,
             timeout=10
@@ -191,7 +191,7 @@ class Telegram(object):
         return j['result']
 
     def post(self, method, params={}, ignoreerrors=False, files=None):
-        r = requests.post(
+        r = get_http_session('telegram').post(
             'https://api.telegram.org/bot{}/{}'.format(self.providerconfig['telegramtoken'], method),
             data=params,
             files=files,
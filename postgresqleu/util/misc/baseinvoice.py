@@ -9,16 +9,47 @@ from reportlab.lib.styles import ParagraphStyle
 from reportlab.lib.utils import ImageReader
 from reportlab.platypus import Paragraph
 from reportlab.platypus.tables import Table, TableStyle
-from reportlab.platypus.flowables import Image
-from reportlab.pdfbase.pdfmetrics import registerFont, getFont
-from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfbase.pdfmetrics import getFont, stringWidth
 from io import BytesIO
+import functools
 
 from django.utils import timezone
 from django.conf import settings
 
 from postgresqleu.util.currency import format_currency
-from postgresqleu.util.reporttools import cm
+from postgresqleu.util.reporttools import cm, register_fonts
+
+
+# Measurements and images that are the same for every PDF rendered in this
+# process, so they are only calculated or loaded once.
+@functools.lru_cache(maxsize=2000)
+def _trimstring(s, maxlen, fontname, fontsize):
+    # Remove two characters at a time from the end of the string until it
+    # fits, but never go below 5 characters. Since the width of a prefix
+    # never decreases as it gets longer, find the longest one that fits with
+    # a binary search instead of measuring every step.
+    if len(s) <= 5 or stringWidth(s, fontname, fontsize) <= maxlen:
+        return s
+    # Number of steps of two characters that can be removed
+    lo, hi = 1, (len(s) - 4) // 2
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if stringWidth(s[:len(s) - 2 * mid], fontname, fontsize) <= maxlen:
+            hi = mid
+        else:
+            lo = mid + 1
+    return s[:len(s) - 2 * lo]
+
+
+@functools.lru_cache(maxsize=100)
+def _fontheight(fontname, size):
+    face = getFont(fontname).face
+    return face.ascent * size / 1000.0 - face.descent * size / 1000.0
+
+
+@functools.lru_cache(maxsize=10)
+def _logo(filename):
+    return ImageReader(filename)
 
 
 class PDFBase(object):
@@ -39,19 +70,13 @@ class PDFBase(object):
         self.canvas.setAuthor(settings.ORG_NAME)
         self.canvas._doc.info.producer = "{0} Invoicing System".format(settings.ORG_NAME)
 
-        for font, fontfile in settings.REGISTER_FONTS:
-            registerFont(TTFont(font, fontfile))
+        register_fonts(settings.REGISTER_FONTS)
 
     def trimstring(self, s, maxlen, fontname, fontsize):
-        while len(s) > 5:
-            if self.canvas.stringWidth(s, fontname, fontsize) <= maxlen:
-                return s
-            s = s[:len(s) - 2]
-        return s
+        return _trimstring(s, maxlen, fontname, fontsize)
 
     def fontheight(self, fontname, size):
-        face = getFont(fontname).face
-        return face.ascent * size / 1000.0 - face.descent * size / 1000.0
+        return _fontheight(fontname, size)
 
     def textlines(self, t, lines):
         for line in lines.splitlines():
@@ -78,9 +103,20 @@ class PDFBase(object):
             self.canvas.drawText(t)
             self.canvas.rotate(-45)
 
+        # The parts of the header that are the same on every page are drawn
+        # once into a form, which is then reused on all following pages.
+        if not self.canvas.hasForm('header'):
+            self.canvas.beginForm('header')
+            self.draw_static_header()
+            self.canvas.endForm()
+        self.canvas.doForm('header')
+
+        self._draw_multiline_aligned("To:\n%s" % self.recipient,
+                                     cm(11), cm(23.5), cm(9), cm(4))
+
+    def draw_static_header(self):
         if self.logo:
-            im = Image(self.logo, width=cm(3), height=cm(3))
-            im.drawOn(self.canvas, cm(2), cm(25))
+            self.canvas.drawImage(_logo(self.logo), cm(2), cm(25), cm(3), cm(3), mask='auto')
 
         if self.headertext:
             t = self.canvas.beginText()
@@ -94,9 +130,6 @@ class PDFBase(object):
             self._draw_multiline_aligned(self.sendertext,
                                          cm(2), cm(23.5), cm(9), cm(4))
 
-        self._draw_multiline_aligned("To:\n%s" % self.recipient,
-                                     cm(11), cm(23.5), cm(9), cm(4))
-
         p = self.canvas.beginPath()
         p.moveTo(cm(2), cm(18.9))
         p.lineTo(cm(19), cm(18.9))
@@ -79,6 +79,10 @@ def nagios(request):
     if exec_to_scalar("SELECT EXISTS (SELECT 1 FROM confreg_conferencetweetqueue tq WHERE datetime < now() - '10 minutes'::interval AND approved AND NOT sent)"):
         errors.append('Unsent social media broadcasts are present in the outbound queue')
 
+    # Check that payment notifications are being processed
+    if exec_to_scalar("SELECT EXISTS (SELECT 1 FROM invoices_incomingpaymentnotification WHERE processedat IS NULL AND (nextattemptat IS NULL OR receivedat < now() - '30 minutes'::interval))"):
+        errors.append('Unprocessed payment notifications are present in the queue')
+
     # Check for email addresses not configured
     errors.extend(check_all_emails(['DEFAULT_EMAIL', 'INVOICE_SENDER_EMAIL', 'INVOICE_NOTIFICATION_RECEIVER', 'SCHEDULED_JOBS_EMAIL', 'SCHEDULED_JOBS_EMAIL_SENDER', 'INVOICE_NOTIFICATION_RECEIVER', 'TREASURER_EMAIL', 'SERVER_EMAIL']))
 
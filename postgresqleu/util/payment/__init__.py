@@ -17,6 +17,12 @@ class BasePayment(object):
     def upload_tooltip(self):
         return ''
 
+    # Payment methods that queue notifications with queue_payment_notification()
+    # implement process_queued_notification(payload), returning True if the
+    # notification was handled, or False if it should be retried. Methods that
+    # don't manage their own transactions when doing so should set
+    # atomic_queued_notifications = True.
+
 
 payment_implementations = [
     'postgresqleu.util.payment.dummy.DummyPayment',
@@ -11,8 +11,8 @@ from postgresqleu.invoices.models import Invoice, InvoicePaymentMethod
 from postgresqleu.invoices.util import diff_workdays
 from postgresqleu.invoices.backendforms import BackendInvoicePaymentMethodForm
 from postgresqleu.accounting.util import get_account_choices
-from postgresqleu.adyen.models import TransactionStatus
-from postgresqleu.adyen.util import AdyenAPI
+from postgresqleu.adyen.models import TransactionStatus, RawNotification
+from postgresqleu.adyen.util import AdyenAPI, process_raw_adyen_notification
 
 from . import BasePayment
 
@@ -210,6 +210,9 @@ class _AdyenBase(BasePayment):
         # up as an exception.
         return True
 
+    def process_queued_notification(self, payload):
+        return process_raw_adyen_notification(RawNotification.objects.get(pk=payload['raw']), payload['post'])
+
 
 class AdyenCreditcard(_AdyenBase):
     backend_form_class = BackendAdyenCreditCardForm
@@ -12,10 +12,9 @@ import time
 from postgresqleu.util.widgets import StaticTextWidget, MonospaceTextarea
 from postgresqleu.util.forms import SubmitButtonField
 from postgresqleu.util.payment.banktransfer import BaseManagedBankPayment
+from postgresqleu.util.http import get_http_session
 from postgresqleu.util.payment.banktransfer import BaseManagedBankPaymentForm
 
-import requests
-
 
 class BackendGocardlessForm(BaseManagedBankPaymentForm):
     description = forms.CharField(required=True, widget=MonospaceTextarea,
@@ -81,7 +80,7 @@ class Gocardless(BaseManagedBankPayment):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.session = requests.sessions.Session()
+        self.session = get_http_session('gocardless', self.method.id)
         self.session.headers.update({
             'Authorization': 'Bearer {}'.format(self._get_access_token()),
         })
@@ -102,7 +101,7 @@ class Gocardless(BaseManagedBankPayment):
                 # Access token expires in the next 120 seconds, then we try to refresh it it,
                 # if we have a refresh token valid at least 4 hours (otherwise not much point)
                 if self.method.config.get('refresh_token_expires_at', 0) > time.time() + (4 * 60 * 60):
-                    r = requests.post('https://bankaccountdata.gocardless.com/api/v2/token/refresh/', json={
+                    r = get_http_session('gocardless').post('https://bankaccountdata.gocardless.com/api/v2/token/refresh/', json={
                         'refresh': self.method.config['refresh_token'],
                     }, timeout=10)
                     if r.status_code == 200:
@@ -123,7 +122,7 @@ class Gocardless(BaseManagedBankPayment):
             else:
                 return self.method.config['access_token']
         # Request a new access token
-        r = requests.post('https://bankaccountdata.gocardless.com/api/v2/token/new/', json={
+        r = get_http_session('gocardless').post('https://bankaccountdata.gocardless.com/api/v2/token/new/', json={
             'secret_id': self.method.config['secretid'],
             'secret_key': self.method.config['secretkey'],
         }, timeout=10)
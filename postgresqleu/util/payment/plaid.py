@@ -10,10 +10,9 @@ from postgresqleu.util.widgets import StaticTextWidget, MonospaceTextarea
 from postgresqleu.util.forms import SubmitButtonField
 from postgresqleu.util.payment.banktransfer import BaseManagedBankPayment
 from postgresqleu.util.payment.banktransfer import BaseManagedBankPaymentForm
+from postgresqleu.util.http import get_http_session
 from postgresqleu.mailqueue.util import send_simple_mail
 
-import requests
-
 
 class BackendPlaidForm(BaseManagedBankPaymentForm):
     description = forms.CharField(required=True, widget=MonospaceTextarea,
@@ -87,7 +86,7 @@ class Plaid(BaseManagedBankPayment):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.session = requests.sessions.Session()
+        self.session = get_http_session('plaid', self.method.id)
         self.session.headers.update({
             'PLAID-CLIENT-ID': self.method.config.get('clientid', ''),
             'PLAID-SECRET': self.method.config.get('secret', ''),
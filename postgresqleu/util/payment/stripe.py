@@ -7,6 +7,7 @@ from postgresqleu.invoices.backendforms import BackendInvoicePaymentMethodForm
 from postgresqleu.accounting.util import get_account_choices
 from postgresqleu.stripepayment.models import StripeCheckout
 from postgresqleu.stripepayment.api import StripeApi
+from postgresqleu.stripepayment.util import process_stripe_event
 
 from . import BasePayment
 
@@ -94,3 +95,10 @@ Mastercard, VISA and American Express.
         refund.payment_reference = api.refund_transaction(co, refund.fullamount, refund.id)
 
         return True
+
+    # Refunds are flagged as completed before they are processed, so that
+    # has to be rolled back if processing fails.
+    atomic_queued_notifications = True
+
+    def process_queued_notification(self, payload):
+        return process_stripe_event(self.method, payload)
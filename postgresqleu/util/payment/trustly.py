@@ -8,7 +8,7 @@ from postgresqleu.util.forms import CharToArrayField
 from postgresqleu.util.widgets import MonospaceTextarea
 from postgresqleu.util.crypto import validate_pem_public_key, validate_pem_private_key
 
-from postgresqleu.trustlypayment.models import TrustlyTransaction, TrustlyLog
+from postgresqleu.trustlypayment.models import TrustlyTransaction, TrustlyLog, TrustlyRawNotification
 
 from postgresqleu.trustlypayment.util import Trustly
 from postgresqleu.trustlypayment.api import TrustlyException
@@ -127,6 +127,10 @@ Pay directly using online banking. Currently supported with most banks in {0}.
 
         return True
 
+    def process_queued_notification(self, payload):
+        (ok, uuid, method) = Trustly(self).process_raw_trustly_notification(TrustlyRawNotification.objects.get(pk=payload['raw']))
+        return ok
+
     def used_method_details(self, invoice):
         # Bank transfers don't need any extra information
         return "Trustly"
@@ -1,4 +1,6 @@
 from reportlab.lib import units
+from reportlab.pdfbase.pdfmetrics import registerFont
+from reportlab.pdfbase.ttfonts import TTFont
 
 
 def cm(n):
@@ -7,3 +9,17 @@ def cm(n):
 
 def mm(n):
     return n * units.mm
+
+
+# Fonts that have been registered with reportlab in this process. Loading
+# a TrueType font means parsing the whole font file, which is by far the
+# most expensive part of rendering a simple PDF, and registered fonts are
+# global in reportlab, so each font only needs to be loaded once.
+_registered_fonts = set()
+
+
+def register_fonts(fonts):
+    for font, fontfile in fonts:
+        if (font, fontfile) not in _registered_fonts:
+            registerFont(TTFont(font, fontfile))
+            _registered_fonts.add((font, fontfile))
@@ -1,4 +1,8 @@
 from django.http import Http404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from Cryptodome.Hash import SHA256
 
 
 def get_int_or_error(reqmap, paramname, default=None, allow_negative=False):
@@ -18,3 +22,20 @@ def get_int_or_error(reqmap, paramname, default=None, allow_negative=False):
         raise Http404("Parameter {} is not an integer".format(paramname))
 
     return int(p) * negative
+
+
+def conditional_response(request, etagparts, lastmodified, renderfunc):
+    # Generate a response for content identified by etagparts (anything
+    # that can be repr():ed) and last modified at lastmodified (or None),
+    # returning a 304 without calling renderfunc to generate the actual
+    # response if the client already has it.
+    etag = '"{}"'.format(SHA256.new(repr(etagparts).encode('utf8')).hexdigest())
+    lastmodified = lastmodified and int(lastmodified.timestamp())
+
+    r = get_conditional_response(request, etag=etag, last_modified=lastmodified)
+    if r is None:
+        r = renderfunc()
+    r['ETag'] = etag
+    if lastmodified:
+        r['Last-Modified'] = http_date(lastmodified)
+    return r
@@ -0,0 +1,59 @@
+from django.test import TestCase, RequestFactory
+from django.contrib.auth.models import User
+from django.http import QueryDict
+from django.utils import timezone
+
+import datetime
+
+from postgresqleu.confreg.models import Conference, ConferenceSeries
+from postgresqleu.confreg.models import ConferenceTweetQueue
+from postgresqleu.confreg.backendforms import BackendTweetQueueForm
+from postgresqleu.util.backendviews import _backend_list_page
+
+
+class SmallPageTweetQueueForm(BackendTweetQueueForm):
+    list_pagesize = 2
+
+
+class BackendListPagingTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user('author', 'author@example.com', 'author')
+        series = ConferenceSeries.objects.create(name='Test series')
+        cls.conference = Conference.objects.create(
+            conferencename='Test conference',
+            urlname='testconf',
+            series=series,
+            startdate=datetime.date(2030, 1, 1),
+            enddate=datetime.date(2030, 1, 2),
+        )
+        # All posts are within the same millisecond
+        base = timezone.now().replace(microsecond=123000)
+        cls.posts = [
+            ConferenceTweetQueue.objects.create(conference=cls.conference, author=author, contents='Post {}'.format(i), datetime=base + datetime.timedelta(microseconds=i))
+            for i in range(7)
+        ]
+
+    def _page(self, query):
+        request = RequestFactory().get('/', query)
+        page, ctx = _backend_list_page(request, SmallPageTweetQueueForm, ConferenceTweetQueue.objects.filter(conference=self.conference), self.conference)
+        return [p.id for p in page], ctx
+
+    def test_paging_below_millisecond(self):
+        # Default sort is newest first
+        expected = [p.id for p in reversed(self.posts)]
+
+        pages = []
+        ids, ctx = self._page({})
+        pages.append(ids)
+        while ctx['nexturl']:
+            ids, ctx = self._page(QueryDict(ctx['nexturl'][1:]))
+            pages.append(ids)
+        self.assertEqual([i for p in pages for i in p], expected)
+
+        # And back again from the last page
+        backpages = [pages[-1]]
+        while ctx['prevurl']:
+            ids, ctx = self._page(QueryDict(ctx['prevurl'][1:]))
+            backpages.insert(0, ids)
+        self.assertEqual(backpages, pages)
@@ -7,7 +7,6 @@ import argparse
 import sys
 import os
 import os.path
-import filecmp
 import shutil
 import json
 import random
@@ -17,8 +16,11 @@ import io
 import subprocess
 import tarfile
 import copy
+import hashlib
+import multiprocessing
 
 import jinja2
+import jinja2.meta
 import jinja2.sandbox
 
 import markdown
@@ -130,10 +132,8 @@ class SourceWrapper(object):
             return os.listdir(os.path.join(self.root, d))
         return []
 
-    def copy_if_changed(self, relsource, fulldest):
-        fullsrc = os.path.join(self.root, relsource)
-        if (not os.path.exists(fulldest)) or (not filecmp.cmp(fullsrc, fulldest)):
-            shutil.copy2(fullsrc, fulldest)
+    def copy_if_changed(self, relsource, tracker):
+        tracker.copy_file(relsource, os.path.join(self.root, relsource))
 
     def readfile(self, src):
         if os.path.isfile(os.path.join(self.root, src)):
@@ -143,51 +143,156 @@ class SourceWrapper(object):
             return None
 
 
-# Wrap operations on a tarfile
+# Wrap operations on a tarfile. The tarfile is read as a stream, in one pass.
+# Templates are kept in memory since they are needed for rendering, but
+# static files are written straight to the destination as they are read.
 class TarWrapper(object):
-    def __init__(self, tarstream):
-        self.tardata = io.BytesIO()
-        shutil.copyfileobj(tarstream, self.tardata)
-        self.tardata.seek(0)
-        self.tarfile = tarfile.open(fileobj=self.tardata)
-
-        self.tarstruct = {}
-        for m in self.tarfile.getmembers():
-            self.tarstruct[m.name] = m
+    def __init__(self, tarstream, tracker):
+        self.dirs = set()
+        self.files = {}
+        self.streamed = set()
+
+        with tarfile.open(fileobj=tarstream, mode='r|') as tf:
+            for m in tf:
+                if m.isdir():
+                    self.dirs.add(m.name)
+                    continue
+                if not m.isfile():
+                    continue
+                self.dirs.update(_get_all_parent_directories([m.name]))
+                if m.name.startswith('static/'):
+                    tracker.write_stream(m.name, tf.extractfile(m), m.size)
+                    self.streamed.add(m.name)
+                elif m.name.startswith('templates/'):
+                    self.files[m.name] = tf.extractfile(m).read()
 
     def isdir(self, d):
-        return d in self.tarstruct and self.tarstruct[d].isdir()
+        return d in self.dirs
 
     def isfile(self, f):
-        return f in self.tarstruct and self.tarstruct[f].isfile()
+        return f in self.files or f in self.streamed
 
     def readfile(self, src):
-        if src in self.tarstruct and self.tarstruct[src].isfile():
-            return self.tarfile.extractfile(src).read()
-        else:
-            return None
+        return self.files.get(src, None)
 
     def walkfiles(self, d):
-        for k in self.tarstruct.keys():
-            if k.startswith(d + '/') and self.tarstruct[k].isfile():
+        for k in list(self.files.keys()) + list(self.streamed):
+            if k.startswith(d + '/'):
                 yield (os.path.dirname(k), os.path.basename(k))
 
     def listfiles(self, d):
-        for k in self.tarstruct.keys():
+        for k in list(self.files.keys()) + list(self.streamed):
             if os.path.dirname(k) == d:
                 yield os.path.basename(k)
 
-    def copy_if_changed(self, relsource, fulldest):
-        sourcedata = self.readfile(relsource)
-
-        if os.path.isfile(fulldest):
-            with open(fulldest, 'rb') as f:
-                x = f.read()
-                if x == sourcedata:
-                    return
-
-        with open(fulldest, 'wb') as f:
-            f.write(sourcedata)
+    def copy_if_changed(self, relsource, tracker):
+        if relsource in self.streamed:
+            # Already written while reading the tarfile
+            return
+        data = self.files[relsource]
+        tracker.write_stream(relsource, io.BytesIO(data), len(data))
+
+
+def _hash_file(f):
+    h = hashlib.sha256()
+    while True:
+        b = f.read(COPY_CHUNK_SIZE)
+        if not b:
+            return h.hexdigest()
+        h.update(b)
+
+
+# Keep track of the files copied to the destination directory, with their
+# size, modification time and a hash of the contents, in the deployment
+# manifest. That way a file that has not been touched since the last run can
+# be recognized without reading it, and for local sources the source file
+# doesn't need to be read either unless it has been touched.
+class FileTracker(object):
+    def __init__(self, destpath, files):
+        self.destpath = destpath
+        self.files = files
+        self.newfiles = {}
+
+    def _get_current(self, relname):
+        # Get the recorded entry for a destination file, if the file still
+        # matches it. If we have no (matching) entry, hash the file as it is.
+        fulldest = os.path.join(self.destpath, relname)
+        try:
+            st = os.stat(fulldest)
+        except FileNotFoundError:
+            return None
+        rec = self.files.get(relname, None)
+        if rec and rec[0] == st.st_size and rec[1] == st.st_mtime_ns:
+            return rec
+        with open(fulldest, 'rb') as f:
+            return [st.st_size, st.st_mtime_ns, _hash_file(f), None]
+
+    def _record(self, relname, filehash, sourcekey):
+        st = os.stat(os.path.join(self.destpath, relname))
+        self.newfiles[relname] = [st.st_size, st.st_mtime_ns, filehash, sourcekey]
+
+    def copy_file(self, relname, fullsrc):
+        fulldest = os.path.join(self.destpath, relname)
+        st = os.stat(fullsrc)
+        sourcekey = [st.st_ino, st.st_size, st.st_mtime_ns]
+
+        rec = self._get_current(relname)
+        if rec and rec[3] == sourcekey:
+            # Neither the source nor the destination has been touched
+            self.newfiles[relname] = rec
+            return
+
+        with open(fullsrc, 'rb') as f:
+            filehash = _hash_file(f)
+        if not (rec and rec[2] == filehash):
+            os.makedirs(os.path.dirname(fulldest), exist_ok=True)
+            if os.path.exists(fulldest) and os.path.samefile(fullsrc, fulldest):
+                # Already hardlinked by a previous run
+                pass
+            else:
+                # Hardlink the file if the destination is on the same filesystem,
+                # otherwise copy it (which uses sendfile() where available).
+                tmpname = fulldest + TMP_SUFFIX
+                try:
+                    os.link(fullsrc, tmpname)
+                except OSError:
+                    shutil.copy2(fullsrc, tmpname)
+                os.replace(tmpname, fulldest)
+        self._record(relname, filehash, sourcekey)
+
+    def write_stream(self, relname, stream, size):
+        fulldest = os.path.join(self.destpath, relname)
+        rec = self._get_current(relname)
+
+        if size <= COPY_CHUNK_SIZE:
+            # Small enough to just compare in memory
+            data = stream.read()
+            filehash = hashlib.sha256(data).hexdigest()
+            if rec and rec[2] == filehash:
+                self.newfiles[relname] = rec
+                return
+            os.makedirs(os.path.dirname(fulldest), exist_ok=True)
+            with open(fulldest + TMP_SUFFIX, 'wb') as f:
+                f.write(data)
+        else:
+            # Stream to a temporary file, and only replace the destination
+            # file if the contents turned out to be different.
+            os.makedirs(os.path.dirname(fulldest), exist_ok=True)
+            h = hashlib.sha256()
+            with open(fulldest + TMP_SUFFIX, 'wb') as f:
+                while True:
+                    b = stream.read(COPY_CHUNK_SIZE)
+                    if not b:
+                        break
+                    h.update(b)
+                    f.write(b)
+            filehash = h.hexdigest()
+            if rec and rec[2] == filehash:
+                os.unlink(fulldest + TMP_SUFFIX)
+                self.newfiles[relname] = rec
+                return
+        os.replace(fulldest + TMP_SUFFIX, fulldest)
+        self._record(relname, filehash, None)
 
 
 class JinjaTarLoader(jinja2.BaseLoader):
@@ -253,6 +358,11 @@ def find_git_revision(path):
     return None
 
 
+MANIFEST_FILE = '.deploystatic_manifest'
+TMP_SUFFIX = '.deploystatic-tmp'
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
 # Actual deployment function
 def deploy_template(env, template, destfile, context):
     t = env.get_template(template)
@@ -272,7 +382,133 @@ def deploy_template(env, template, destfile, context):
         f.write(s)
 
 
-def _deploy_static(source, destpath):
+# Render a number of pages, in a pool of worker processes if more than one
+# job is allowed. The workers are forked so they inherit the jinja environment
+# and context, which can't be passed to them any other way.
+_worker_env = None
+_worker_context = None
+
+
+def _deploy_page(page):
+    (template, destfile, pagename) = page
+    context = dict(_worker_context)
+    context['page'] = pagename
+    try:
+        deploy_template(_worker_env, template, destfile, context)
+    except SystemExit:
+        # deploy_template has already printed the error
+        return False
+    return True
+
+
+def deploy_pages(env, context, pages, jobs):
+    global _worker_env, _worker_context
+    _worker_env = env
+    _worker_context = context
+
+    if jobs > 1 and len(pages) > 1 and 'fork' in multiprocessing.get_all_start_methods():
+        with multiprocessing.get_context('fork').Pool(min(jobs, len(pages))) as pool:
+            results = pool.map(_deploy_page, pages, chunksize=1)
+    else:
+        results = [_deploy_page(p) for p in pages]
+
+    if not all(results):
+        sys.exit(1)
+
+
+# Track which templates each page depends on, through extends, include and
+# import, and which context variables any of those templates use. A page only
+# has to be rendered again if one of these has changed since the last run.
+class TemplateDependencies(object):
+    def __init__(self, env):
+        self.env = env
+        self.templates = {}
+
+    def _parse(self, name):
+        if name not in self.templates:
+            try:
+                source = self.env.loader.get_source(self.env, name)[0]
+                ast = self.env.parse(source)
+                self.templates[name] = (
+                    hashlib.sha256(source.encode('utf8')).hexdigest(),
+                    list(jinja2.meta.find_referenced_templates(ast)),
+                    jinja2.meta.find_undeclared_variables(ast),
+                )
+            except jinja2.TemplateNotFound:
+                self.templates[name] = ('', [], set())
+            except jinja2.exceptions.TemplateSyntaxError:
+                # Let the rendering report the error
+                self.templates[name] = None
+        return self.templates[name]
+
+    # Get a hash of everything that's used to render the template, or None
+    # if that can't be determined, in which case it always has to be rendered.
+    def inputhash(self, name, context):
+        templates = {}
+        variables = set()
+        todo = [name]
+        while todo:
+            t = todo.pop()
+            if t in templates:
+                continue
+            parsed = self._parse(t)
+            if parsed is None:
+                return None
+            (h, refs, v) = parsed
+            if None in refs:
+                # Dynamic reference to another template, that we can't follow
+                return None
+            templates[t] = h
+            variables.update(v)
+            todo.extend(refs)
+
+        try:
+            return hashlib.sha256(json.dumps({
+                'templates': templates,
+                'context': {k: context[k] for k in variables if k in context},
+            }, sort_keys=True, default=str).encode('utf8')).hexdigest()
+        except TypeError:
+            return None
+
+
+def _get_manifest_version():
+    # Anything rendered by a different version of this script, which may
+    # have different filters, is considered changed.
+    with open(os.path.abspath(__file__), 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_manifest(destpath):
+    try:
+        with open(os.path.join(destpath, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        if isinstance(manifest, dict):
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {}
+
+
+# Get the rendered pages from the manifest, if they were rendered by this
+# version of the script.
+def get_manifest_pages(manifest):
+    if manifest.get('version', None) == _get_manifest_version():
+        return manifest.get('pages', {})
+    return {}
+
+
+def save_manifest(destpath, files, pages=None):
+    fn = os.path.join(destpath, MANIFEST_FILE)
+    with open(fn + TMP_SUFFIX, 'w') as f:
+        json.dump({
+            'version': _get_manifest_version(),
+            'files': files,
+            'pages': pages or {},
+        }, f)
+    os.replace(fn + TMP_SUFFIX, fn)
+
+
+def _deploy_static(source, destpath, tracker):
     knownfiles = []
     # We could use copytree(), but we need to know which files are there so we can
     # remove old files, so we might as well do the full processing this way.
@@ -281,7 +517,7 @@ def _deploy_static(source, destpath):
             os.makedirs(os.path.join(destpath, relpath))
 
         relsource = os.path.join(relpath, relname)
-        source.copy_if_changed(relsource, os.path.join(destpath, relsource))
+        source.copy_if_changed(relsource, tracker)
 
         knownfiles.append(relsource)
     return knownfiles
@@ -324,6 +560,8 @@ if __name__ == "__main__":
     parser.add_argument('destpath', type=str, help='Destination absolute path (contents will be erased!)')
     parser.add_argument('--branch', type=str, help='Deploy directly from branch')
     parser.add_argument('--templates', action='store_true', help='Deploy templates (except pages) and static instead of pages')
+    parser.add_argument('--incremental', action='store_true', help='Only render pages whose templates or context changed since the last incremental run')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Number of pages to render in parallel')
 
     args = parser.parse_args()
 
@@ -346,12 +584,18 @@ if __name__ == "__main__":
         print("Destination directory seems to be version controlled!")
         sys.exit(1)
 
+    manifest = load_manifest(args.destpath)
+    tracker = FileTracker(args.destpath, manifest.get('files', {}))
+
     if args.branch:
         s = subprocess.Popen(['/usr/bin/git', 'archive', '--format=tar', args.branch],
                              stdout=subprocess.PIPE,
                              cwd=args.sourcepath)
-        source = TarWrapper(s.stdout)
+        source = TarWrapper(s.stdout, tracker)
         s.stdout.close()
+        if s.wait() != 0:
+            print("Failed to read branch {0}".format(args.branch))
+            sys.exit(1)
         s = subprocess.Popen(['/usr/bin/git', 'rev-parse', '--short', args.branch],
                              stdout=subprocess.PIPE,
                              cwd=args.sourcepath)
@@ -378,11 +622,14 @@ if __name__ == "__main__":
                 os.makedirs(os.path.join(args.destpath, relpath))
 
             relsource = os.path.join(relpath, relname)
-            source.copy_if_changed(relsource, os.path.join(args.destpath, relsource))
+            source.copy_if_changed(relsource, tracker)
 
             knownfiles.append(relsource)
 
-        knownfiles.extend(_deploy_static(source, args.destpath))
+        knownfiles.extend(_deploy_static(source, args.destpath, tracker))
+
+        save_manifest(args.destpath, tracker.newfiles)
+        knownfiles.append(MANIFEST_FILE)
 
         remove_unknown(knownfiles, args.destpath)
 
@@ -419,7 +666,10 @@ if __name__ == "__main__":
                 deep_update_context(context, load_context(source.readfile(os.path.join('templates/context.override.d', f)), os.path.splitext(f)[1][1:]))
 
     knownfiles = []
-    knownfiles = _deploy_static(source, args.destpath)
+    knownfiles = _deploy_static(source, args.destpath, tracker)
+
+    # Collect the pages to render, as (template, destination, page)
+    pages = []
 
     # If we have a .deploystaticmap, parse that one instead of the full list of
     # parsing everything.
@@ -429,10 +679,9 @@ if __name__ == "__main__":
             (src, dest) = line.decode('utf8').split(':')
             if not os.path.isdir(os.path.join(args.destpath, dest)):
                 os.makedirs(os.path.join(args.destpath, dest))
-            context['page'] = dest
-            deploy_template(env, os.path.join('pages', src),
-                            os.path.join(args.destpath, dest, 'index.html'),
-                            context)
+            pages.append((os.path.join('pages', src),
+                          os.path.join(args.destpath, dest, 'index.html'),
+                          dest))
             knownfiles.append(os.path.join(dest, 'index.html'))
     else:
         for relpath, fn in source.walkfiles('templates/pages'):
@@ -455,12 +704,31 @@ if __name__ == "__main__":
             if not os.path.isdir(os.path.join(args.destpath, destdir)):
                 os.makedirs(os.path.join(args.destpath, destdir))
 
-            context['page'] = destdir
-
-            deploy_template(env, os.path.join(relpath[len('templates/'):], fn),
-                            os.path.join(args.destpath, destdir, 'index.html'),
-                            context)
+            pages.append((os.path.join(relpath[len('templates/'):], fn),
+                          os.path.join(args.destpath, destdir, 'index.html'),
+                          destdir))
 
             knownfiles.append(os.path.join(destdir, 'index.html'))
 
+    if args.incremental:
+        # Skip the pages where nothing they use has changed since the last
+        # run, and the output is still there.
+        previous = get_manifest_pages(manifest)
+        deps = TemplateDependencies(env)
+        hashes = {}
+        changedpages = []
+        for template, destfile, page in pages:
+            h = deps.inputhash(template, dict(context, page=page))
+            if h:
+                hashes[page] = h
+            if h is None or previous.get(page, None) != h or not os.path.isfile(destfile):
+                changedpages.append((template, destfile, page))
+        deploy_pages(env, context, changedpages, args.jobs)
+    else:
+        deploy_pages(env, context, pages, args.jobs)
+        hashes = None
+
+    save_manifest(args.destpath, tracker.newfiles, hashes)
+    knownfiles.append(MANIFEST_FILE)
+
     remove_unknown(knownfiles, args.destpath)